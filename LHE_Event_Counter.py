@@ -1,4 +1,3 @@
-import tqdm
 import argparse
 import useful_funcs_and_constants
 import lhe_reader
@@ -8,11 +7,16 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
     parser.add_argument('filenames',nargs='+',
-                        help="The files you want to check")
+                        help="The files you want to check (.lhe, .lhe.gz, .lhe.xz or .lhe.zst)")
+    
+    parser.add_argument('-j', '--threads', type=int, default=8,
+                        help="The number of files counted at once")
+    
+    parser.add_argument('--trust-header', action="store_true",
+                        help="Use the number of events written in the header of a file (i.e. by MadGraph) instead of counting them when it is there")
     
     args = parser.parse_args()
     
-    for file in tqdm.tqdm(args.filenames, total=len(args.filenames)):
-        reader = lhe_reader.lhe_reader(file)
-        N_events = reader.num_events
-        useful_funcs_and_constants.print_msg_box("{:.2e}".format(N_events), title=file, width = len(file) + 3)
\ No newline at end of file
+    counts = lhe_reader.count_events_in_files(args.filenames, args.trust_header, args.threads)
+    for file, N_events in counts.items():
+        useful_funcs_and_constants.print_msg_box("{:.2e}".format(N_events), title=file, width = len(file) + 3)
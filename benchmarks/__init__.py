@@ -0,0 +1,3 @@
+from benchmarks.synthetic_lhe import generate_lhe_file, TOPOLOGIES
+from benchmarks.mela_standin import install as install_mela_standin
+from benchmarks.run_benchmarks import BENCHMARKS, run_benchmarks
@@ -0,0 +1,226 @@
+import sys
+import math
+import types
+
+
+class TLorentzVector(object):
+    def __init__(self, px=0., py=0., pz=0., e=0.):
+        """A pure-Python four-vector with the parts of ROOT.TLorentzVector that lhe2root uses
+
+        Parameters
+        ----------
+        px, py, pz, e : float, optional
+            The momentum and energy, by default 0
+        """
+        self.p4 = [float(px), float(py), float(pz), float(e)]
+
+    def Px(self): return self.p4[0]
+    def Py(self): return self.p4[1]
+    def Pz(self): return self.p4[2]
+    def E(self): return self.p4[3]
+
+    def Pt(self):
+        return math.hypot(self.p4[0], self.p4[1])
+
+    def P(self):
+        return math.sqrt(self.p4[0]**2 + self.p4[1]**2 + self.p4[2]**2)
+
+    def Phi(self):
+        return math.atan2(self.p4[1], self.p4[0]) if self.p4[0] or self.p4[1] else 0.
+
+    def Eta(self):
+        p = self.P()
+        costheta = self.p4[2]/p if p else 1.
+        if costheta*costheta < 1:
+            return -0.5*math.log((1 - costheta)/(1 + costheta))
+        if self.p4[2] == 0:
+            return 0.
+        return 1e10 if self.p4[2] > 0 else -1e10
+
+    def Rapidity(self):
+        return 0.5*math.log((self.p4[3] + self.p4[2])/(self.p4[3] - self.p4[2]))
+
+    def M2(self):
+        return self.p4[3]**2 - self.p4[0]**2 - self.p4[1]**2 - self.p4[2]**2
+
+    def M(self):
+        m2 = self.M2()
+        return math.sqrt(m2) if m2 >= 0 else -math.sqrt(-m2)
+
+    def SetPxPyPzE(self, px, py, pz, e):
+        self.p4 = [float(px), float(py), float(pz), float(e)]
+
+    def SetPtEtaPhiM(self, pt, eta, phi, m):
+        pt = abs(pt)
+        px, py, pz = pt*math.cos(phi), pt*math.sin(phi), pt*math.sinh(eta)
+        self.p4 = [px, py, pz, math.sqrt(px*px + py*py + pz*pz + m*m) if m >= 0 else math.sqrt(max(px*px + py*py + pz*pz - m*m, 0.))]
+
+    def DeltaPhi(self, other):
+        dphi = self.Phi() - other.Phi()
+        while dphi >= math.pi: dphi -= 2*math.pi
+        while dphi < -math.pi: dphi += 2*math.pi
+        return dphi
+
+    def DeltaR(self, other):
+        return math.hypot(self.Eta() - other.Eta(), self.DeltaPhi(other))
+
+    def __add__(self, other):
+        return TLorentzVector(*(a + b for a, b in zip(self.p4, other.p4)))
+
+    def __sub__(self, other):
+        return TLorentzVector(*(a - b for a, b in zip(self.p4, other.p4)))
+
+
+class SimpleParticle_t(object):
+    __slots__ = ("first", "second")
+
+    def __init__(self, particle, second=None):
+        """A particle as MELA sees it: first is the PDG id and second the TLorentzVector
+
+        Parameters
+        ----------
+        particle : Union[str, int]
+            An LHE particle line, or the id
+        second : TLorentzVector, optional
+            The momentum when particle is the id, by default None
+        """
+        if isinstance(particle, str):
+            fields = particle.split()
+            self.first = int(fields[0])
+            self.second = TLorentzVector(*(float(x) for x in fields[6:10]))
+        else:
+            self.first = int(particle)
+            self.second = second if second is not None else TLorentzVector()
+
+
+class SimpleParticleCollection_t(list):
+    def __init__(self, particles=None):
+        """A list of SimpleParticle_t, made from LHE particle lines like the one in mela.py
+
+        Parameters
+        ----------
+        particles : list[Union[str, SimpleParticle_t]], optional
+            The particles, by default no particles
+        """
+        super(SimpleParticleCollection_t, self).__init__(particle if isinstance(particle, SimpleParticle_t) else SimpleParticle_t(particle) for particle in particles or ())
+
+    def push_back(self, particle):
+        self.append(particle)
+
+    def pop_back(self):
+        self.pop()
+
+
+class TVar(object):
+    """The MELA enums that lhe2root uses, as distinct integers"""
+    #hypotheses
+    HSMHiggs, SelfDefine_spin0, H0minus, H0hplus = range(4)
+    #matrix elements
+    JHUGen, MCFM = range(100, 102)
+    #processes
+    ZZINDEPENDENT, ZZGG, JJVBF, Had_ZH, Had_WH, Lep_ZH, Lep_WH, JJQCD = range(200, 208)
+
+
+class Mela(object):
+    def __init__(self, *args, **kwargs):
+        """A lightweight stand-in for mela.Mela, so that lhe2root can run without JHUGenMELA.
+        Its cost per call is that of a little Python, so benchmarks with it measure the conversion around MELA.
+        The masses from computeDecayAngles and computeVHAngles are computed from the input event and every angle is 0.
+        The probabilities depend only on the couplings and the mass of the daughters, so that they are deterministic
+        """
+        self.couplings = {}
+        self.process = None
+        self.resetInputEvent()
+
+    def __setattr__(self, attr, value):
+        if attr.startswith("gh"): #the couplings, i.e. ghz1
+            self.couplings[attr] = value
+        else:
+            super(Mela, self).__setattr__(attr, value)
+
+    def __getattr__(self, attr):
+        if attr.startswith("gh"):
+            return self.couplings.get(attr, 0)
+        raise AttributeError(attr)
+
+    def setInputEvent(self, daughters, associated=None, mothers=None, isgen=False):
+        self.daughters = list(daughters)
+        self.associated = list(associated) if associated is not None else []
+        self.mothers = list(mothers) if mothers is not None else []
+        self.isgen = isgen
+
+    def resetInputEvent(self):
+        self.daughters, self.associated, self.mothers, self.isgen = [], [], [], False
+
+    def setProcess(self, hypothesis, matrixelement, production):
+        self.process = (hypothesis, matrixelement, production)
+        self.couplings.clear()
+
+    def _mass(self, particles):
+        return sum((particle.second for particle in particles), TLorentzVector()).M()
+
+    def computeP(self, useconstant=True):
+        mass = self._mass(self.daughters)
+        return (1 + sum(abs(value)**2 for value in self.couplings.values())) * mass / (mass*mass + 1)
+
+    def computeProdP(self, useconstant=True):
+        return self.computeP(useconstant) * (1 + len(self.associated))
+
+    def computeDecayAngles(self):
+        """M4L, MZ1, MZ2, costheta1, costheta2, Phi, costhetastar, Phi1"""
+        return (self._mass(self.daughters), self._mass(self.daughters[:2]), self._mass(self.daughters[2:4]), 0., 0., 0., 0., 0.)
+
+    def computeVHAngles(self, process):
+        """mV, mVstar, costheta1, costheta2, Phi, costhetastar, Phi1"""
+        return (self._mass(self.associated), self._mass(self.daughters + self.associated), 0., 0., 0., 0., 0.)
+
+    def computeVBFAngles(self):
+        """q2V1, q2V2, costheta1, costheta2, Phi, costhetastar, Phi1"""
+        return (0., 0., 0., 0., 0., 0., 0.)
+
+
+class MultiDimensionalCppArray(object):
+    """Only imported by lhe2root, which does not use it"""
+
+
+class SelfDParameter(object):
+    """Only imported by lhe2root, which does not use it"""
+
+
+class SelfDCoupling(object):
+    """Only imported by lhe2root, which does not use it"""
+
+
+def install(replace_ROOT=None):
+    """Makes `import mela` and `import pythonmelautils` (and `import ROOT`, if it is not installed) give the stand-ins.
+    This has to be called before lhefile or lhe2root is imported
+
+    Parameters
+    ----------
+    replace_ROOT : bool, optional
+        Whether to replace ROOT with a module that only has TLorentzVector, by default only if ROOT can't be imported
+
+    Returns
+    -------
+    bool
+        Whether ROOT was replaced, in which case lhe2root has to be run with --writer uproot or a --format other than root
+    """
+    mela = types.ModuleType("mela", "A pure-Python stand-in for JHUGenMELA's mela module (see benchmarks.mela_standin)")
+    mela.Mela, mela.TVar, mela.SimpleParticle_t, mela.SimpleParticleCollection_t = Mela, TVar, SimpleParticle_t, SimpleParticleCollection_t
+    sys.modules["mela"] = mela
+
+    pythonmelautils = types.ModuleType("pythonmelautils", "A stand-in for JHUGenMELA's pythonmelautils module (see benchmarks.mela_standin)")
+    pythonmelautils.MultiDimensionalCppArray, pythonmelautils.SelfDParameter, pythonmelautils.SelfDCoupling = MultiDimensionalCppArray, SelfDParameter, SelfDCoupling
+    sys.modules["pythonmelautils"] = pythonmelautils
+
+    if replace_ROOT is None:
+        try:
+            import ROOT
+            replace_ROOT = False
+        except ImportError:
+            replace_ROOT = True
+    if replace_ROOT:
+        ROOT = types.ModuleType("ROOT", "A stand-in for PyROOT with only TLorentzVector (see benchmarks.mela_standin)")
+        ROOT.TLorentzVector = TLorentzVector
+        sys.modules["ROOT"] = ROOT
+    return replace_ROOT
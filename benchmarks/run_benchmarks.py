@@ -0,0 +1,371 @@
+import os
+import sys
+import json
+import time
+import fnmatch
+import argparse
+import resource
+import tempfile
+import multiprocessing
+
+from benchmarks import mela_standin
+from benchmarks.synthetic_lhe import generate_lhe_file, TOPOLOGIES
+
+NWEIGHTS = {"Hwithdecay": 50} #the topologies that are written with reweighting weights (for --ggH4lMG)
+
+LHE2ROOT_MODES = { #the lhe2root modes that are benchmarked -> (the topology they convert, their lhe2root arguments)
+    "ggH4l": ("Prophecy", ["--ggH4l", "--merge_photon", "--calc_decayprob"]),
+    "ggH4lMG": ("Hwithdecay", ["--ggH4lMG"]),
+    "vbf": ("VBF", ["--vbf", "--calc_prodprob"]),
+    "zh": ("VH", ["--zh", "--calc_prodprob"]),
+    "zh_lep": ("VH", ["--zh_lep"]),
+    "zh_withdecay": ("VHHiggsdecay", ["--zh_withdecay", "--calc_decayprob"]),
+    "zh_lep_hawk": ("HAWK", ["--zh_lep_hawk", "--MELAcalc"]),
+}
+
+
+def lhe_filename(workdir, topology, nevents):
+    """The synthetic LHE file of a topology in the benchmark directory"""
+    return os.path.join(workdir, "{}_{}.lhe".format(topology, nevents))
+
+
+def generate_inputs(workdir, nevents, topologies=TOPOLOGIES):
+    """Writes the synthetic LHE files for the benchmarks, unless they are already there
+
+    Parameters
+    ----------
+    workdir : str
+        The directory the files are written to
+    nevents : int
+        The number of events in each file
+    topologies : list[str], optional
+        The topologies to write, by default every one in TOPOLOGIES
+    """
+    for topology in topologies:
+        filename = lhe_filename(workdir, topology, nevents)
+        if not os.path.exists(filename):
+            generate_lhe_file(filename + ".tmp", topology, nevents, nweights=NWEIGHTS.get(topology, 0))
+            os.replace(filename + ".tmp", filename)
+
+
+def _lhe2root(outputfile, inputfile, arguments, writer):
+    """Runs lhe2root.main, which sends stdout to /dev/null when it is not verbose"""
+    import lhe2root
+    if os.path.exists(outputfile):
+        os.remove(outputfile)
+    stdout = sys.stdout
+    try:
+        lhe2root.main([outputfile, inputfile, "--writer", writer] + arguments)
+    finally:
+        sys.stdout = stdout
+
+
+#Every benchmark is a function of (the benchmark directory, the number of events per file, the lhe2root --writer)
+#that prepares what it needs and returns a function that runs the benchmark once and returns the number of events it went through.
+#Only the returned function is timed
+
+def lhe_reader_index(workdir, nevents, writer):
+    import lhe_reader
+    filename = lhe_filename(workdir, "Hwithdecay", nevents)
+    def run():
+        with lhe_reader.lhe_reader(filename) as reader:
+            return len(reader.event_offsets)
+    return run
+
+
+def lhe_reader_events(workdir, nevents, writer):
+    import lhe_reader
+    filename = lhe_filename(workdir, "Hwithdecay", nevents)
+    def run():
+        with lhe_reader.lhe_reader(filename) as reader:
+            return sum(1 for _ in reader.all_events)
+    return run
+
+
+def lhe_reader_count(workdir, nevents, writer):
+    import lhe_reader
+    filename = lhe_filename(workdir, "Hwithdecay", nevents)
+    return lambda: lhe_reader.count_events(filename)
+
+
+def lhefile_iteration(topology):
+    def benchmark(workdir, nevents, writer):
+        import lhefile
+        filename = lhe_filename(workdir, topology, nevents)
+        lhefileclass = getattr(lhefile, TOPOLOGIES[topology][1])
+        def run():
+            with lhefileclass(filename, isgen=False) as f:
+                return sum(1 for _ in f)
+        return run
+    return benchmark
+
+
+def lhe2root_mode(mode):
+    def benchmark(workdir, nevents, writer):
+        topology, arguments = LHE2ROOT_MODES[mode]
+        inputfile = lhe_filename(workdir, topology, nevents)
+        outputfile = os.path.join(workdir, "{}_{}.root".format(mode, nevents))
+        def run():
+            _lhe2root(outputfile, inputfile, arguments, writer)
+            return nevents
+        return run
+    return benchmark
+
+
+def slice_first(workdir, nevents, writer):
+    import lhe_slicer
+    filename = lhe_filename(workdir, "Hwithdecay", nevents)
+    def run():
+        return lhe_slicer.slice_lhe_file(filename, os.path.join(workdir, "sliced.lhe"), nevents // 2) #only the first half is read
+    return run
+
+
+def slice_shuffled(workdir, nevents, writer):
+    import lhe_slicer
+    filename = lhe_filename(workdir, "Hwithdecay", nevents)
+    def run():
+        lhe_slicer.slice_lhe_file(filename, os.path.join(workdir, "sliced.lhe"), nevents // 2, shuffled=True, seed=0)
+        return nevents #every event is read to sample from
+    return run
+
+
+def _plot_input(workdir, nevents, writer):
+    """Converts the Prophecy sample once for the plotting benchmarks"""
+    outputfile = os.path.join(workdir, "plot_{}.root".format(nevents))
+    if not os.path.exists(outputfile):
+        _lhe2root(outputfile, lhe_filename(workdir, "Prophecy", nevents), ["--ggH4l", "--merge_photon"], writer)
+    return outputfile
+
+
+def plot_histogram(workdir, nevents, writer):
+    import lhe2root_methods
+    filename = _plot_input(workdir, nevents, writer)
+    lhe2root_methods.HISTOGRAMS.disk = None
+    def run():
+        lhe2root_methods.HISTOGRAMS.clear() #so that the file is read every time
+        lhe2root_methods.histogram_file(filename, "M4L", (100, 150), 100, {"MZ1": (40, 120)})
+        return nevents
+    return run
+
+
+def plot_one_quantity(workdir, nevents, writer):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import lhe2root_methods
+    filename = _plot_input(workdir, nevents, writer)
+    lhe2root_methods.HISTOGRAMS.disk = None
+    def run():
+        lhe2root_methods.HISTOGRAMS.clear()
+        lhe2root_methods.plot_one_quantity([filename], "M4L", (100, 150), 100)
+        plt.close("all")
+        return nevents
+    return run
+
+
+BENCHMARKS = { #the name of every benchmark -> the function that prepares it
+    "lhe_reader/index": lhe_reader_index,
+    "lhe_reader/events": lhe_reader_events,
+    "lhe_reader/count_events": lhe_reader_count,
+}
+BENCHMARKS.update(("lhefile/" + topology, lhefile_iteration(topology)) for topology in TOPOLOGIES)
+BENCHMARKS.update(("lhe2root/" + mode, lhe2root_mode(mode)) for mode in LHE2ROOT_MODES)
+BENCHMARKS.update({
+    "slice/first": slice_first,
+    "slice/shuffled": slice_shuffled,
+    "plot/histogram_file": plot_histogram,
+    "plot/plot_one_quantity": plot_one_quantity,
+})
+
+
+def _memory():
+    """The resident and peak resident memory of this process in MiB, from /proc on Linux and getrusage elsewhere"""
+    try:
+        with open("/proc/self/status") as f:
+            status = dict(line.split(":", 1) for line in f)
+        return int(status["VmRSS"].split()[0]) / 1024, int(status["VmHWM"].split()[0]) / 1024
+    except (OSError, KeyError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return peak, peak
+
+
+def _reset_peak_memory():
+    """Resets the peak resident memory of this process, if the kernel allows it"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _run_benchmark(name, workdir, nevents, repeat, writer, realmela):
+    """Runs one benchmark in a fresh process, so that its imports and memory don't affect the others
+
+    Returns
+    -------
+    dict
+        The events per iteration, the best time, the events per second, the peak resident memory
+        and how much it grew while the benchmark ran, in MiB
+    """
+    if not realmela:
+        mela_standin.install()
+    os.chdir(workdir) #i.e. plot_one_quantity saves its plot to the working directory
+    run = BENCHMARKS[name](workdir, nevents, writer)
+
+    seconds = []
+    for _ in range(repeat):
+        _reset_peak_memory()
+        before, _ = _memory()
+        start = time.perf_counter()
+        events = run()
+        seconds.append(time.perf_counter() - start)
+        _, peak = _memory()
+    best = min(seconds)
+    return {
+        "events": events,
+        "seconds": best,
+        "events_per_second": events / best if best else float("inf"),
+        "peak_rss_mib": peak,
+        "peak_increase_mib": max(peak - before, 0.),
+    }
+
+
+def run_benchmarks(names, workdir, nevents, repeat=3, writer="uproot", realmela=False):
+    """Runs benchmarks, each in its own process
+
+    Parameters
+    ----------
+    names : list[str]
+        The names of the benchmarks, from BENCHMARKS
+    workdir : str
+        The directory for the synthetic LHE files and the outputs
+    nevents : int
+        The number of events in each synthetic LHE file
+    repeat : int, optional
+        The number of times each benchmark is run, of which the fastest is kept, by default 3
+    writer : str, optional
+        The lhe2root --writer, by default uproot, which does not need PyROOT
+    realmela : bool, optional
+        Whether to use the installed JHUGenMELA (and ROOT) instead of the stand-ins in mela_standin, by default False
+
+    Returns
+    -------
+    dict
+        The results of every benchmark, keyed by name
+    """
+    topologies = set()
+    for name in names:
+        kind, _, which = name.partition("/")
+        if kind == "lhefile":
+            topologies.add(which)
+        elif kind == "lhe2root":
+            topologies.add(LHE2ROOT_MODES[which][0])
+        elif kind == "plot":
+            topologies.add("Prophecy")
+        else:
+            topologies.add("Hwithdecay")
+    generate_inputs(workdir, nevents, sorted(topologies))
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for name in names:
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(_run_benchmark, (name, workdir, nevents, repeat, writer, realmela))
+        print(format_result(name, results[name]), flush=True)
+    return results
+
+
+def format_result(name, result, width=32):
+    """One line of the benchmark table"""
+    return "{:<{}} {:>14.0f} {:>10.3f} {:>12.1f} {:>12.1f}".format(
+        name, width, result["events_per_second"], result["seconds"], result["peak_rss_mib"], result["peak_increase_mib"])
+
+
+def compare(results, baseline, tolerance):
+    """Finds the benchmarks that got slower than a baseline
+
+    Parameters
+    ----------
+    results : dict
+        The results from run_benchmarks
+    baseline : dict
+        Earlier results, i.e. read from the JSON written by --json
+    tolerance : float
+        The fraction of the baseline events per second that a benchmark is allowed to lose
+
+    Returns
+    -------
+    list[Tuple[str, float, float]]
+        The name, baseline events per second and current events per second of every benchmark that is slower by more than the tolerance
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, now = baseline[name]["events_per_second"], result["events_per_second"]
+        if now < (1 - tolerance) * before:
+            regressions.append((name, before, now))
+    return regressions
+
+
+def main(raw_args=None):
+    """Runs the benchmarks and prints a table of events per second and peak memory.
+    Unless --real-mela is given, MELA (and ROOT, if it is not installed) is replaced by the stand-ins in mela_standin,
+    so the numbers measure everything lhe2root does around MELA
+
+    Parameters
+    ----------
+    raw_args : list[str], optional
+        The command line arguments, by default sys.argv
+
+    Returns
+    -------
+    int
+        0, or 1 if a benchmark is slower than the --compare baseline
+    """
+    parser = argparse.ArgumentParser(description="Measures the throughput and peak memory of lhe2root on synthetic LHE files")
+    parser.add_argument("-k", "--select", nargs="+", default=["*"]) #glob patterns of the benchmarks to run, i.e. "lhe2root/*"
+    parser.add_argument("-n", "--nevents", type=int, default=5000) #the number of events in each synthetic LHE file
+    parser.add_argument("-r", "--repeat", type=int, default=3) #the number of times each benchmark is run, the fastest is reported
+    parser.add_argument("--workdir", default=None) #where the synthetic files are kept between runs, by default a temporary directory
+    parser.add_argument("--writer", choices=["root", "uproot"], default=None) #the lhe2root --writer, by default root with the real MELA and uproot otherwise
+    parser.add_argument("--real-mela", action="store_true") #use the installed JHUGenMELA and ROOT instead of the stand-ins
+    parser.add_argument("--json", default=None) #write the results to this file
+    parser.add_argument("--compare", default=None) #a JSON file from --json to compare the events per second to
+    parser.add_argument("--tolerance", type=float, default=0.2) #the fraction of the baseline events per second a benchmark can lose before it counts as a regression
+    parser.add_argument("--list", action="store_true") #list the benchmarks and exit
+    args = parser.parse_args(raw_args)
+
+    names = [name for name in BENCHMARKS if any(fnmatch.fnmatch(name, pattern) for pattern in args.select)]
+    if args.list:
+        print("\n".join(names))
+        return 0
+    if not names:
+        parser.error("No benchmarks match " + " ".join(args.select))
+    writer = args.writer or ("root" if args.real_mela else "uproot")
+
+    print("{:<32} {:>14} {:>10} {:>12} {:>12}".format("benchmark", "events/s", "best [s]", "peak [MiB]", "growth [MiB]"))
+    if args.workdir is not None:
+        os.makedirs(args.workdir, exist_ok=True)
+        results = run_benchmarks(names, os.path.abspath(args.workdir), args.nevents, args.repeat, writer, args.real_mela)
+    else:
+        with tempfile.TemporaryDirectory(prefix="lhe2root_benchmarks_") as workdir:
+            results = run_benchmarks(names, workdir, args.nevents, args.repeat, writer, args.real_mela)
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump({"nevents": args.nevents, "real_mela": args.real_mela, "results": results}, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for name, before, now in regressions:
+            print("{} is slower: {:.0f} events/s, was {:.0f}".format(name, now, before))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
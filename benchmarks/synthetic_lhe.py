@@ -0,0 +1,329 @@
+import math
+import random
+
+MH, MZ, MW, MT = 125., 91.1876, 80.379, 172.5
+LEPTONS = (11, 13)
+QUARKS = (1, 2, 3, 4, 5)
+
+HEADER = """<LesHouchesEvents version="3.0">
+<header>
+<!-- synthetic {topology} events for benchmarking lhe2root, seed {seed} -->
+<MGGenerationInfo>
+#  Number of Events        :       {nevents}
+</MGGenerationInfo>
+{initrwgt}</header>
+<init>
+2212 2212 6.500000e+03 6.500000e+03 0 0 0 0 3 1
+{crosssection:.6e} {uncertainty:.6e} 1.000000e+00 1
+</init>
+"""
+FOOTER = "</LesHouchesEvents>\n"
+
+
+def _boost(p4, beta):
+    """Boosts a (px, py, pz, E) four-vector by the velocity beta"""
+    bx, by, bz = beta
+    b2 = bx*bx + by*by + bz*bz
+    if b2 == 0:
+        return p4
+    gamma = 1/math.sqrt(1 - b2)
+    bp = bx*p4[0] + by*p4[1] + bz*p4[2]
+    factor = (gamma - 1)*bp/b2 + gamma*p4[3]
+    return (p4[0] + factor*bx, p4[1] + factor*by, p4[2] + factor*bz, gamma*(p4[3] + bp))
+
+
+def two_body_decay(parent, m1, m2, rng):
+    """Decays a four-vector isotropically into two particles of masses m1 and m2
+
+    Parameters
+    ----------
+    parent : tuple[float, float, float, float]
+        The (px, py, pz, E) of the decaying particle
+    m1 : float
+        The mass of the first daughter
+    m2 : float
+        The mass of the second daughter
+    rng : random.Random
+        The random number generator
+
+    Returns
+    -------
+    tuple[tuple, tuple]
+        The (px, py, pz, E) of the two daughters in the frame of the parent four-vector
+    """
+    M = math.sqrt(max(parent[3]**2 - parent[0]**2 - parent[1]**2 - parent[2]**2, 0.))
+    p = math.sqrt(max((M*M - (m1 + m2)**2)*(M*M - (m1 - m2)**2), 0.))/(2*M)
+    costheta = rng.uniform(-1, 1)
+    sintheta = math.sqrt(1 - costheta*costheta)
+    phi = rng.uniform(-math.pi, math.pi)
+    px, py, pz = p*sintheta*math.cos(phi), p*sintheta*math.sin(phi), p*costheta
+    beta = tuple(x/parent[3] for x in parent[:3])
+    return (_boost((px, py, pz, math.sqrt(p*p + m1*m1)), beta),
+            _boost((-px, -py, -pz, math.sqrt(p*p + m2*m2)), beta))
+
+
+def _resonance(rng, mass, width, maximum):
+    """A Breit-Wigner distributed mass, below maximum"""
+    while True:
+        m = mass + width/2*math.tan(rng.uniform(-math.pi/2, math.pi/2))
+        if 1 < m < maximum:
+            return m
+
+
+class _Event(object):
+    """The particles of one event as LHE lines, with 1-based mother indices"""
+
+    def __init__(self):
+        self.particles = []
+
+    def add(self, id, status, p4, mothers=(0, 0), mass=None):
+        if mass is None:
+            mass = math.sqrt(max(p4[3]**2 - p4[0]**2 - p4[1]**2 - p4[2]**2, 0.))
+        self.particles.append((id, status, mothers[0], mothers[1], p4, mass))
+        return len(self.particles)
+
+    def add_incoming(self, total, ids):
+        """Adds the two incoming partons that make a system of total (px, py, pz, E). The system is given no transverse momentum by the partons,
+        as is usual for LHE files that do not conserve it exactly"""
+        pplus, pminus = (total[3] + total[2])/2, (total[3] - total[2])/2
+        self.add(ids[0], -1, (0., 0., pplus, pplus), mass=0.)
+        self.add(ids[1], -1, (0., 0., -pminus, pminus), mass=0.)
+
+    def text(self, weight, weights=()):
+        lines = ["<event>", " {} 1 {:+.7e} 1.2500000E+02 7.8000000E-03 1.1800000E-01".format(len(self.particles), weight)]
+        for id, status, mother1, mother2, (px, py, pz, e), m in self.particles:
+            lines.append(" {:>8d} {:>4d} {:>4d} {:>4d} {:>4d} {:>4d} {:+.10e} {:+.10e} {:+.10e} {:.10e} {:.10e} 0. 9.".format(
+                id, status, mother1, mother2, 0, 0, px, py, pz, e, m))
+        if weights:
+            lines.append("<rwgt>")
+            lines += ["<wgt id='{}'> {:+.5e} </wgt>".format(id, value) for id, value in weights]
+            lines.append("</rwgt>")
+        lines.append("</event>")
+        return "\n".join(lines)
+
+
+def _higgs(rng, mass=MH):
+    """A Higgs four-vector with some transverse and longitudinal momentum"""
+    pt, phi, y = rng.expovariate(1/30.), rng.uniform(-math.pi, math.pi), rng.gauss(0, 1.5)
+    mt = math.sqrt(mass*mass + pt*pt)
+    return (pt*math.cos(phi), pt*math.sin(phi), mt*math.sinh(y), mt*math.cosh(y))
+
+
+def _decay_with_photon(z, rng):
+    """Decays a Z into two massless leptons, one of which radiates an FSR photon.
+    The radiating lepton is first made off shell by a fraction of the Z mass and then split into a lepton and the photon,
+    so the photon comes out at an angle to the lepton (sometimes closer to the other one) and the Z momentum is kept exactly
+
+    Returns
+    -------
+    tuple[list, tuple]
+        The (px, py, pz, E) of the two leptons and of the photon
+    """
+    mz = math.sqrt(max(z[3]**2 - z[0]**2 - z[1]**2 - z[2]**2, 0.))
+    mstar = rng.uniform(0.01, 0.2)*mz
+    n = rng.randrange(2)
+    leptons = list(two_body_decay(z, *((mstar, 0.) if n == 0 else (0., mstar)), rng=rng))
+    leptons[n], photon = two_body_decay(leptons[n], 0., 0., rng)
+    return leptons, photon
+
+
+def _decay_to_4l(event, rng, higgs, h, photons=False):
+    """Adds H -> Z Z -> 4 leptons to an event, and an FSR photon radiated by one of the leptons if photons is set"""
+    m1 = _resonance(rng, MZ, 2.5, MH - 12)
+    m2 = _resonance(rng, 30., 10., min(MH - m1 - 1, 60))
+    z1, z2 = two_body_decay(higgs, m1, m2, rng)
+    leptons = []
+    radiating = rng.randrange(2) if photons else -1 #the Z whose decay radiates the photon
+    for k, (z, lepton) in enumerate(((z1, rng.choice(LEPTONS)), (z2, rng.choice(LEPTONS)))):
+        iz = event.add(23, 2, z, (h, h))
+        if k == radiating:
+            p4s, photon = _decay_with_photon(z, rng)
+        else:
+            p4s = two_body_decay(z, 0., 0., rng)
+        for p4, id in zip(p4s, (lepton, -lepton)):
+            leptons.append((id, p4, iz))
+    for id, p4, iz in leptons:
+        event.add(id, 1, p4, (iz, iz), mass=0.)
+    if photons:
+        event.add(22, 1, photon, (h, h), mass=0.)
+
+
+def hwithdecay_event(rng):
+    """gg -> H -> Z Z -> 4 leptons, for LHEFile_Hwithdecay (i.e. MadGraph with --ggH4lMG)"""
+    event = _Event()
+    higgs = _higgs(rng)
+    event.add_incoming(higgs, (21, 21))
+    h = event.add(25, 2, higgs, (1, 2), mass=MH)
+    _decay_to_4l(event, rng, higgs, h)
+    return event
+
+
+def prophecy_event(rng):
+    """H -> Z Z -> 4 leptons with an FSR photon, for LHEFile_HwithdecayOnly (--ggH4l --merge_photon)"""
+    event = _Event()
+    higgs = _higgs(rng)
+    event.add_incoming(higgs, (21, 21))
+    h = event.add(25, 2, higgs, (1, 2), mass=MH)
+    _decay_to_4l(event, rng, higgs, h, photons=True)
+    return event
+
+
+def vbf_event(rng):
+    """q q -> q q H with a stable Higgs, for LHEFile_JHUGenVBFVH and LHEFile_StableHiggs (--vbf)"""
+    event = _Event()
+    higgs = _higgs(rng)
+    jets = []
+    for sign in (1, -1):
+        pt, phi, y = rng.expovariate(1/40.), rng.uniform(-math.pi, math.pi), sign*abs(rng.gauss(2.5, 1))
+        jets.append((pt*math.cos(phi), pt*math.sin(phi), pt*math.sinh(y), pt*math.cosh(y)))
+    total = tuple(sum(x) for x in zip(higgs, *jets))
+    ids = (rng.choice(QUARKS), rng.choice(QUARKS))
+    event.add_incoming(total, ids)
+    event.add(25, 1, higgs, (1, 2), mass=MH)
+    for id, jet in zip(ids, jets):
+        event.add(id, 1, jet, (1, 2), mass=0.)
+    return event
+
+
+def vh_event(rng):
+    """q qbar -> Z H with a stable Higgs and Z -> q qbar or leptons, for LHEFile_StableHiggsVH (--zh) and LHEFile_StableHiggs (--zh_lep)"""
+    event = _Event()
+    mz = _resonance(rng, MZ, 2.5, 200)
+    total = _higgs(rng, mass=MH + mz + rng.expovariate(1/100.))
+    higgs, z = two_body_decay(total, MH, mz, rng)
+    quark = rng.choice(QUARKS)
+    event.add_incoming(total, (quark, -quark))
+    iz = event.add(23, 2, z, (1, 2), mass=mz)
+    event.add(25, 1, higgs, (1, 2), mass=MH)
+    daughter = rng.choice(QUARKS) if rng.random() < 0.7 else rng.choice(LEPTONS)
+    for p4, id in zip(two_body_decay(z, 0., 0., rng), (daughter, -daughter)):
+        event.add(id, 1, p4, (iz, iz), mass=0.)
+    return event
+
+
+def vh_higgsdecay_event(rng):
+    """q qbar -> Z H with H -> Z Z -> 4 leptons and Z -> 2 leptons, for LHEFile_VHHiggsdecay (--zh_withdecay)"""
+    event = _Event()
+    mz = _resonance(rng, MZ, 2.5, 200)
+    total = _higgs(rng, mass=MH + mz + rng.expovariate(1/100.))
+    higgs, z = two_body_decay(total, MH, mz, rng)
+    quark = rng.choice(QUARKS)
+    event.add_incoming(total, (quark, -quark))
+    iz = event.add(23, 2, z, (1, 2), mass=mz)
+    h = event.add(25, 2, higgs, (1, 2), mass=MH)
+    lepton = rng.choice(LEPTONS)
+    for p4, id in zip(two_body_decay(z, 0., 0., rng), (lepton, -lepton)):
+        event.add(id, 1, p4, (iz, iz), mass=0.)
+    _decay_to_4l(event, rng, higgs, h)
+    return event
+
+
+def tth_event(rng):
+    """g g -> t tbar H with a stable Higgs and t -> b q qbar', for LHEFile_JHUGenttH"""
+    event = _Event()
+    higgs = _higgs(rng)
+    tops = []
+    for _ in range(2):
+        pt, phi, y = rng.expovariate(1/80.), rng.uniform(-math.pi, math.pi), rng.gauss(0, 1.2)
+        mt = math.sqrt(MT*MT + pt*pt)
+        tops.append((pt*math.cos(phi), pt*math.sin(phi), mt*math.sinh(y), mt*math.cosh(y)))
+    event.add_incoming(tuple(sum(x) for x in zip(higgs, *tops)), (21, 21))
+    event.add(25, 1, higgs, (1, 2), mass=MH)
+    for sign, top in zip((1, -1), tops):
+        it = event.add(sign*6, 2, top, (1, 2), mass=MT)
+        w, b = two_body_decay(top, MW, 4.7, rng)
+        iw = event.add(sign*24, 2, w, (it, it), mass=MW)
+        event.add(sign*5, 1, b, (it, it), mass=4.7)
+        for p4, id in zip(two_body_decay(w, 0., 0., rng), (sign*2, -sign*1)):
+            event.add(id, 1, p4, (iw, iw), mass=0.)
+    return event
+
+
+def offshell4l_event(rng):
+    """g g -> 4 leptons without an intermediate Higgs in the record, for LHEFile_Offshell4l"""
+    event = _Event()
+    total = _higgs(rng, mass=rng.uniform(180, 1000))
+    m1 = _resonance(rng, MZ, 2.5, 150)
+    m2 = _resonance(rng, MZ, 2.5, 150)
+    z1, z2 = two_body_decay(total, m1, m2, rng)
+    event.add_incoming(total, (21, 21))
+    for z in (z1, z2):
+        lepton = rng.choice(LEPTONS)
+        for p4, id in zip(two_body_decay(z, 0., 0., rng), (lepton, -lepton)):
+            event.add(id, 1, p4, (1, 2), mass=0.)
+    return event
+
+
+def hawk_event(rng):
+    """q qbar -> H l+ l- gamma with a stable Higgs, as from HAWK, for LHEFile_StableHiggsZHHAWK (--zh_lep_hawk)"""
+    event = _Event()
+    mz = _resonance(rng, MZ, 2.5, 200)
+    total = _higgs(rng, mass=MH + mz + rng.expovariate(1/100.))
+    higgs, z = two_body_decay(total, MH, mz, rng)
+    quark = rng.choice(QUARKS)
+    event.add_incoming(total, (quark, -quark))
+    event.add(25, 1, higgs, (1, 2), mass=MH)
+    lepton = rng.choice(LEPTONS)
+    leptons, photon = _decay_with_photon(z, rng)
+    for p4, id in zip(leptons, (lepton, -lepton)):
+        event.add(id, 1, p4, (1, 2), mass=0.)
+    event.add(22, 1, photon, (1, 2), mass=0.) #HAWK writes the photon last
+    return event
+
+
+TOPOLOGIES = { #the name of each topology -> (the function that makes an event, the lhefile class that reads it)
+    "Hwithdecay": (hwithdecay_event, "LHEFile_Hwithdecay"),
+    "Prophecy": (prophecy_event, "LHEFile_HwithdecayOnly"),
+    "VBF": (vbf_event, "LHEFile_JHUGenVBFVH"),
+    "VH": (vh_event, "LHEFile_StableHiggsVH"),
+    "VHHiggsdecay": (vh_higgsdecay_event, "LHEFile_VHHiggsdecay"),
+    "ttH": (tth_event, "LHEFile_JHUGenttH"),
+    "Offshell4l": (offshell4l_event, "LHEFile_Offshell4l"),
+    "HAWK": (hawk_event, "LHEFile_StableHiggsZHHAWK"),
+}
+
+
+def generate_lhe_file(filename, topology, nevents, seed=0, nweights=0):
+    """Writes a synthetic LHE file. The same arguments always give the same file
+
+    Parameters
+    ----------
+    filename : str
+        The file to write
+    topology : str
+        One of the keys of TOPOLOGIES
+    nevents : int
+        The number of events
+    seed : int, optional
+        The seed of the random numbers, by default 0
+    nweights : int, optional
+        The number of reweighting weights declared in an <initrwgt> block and written in every event (as for --ggH4lMG), by default 0
+
+    Returns
+    -------
+    str
+        The filename
+
+    Raises
+    ------
+    ValueError
+        If the topology is not one of TOPOLOGIES
+    """
+    if topology not in TOPOLOGIES:
+        raise ValueError("Unknown topology " + topology + ", the topologies are " + ", ".join(TOPOLOGIES))
+    makeevent = TOPOLOGIES[topology][0]
+    rng = random.Random("{}-{}".format(topology, seed))
+
+    weightids = ["rwgt_{}".format(n + 1) for n in range(nweights)]
+    initrwgt = ""
+    if weightids:
+        initrwgt = "<initrwgt>\n<weightgroup name='synthetic'>\n" + "\n".join("<weight id='{0}'> set param {0} </weight>".format(id) for id in weightids) + "\n</weightgroup>\n</initrwgt>\n"
+
+    with open(filename, "w") as f:
+        f.write(HEADER.format(topology=topology, seed=seed, nevents=nevents, initrwgt=initrwgt, crosssection=1.234567, uncertainty=0.001234))
+        for _ in range(nevents):
+            event = makeevent(rng)
+            weights = [(id, rng.uniform(0.5, 1.5)) for id in weightids]
+            f.write(event.text(1., weights) + "\n")
+        f.write(FOOTER)
+    return filename
@@ -0,0 +1,173 @@
+import os
+import json
+import hashlib
+import tempfile
+
+
+def hash_file(filename, chunksize=1 << 24):
+    """Hashes the contents of a file without reading it into memory all at once
+
+    Parameters
+    ----------
+    filename : str
+        The file to hash
+    chunksize : int, optional
+        The number of bytes read at a time, by default 16 MiB
+
+    Returns
+    -------
+    str
+        The hex digest of the BLAKE2b hash of the file
+    """
+    hasher = hashlib.blake2b()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunksize), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class ConversionManifest(object):
+    def __init__(self, filename) -> None:
+        """A persistent record of which LHE files were converted, from what input and with which lhe2root settings.
+        recursively_convert uses this to only convert files whose input or settings changed since the last run.
+        Every entry is keyed by the absolute path of the LHE file and holds the input size, mtime and content hash,
+        the lhe2root option and extra arguments, and the output ROOT file.
+        The content hash is only recomputed when the size or mtime of the input changes
+
+        Parameters
+        ----------
+        filename : str
+            The JSON file the manifest is stored in. It is created if it does not exist
+        """
+        self.filename = os.path.abspath(filename)
+        self.entries = {}
+
+        if os.path.isfile(self.filename):
+            with open(self.filename) as f:
+                self.entries = json.load(f)
+
+    def fingerprint(self, lhefile, compute_hash=True):
+        """Gets the size, mtime and content hash of an input file, reusing the recorded hash if the size and mtime are unchanged
+
+        Parameters
+        ----------
+        lhefile : str
+            The LHE file
+        compute_hash : bool, optional
+            If False, the hash is None unless it can be reused, by default True
+
+        Returns
+        -------
+        dict
+            A dictionary with the keys "size", "mtime" and "hash"
+        """
+        lhefile = os.path.abspath(lhefile)
+        stat = os.stat(lhefile)
+        entry = self.entries.get(lhefile, {})
+
+        if entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime_ns:
+            filehash = entry["hash"]
+        elif compute_hash:
+            filehash = hash_file(lhefile)
+        else:
+            filehash = None
+
+        return {"size":stat.st_size, "mtime":stat.st_mtime_ns, "hash":filehash}
+
+    def is_current(self, lhefile, argument, other_args, outfile, fingerprint=None):
+        """Checks whether an LHE file was already converted to outfile from the same input with the same settings
+
+        Parameters
+        ----------
+        lhefile : str
+            The LHE file
+        argument : str
+            The lhe2root conversion option
+        other_args : list[str]
+            The other lhe2root arguments
+        outfile : str
+            The ROOT file the conversion should produce
+        fingerprint : dict, optional
+            The fingerprint of lhefile if it was already computed, by default None
+
+        Returns
+        -------
+        bool
+            True if the conversion can be skipped
+        """
+        lhefile = os.path.abspath(lhefile)
+        entry = self.entries.get(lhefile)
+        if entry is None or not os.path.isfile(outfile):
+            return False
+
+        if entry["argument"] != argument or entry["other_args"] != list(other_args) or entry["outfile"] != os.path.abspath(outfile):
+            return False
+
+        if fingerprint is None:
+            fingerprint = self.fingerprint(lhefile)
+
+        if fingerprint["hash"] != entry["hash"]:
+            return False
+
+        if (fingerprint["size"], fingerprint["mtime"]) != (entry["size"], entry["mtime"]): #the file was touched but not changed
+            entry.update(fingerprint)
+            self.save()
+
+        return True
+
+    def adopt(self, lhefile, argument, other_args, outfile):
+        """Records an output that exists but is not in the manifest (i.e. converted before there was a manifest) as current,
+        so that it is kept rather than re-converted. The input is not hashed: only its size and mtime are recorded,
+        and if either of them changes the file is treated as changed and re-converted
+
+        Parameters
+        ----------
+        lhefile : str
+            The LHE file
+        argument : str
+            The lhe2root conversion option
+        other_args : list[str]
+            The other lhe2root arguments
+        outfile : str
+            The existing ROOT file
+
+        Returns
+        -------
+        bool
+            True if the output was adopted, False if lhefile is already in the manifest or outfile does not exist
+        """
+        if os.path.abspath(lhefile) in self.entries or not os.path.isfile(outfile):
+            return False
+        self.record(lhefile, argument, other_args, outfile, self.fingerprint(lhefile, compute_hash=False))
+        return True
+
+    def record(self, lhefile, argument, other_args, outfile, fingerprint=None):
+        """Records a finished conversion and saves the manifest
+
+        Parameters
+        ----------
+        lhefile : str
+            The LHE file
+        argument : str
+            The lhe2root conversion option
+        other_args : list[str]
+            The other lhe2root arguments
+        outfile : str
+            The ROOT file that was produced
+        fingerprint : dict, optional
+            The fingerprint of lhefile taken before it was converted.
+            If None it is taken now, by default None
+        """
+        lhefile = os.path.abspath(lhefile)
+        if fingerprint is None:
+            fingerprint = self.fingerprint(lhefile)
+
+        self.entries[lhefile] = dict(fingerprint, argument=argument, other_args=list(other_args), outfile=os.path.abspath(outfile))
+        self.save()
+
+    def save(self):
+        """Writes the manifest to its JSON file. The file is replaced atomically so that an interrupted run never leaves a broken manifest"""
+        directory = os.path.dirname(self.filename)
+        with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(f.name, self.filename)
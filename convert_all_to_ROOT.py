@@ -40,6 +40,15 @@ if __name__ == '__main__':
     parser.add_argument('-cut', '--cutDown', type=int, default=-1,
                         help="A number of events that you want to cut the lhe file down to the number of events you set")
     
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="The number of files to convert at the same time. Each file gets its own process and the largest files are started first")
+    
+    parser.add_argument('-r', '--retries', type=int, default=1,
+                        help="The number of times a file that failed to convert (i.e. MELA crashed) is tried again when using --jobs")
+    
+    parser.add_argument('-m', '--manifest', type=str, default=".lhe2root_manifest.json",
+                        help="The file in the output directory that records every conversion so that unchanged files are skipped on the next run. Enter \"\" to turn this off")
+    
     args = parser.parse_args()
     
     if not os.path.isdir(args.currentDirectory):
@@ -64,4 +73,5 @@ if __name__ == '__main__':
     file_cross_sections = lhe2root_methods.recursively_convert(current_directory=current_directory, output_directory=args.output, 
                                                                 argument=args.argument, verbose=args.verbose, 
                                                                 exceptions=exceptions, write=args.write, clean=args.clean,
-                                                                cut_down_to=args.cutDown, env=env, other_args=args.extra)
\ No newline at end of file
+                                                                cut_down_to=args.cutDown, env=env, other_args=args.extra,
+                                                                jobs=args.jobs, retries=args.retries, manifest=args.manifest)
\ No newline at end of file
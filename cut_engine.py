@@ -0,0 +1,188 @@
+import ast
+import numpy as np
+
+FUNCTIONS = { #the functions that can be called in a cut expression
+    'abs': np.abs,
+    'sqrt': np.sqrt,
+    'exp': np.exp,
+    'log': np.log,
+    'sin': np.sin,
+    'cos': np.cos,
+    'tan': np.tan,
+    'arctan2': np.arctan2,
+    'hypot': np.hypot,
+    'minimum': np.minimum,
+    'maximum': np.maximum,
+}
+
+_HELPERS = { #what the boolean operators are compiled to, so that they work element by element
+    '_and': np.logical_and,
+    '_or': np.logical_or,
+    '_not': np.logical_not,
+}
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod,
+    ast.Compare, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq,
+    ast.Name, ast.Load, ast.Constant, ast.Call,
+)
+
+
+def parse_bound(bound, default):
+    """Turns a cut bound into a float
+
+    Parameters
+    ----------
+    bound : Union[str, float, None]
+        The bound. '.' and None mean there is no bound
+    default : float
+        The value used when there is no bound, i.e. -numpy.inf for lower bounds and numpy.inf for upper bounds
+
+    Returns
+    -------
+    float
+        The bound
+    """
+    if bound is None or bound == '.':
+        return default
+    return float(bound)
+
+
+class _Vectorize(ast.NodeTransformer):
+    """Rewrites and/or/not and chained comparisons into element-wise NumPy calls"""
+
+    def _call(self, name, args):
+        return ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=args, keywords=[])
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        name = '_and' if isinstance(node.op, ast.And) else '_or'
+        result = node.values[0]
+        for value in node.values[1:]:
+            result = self._call(name, [result, value])
+        return result
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return self._call('_not', [node.operand])
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        comparisons = []
+        left = node.left
+        for op, right in zip(node.ops, node.comparators):
+            comparisons.append(ast.Compare(left=left, ops=[op], comparators=[right]))
+            left = right
+        result = comparisons[0]
+        for comparison in comparisons[1:]:
+            result = self._call('_and', [result, comparison])
+        return result
+
+
+class CutSet(object):
+    def __init__(self, ranges={}, expressions=()):
+        """A set of cuts compiled into a single NumPy expression.
+        Example usage:
+        cuts = CutSet({"MZ1": (3, 3.2)}, ["abs(Phid) < 1.5 and not (costheta1d > 0.9)"])
+        for chunk in lhe2root_methods.iterate_columns(filename, ["M4L"] + cuts.branches):
+            selected = chunk["M4L"][cuts.mask(chunk)]
+
+        Parameters
+        ----------
+        ranges : dict, optional
+            Cuts of the form {branch: (lower, upper)} that keep lower < branch < upper.
+            Bounds of '.' or None mean there is no bound on that side, by default {}
+        expressions : list[str], optional
+            Boolean expressions over branch names, using and, or, not, comparisons (which can be chained),
+            arithmetic and the functions in FUNCTIONS, by default ()
+
+        Raises
+        ------
+        ValueError
+            If an expression is not valid or uses something that is not allowed
+        """
+        self.ranges = {branch: (parse_bound(lower, -np.inf), parse_bound(upper, np.inf)) for branch, (lower, upper) in ranges.items()}
+        self.expressions = list(expressions)
+
+        terms = []
+        self.constants = {}
+        for n, (branch, (lower, upper)) in enumerate(self.ranges.items()):
+            self.constants['_lower{}'.format(n)] = lower
+            self.constants['_upper{}'.format(n)] = upper
+            terms.append('(_lower{0} < {1}) and ({1} < _upper{0})'.format(n, branch))
+        terms += ['(' + expression + ')' for expression in self.expressions]
+
+        self.source = ' and '.join(terms)
+        self.code = None
+        branches = set()
+        if terms:
+            try:
+                tree = ast.parse(self.source, mode='eval')
+            except SyntaxError as e:
+                raise ValueError("Invalid cut expression: " + str(e))
+
+            for node in ast.walk(tree):
+                if not isinstance(node, _ALLOWED_NODES):
+                    raise ValueError(type(node).__name__ + " is not allowed in a cut: " + self.source)
+                if isinstance(node, ast.Call) and (not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords):
+                    raise ValueError("Only the functions " + ", ".join(FUNCTIONS) + " can be called in a cut")
+                if isinstance(node, ast.Name) and node.id not in FUNCTIONS and node.id not in self.constants:
+                    branches.add(node.id)
+
+            tree = ast.fix_missing_locations(_Vectorize().visit(tree))
+            self.code = compile(tree, '<cuts>', 'eval')
+
+        self.branches = sorted(branches) #the branches that have to be read to evaluate the cuts
+        self.key = (self.source, tuple(sorted(self.constants.items()))) #identifies the cuts, i.e. for caching histograms
+
+    def __bool__(self):
+        return self.code is not None
+
+    def mask(self, chunk):
+        """Evaluates the cuts on a chunk of events
+
+        Parameters
+        ----------
+        chunk : dict
+            NumPy arrays of (at least) every branch in self.branches, all of the same length
+
+        Returns
+        -------
+        numpy.ndarray
+            A boolean array that is True for the events that pass every cut
+        """
+        nevents = len(next(iter(chunk.values()))) if chunk else 0
+        if self.code is None:
+            return np.ones(nevents, dtype=bool)
+
+        namespace = dict(FUNCTIONS, **_HELPERS)
+        namespace.update(self.constants)
+        namespace.update((branch, chunk[branch]) for branch in self.branches)
+        return np.broadcast_to(np.asarray(eval(self.code, {'__builtins__': {}}, namespace), dtype=bool), (nevents,))
+
+
+def compile_cuts(cuts):
+    """Turns cuts given as a CutSet, a dictionary of ranges, a single expression or a list of expressions into a CutSet
+
+    Parameters
+    ----------
+    cuts : Union[CutSet, dict, str, list[str], None]
+        The cuts
+
+    Returns
+    -------
+    CutSet
+        The compiled cuts
+    """
+    if isinstance(cuts, CutSet):
+        return cuts
+    if not cuts:
+        return CutSet()
+    if isinstance(cuts, dict):
+        return CutSet(cuts)
+    if isinstance(cuts, str):
+        return CutSet(expressions=[cuts])
+    return CutSet(expressions=cuts)
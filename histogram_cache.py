@@ -0,0 +1,229 @@
+import os
+import glob
+import hashlib
+import tempfile
+import warnings
+import collections
+import numpy as np
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "lhe2root", "histograms")
+
+
+def file_identity(filename):
+    """Identifies the current contents of a file without reading it
+
+    Parameters
+    ----------
+    filename : str
+        The file
+
+    Returns
+    -------
+    tuple[str, int, int]
+        The absolute path, the size and the mtime (in ns) of the file
+    """
+    filename = os.path.abspath(filename)
+    stat = os.stat(filename)
+    return (filename, stat.st_size, stat.st_mtime_ns)
+
+
+def binning_key(xrange, nbins):
+    """A hashable form of a histogram range and binning
+
+    Parameters
+    ----------
+    xrange : tuple[float, float]
+        The range of the histogram
+    nbins : Union[int, list[float]]
+        The number of bins or the bin edges
+
+    Returns
+    -------
+    tuple
+        The range as floats and the number of bins or a tuple of the edges
+    """
+    if np.ndim(nbins) == 0:
+        binning = int(nbins)
+    else:
+        binning = tuple(float(edge) for edge in nbins)
+    return (tuple(float(x) for x in xrange), binning)
+
+
+def histogram_key(filename, attribute, xrange, nbins, cuts):
+    """The key a histogram is cached under
+
+    Parameters
+    ----------
+    filename : str
+        The file the histogram is made from
+    attribute : str
+        The branch that is histogrammed
+    xrange : tuple[float, float]
+        The range of the histogram
+    nbins : Union[int, list[float]]
+        The number of bins or the bin edges
+    cuts : cut_engine.CutSet
+        The cuts applied before histogramming
+
+    Returns
+    -------
+    tuple
+        A key that changes whenever the file, the branch, the binning or the cuts change
+    """
+    return (file_identity(filename), attribute, binning_key(xrange, nbins), cuts.key)
+
+
+class DiskHistogramCache(object):
+    def __init__(self, directory=DEFAULT_DIRECTORY, maxbytes=1 << 28):
+        """A persistent cache of histograms, keyed by histogram_key, that is shared between runs.
+        Every histogram is a small .npz file named after the hash of its key.
+        Once the cache is larger than maxbytes the least recently used histograms are removed
+
+        Parameters
+        ----------
+        directory : str, optional
+            The directory the histograms are stored in. It is created if it does not exist, by default ~/.cache/lhe2root/histograms
+        maxbytes : int, optional
+            The maximum size of the cache in bytes, by default 256 MiB
+        """
+        self.directory = directory
+        self.maxbytes = maxbytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.blake2b(repr(key).encode()).hexdigest() + ".npz")
+
+    def get(self, key):
+        """Gets a histogram
+
+        Parameters
+        ----------
+        key : tuple
+            The key from histogram_key
+
+        Returns
+        -------
+        Union[Tuple[numpy.ndarray, numpy.ndarray], None]
+            The counts and bins, or None if the histogram is not cached
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as histogram:
+                if str(histogram["key"]) != repr(key): #a hash collision
+                    return None
+                counts, bins = histogram["counts"], histogram["bins"]
+            os.utime(path) #marks it as recently used
+        except (OSError, KeyError, ValueError): #not cached, or removed or broken by another process
+            return None
+        return counts, bins
+
+    def put(self, key, counts, bins):
+        """Caches a histogram, then evicts the least recently used histograms if the cache is too large
+
+        Parameters
+        ----------
+        key : tuple
+            The key from histogram_key
+        counts : numpy.ndarray
+            The bin counts
+        bins : numpy.ndarray
+            The bin edges
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as f: #written atomically so that readers never see half a histogram
+                np.savez(f, key=repr(key), counts=counts, bins=bins)
+            os.replace(f.name, self._path(key))
+        except OSError as e: #a cache that can't be written shouldn't stop the plot
+            warnings.warn("Could not cache the histogram in " + self.directory + ": " + str(e))
+            return
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used histograms until the cache is no larger than maxbytes"""
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, "*.npz")):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.maxbytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Empties the cache"""
+        for path in glob.glob(os.path.join(self.directory, "*.npz")):
+            os.remove(path)
+
+
+class HistogramCache(object):
+    def __init__(self, maxsize=256, disk=None):
+        """An in-process least recently used cache of histograms, keyed by histogram_key,
+        optionally backed by a DiskHistogramCache so that histograms are kept between runs
+
+        Parameters
+        ----------
+        maxsize : int, optional
+            The number of histograms kept in memory, by default 256
+        disk : DiskHistogramCache, optional
+            The persistent cache histograms are looked up in and written to, by default None
+        """
+        self.maxsize = maxsize
+        self.disk = disk
+        self.histograms = collections.OrderedDict()
+
+    def get(self, key):
+        """Gets a histogram
+
+        Parameters
+        ----------
+        key : tuple
+            The key from histogram_key
+
+        Returns
+        -------
+        Union[Tuple[numpy.ndarray, numpy.ndarray], None]
+            A copy of the counts and bins, or None if the histogram is not cached
+        """
+        if key not in self.histograms:
+            histogram = self.disk.get(key) if self.disk is not None else None
+            if histogram is not None:
+                self._remember(key, *histogram)
+            return histogram
+        self.histograms.move_to_end(key)
+        counts, bins = self.histograms[key]
+        return counts.copy(), bins.copy() #so that callers can scale them in place
+
+    def put(self, key, counts, bins):
+        """Caches a histogram, evicting the least recently used ones if the cache is full
+
+        Parameters
+        ----------
+        key : tuple
+            The key from histogram_key
+        counts : numpy.ndarray
+            The bin counts
+        bins : numpy.ndarray
+            The bin edges
+        """
+        self._remember(key, counts, bins)
+        if self.disk is not None:
+            self.disk.put(key, counts, bins)
+
+    def _remember(self, key, counts, bins):
+        self.histograms[key] = (counts.copy(), bins.copy())
+        self.histograms.move_to_end(key)
+        while len(self.histograms) > self.maxsize:
+            self.histograms.popitem(last=False)
+
+    def clear(self):
+        """Empties the in-memory cache (the disk cache is kept)"""
+        self.histograms.clear()
@@ -1,17 +1,28 @@
 #!/usr/bin/env python
 import abc
 import collections
-import re
 import argparse, os
-from array import array
 import itertools
+import functools
 import numpy as np
 import sys
+import multiprocessing
+import concurrent.futures
+import shutil
+import tempfile
+import json
 
 import ROOT
 
-from lhefile import LHEFile_JHUGenVBFVH, LHEFile_Hwithdecay, LHEFile_VHHiggsdecay,LHEFile_HwithdecayOnly, LHEFile_Offshell4l,LHEFile_StableHiggs,LHEFile_StableHiggsZHHAWK,LHEFile_StableHiggsVH
+import lhe_reader
+import lhe_compression
+import useful_funcs_and_constants
+from lhefile import InputEvent, LHEFile_JHUGenVBFVH, LHEFile_Hwithdecay, LHEFile_VHHiggsdecay,LHEFile_HwithdecayOnly, LHEFile_Offshell4l,LHEFile_StableHiggs,LHEFile_StableHiggsZHHAWK,LHEFile_StableHiggsVH, merge_photons_into_daughters, merge_photons_into_associated
 from mela import Mela, SimpleParticle_t, SimpleParticleCollection_t, TVar
+from lhe_tokenizer import tokenize_event, WeightLayout
+from mela_hypotheses import HypothesisEngine, DECAY_HYPOTHESES, PRODUCTION_HYPOTHESES
+from stage_profiler import StageProfiler, NULL_PROFILER
+from lhe_kinematics import pad_particles, pt, rapidity, delta_phi, PX, PY, PZ, E
 from pythonmelautils import MultiDimensionalCppArray, SelfDParameter, SelfDCoupling
 
 def tlvfromptetaphim(pt, eta, phi, m):
@@ -57,27 +68,15 @@ class LHEEvent(object, metaclass=abc.ABCMeta):
     ValueError
         Raises when the number of particles is wrong in the event
     """
-    lines = event.split("\n")
-
-    self.weights = {}
-    for line in lines:
-      if "<wgt" not in line: continue
-      match = re.match("<wgt id='(.*)'>([0-9+Ee.-]*)</wgt>", line)
-      if match: self.weights[match.group(1)] = float(match.group(2))
-    lines = [line for line in lines if not ("<" in line or ">" in line or not line.split("#")[0].strip())]
-    nparticles, _, weight, _, _, _ = lines[0].split()
-
-    nparticles = int(nparticles)
-    self.weight = float(weight)
-    if nparticles != len(lines)-1:
-      raise ValueError("Wrong number of particles! Should be {}, have {}".format(nparticles, len(lines)-1))
-
-    daughters, associated, mothers = (SimpleParticleCollection_t(_) for _ in self.extracteventparticles(lines[1:], isgen))
+    self.weight, self.weights, particles = tokenize_event(event)
+
+    self.lhedaughters, self.lheassociated, lhemothers = self.extracteventparticles(particles, isgen)
+    daughters, associated, mothers = (SimpleParticleCollection_t(_ if _ is None else [particle.line for particle in _]) for _ in (self.lhedaughters, self.lheassociated, lhemothers))
     if not list(mothers): mothers = None
     self.daughters, self.associated, self.mothers, self.isgen = self.inputevent = InputEvent(daughters, associated, mothers, isgen)
 
   @abc.abstractmethod
-  def extracteventparticles(cls, lines, isgen): "has to be a classmethod that returns daughters, associated, mothers"
+  def extracteventparticles(cls, particles, isgen): "has to be a classmethod that takes LHEParticle records and returns the records of the daughters, associated, mothers"
 
   def __iter__(self):
     return iter(self.inputevent)
@@ -85,19 +84,18 @@ class LHEEvent(object, metaclass=abc.ABCMeta):
 
 class LHEEvent_Offshell4l(LHEEvent):
   @classmethod
-  def extracteventparticles(cls, lines, isgen):
+  def extracteventparticles(cls, particles, isgen):
     daughters, mothers, associated = [], [], []
 
-    for line in lines:
-      id, status, mother1, mother2 = (int(_) for _ in line.split()[0:4])
+    for particle in particles:
+      id, status, mother1, mother2 = particle[:4]
       if (1 <= abs(id) <= 6 or abs(id) == 21) and not isgen:
-        line = line.replace(str(id), "0", 1)  #replace the first instance of the jet id with 0, which means unknown jet
+        particle = particle._replace(id=0, line=particle.line.replace(str(id), "0", 1))  #replace the first instance of the jet id with 0, which means unknown jet
       if status == -1:
-        mothers.append(line)
+        mothers.append(particle)
 
       if ( abs(id) in ( 25) or abs(id) in (25)  ) and status == 1:
-        daughters.append(line)
-        print("added daught")
+        daughters.append(particle)
         flav4l = flav4l*abs(id)
 
         #      if ( abs(id) in (11, 12, 13, 14, 15, 16) or abs(id) in (1, 2, 3, 4, 5)  ) and status == 1:
@@ -111,17 +109,488 @@ class LHEEvent_Offshell4l(LHEEvent):
     #if len(daughters) == 4:
       #print "flavour comp:",flav4l
     #if len(daughters) != 4:
-    #  raise ValueError("Wrong number of daughters (expected {}, found {})\n\n".format(4, len(daughters))+"\n".join(lines))
+    #  raise ValueError("Wrong number of daughters (expected {}, found {})\n\n".format(4, len(daughters))+"\n".join(p.line for p in particles))
     if cls.nassociatedparticles is not None and len(associated) != cls.nassociatedparticles:
-      raise ValueError("Wrong number of associated particles (expected {}, found {})\n\n".format(cls.nassociatedparticles, len(associated))+"\n".join(lines))
+      raise ValueError("Wrong number of associated particles (expected {}, found {})\n\n".format(cls.nassociatedparticles, len(associated))+"\n".join(p.line for p in particles))
     if len(mothers) != 2:
-      raise ValueError("{} mothers in the event??\n\n".format(len(mothers))+"\n".join(lines))
+      raise ValueError("{} mothers in the event??\n\n".format(len(mothers))+"\n".join(p.line for p in particles))
 
     if not isgen: mothers = None
     return daughters, associated, mothers
 
   nassociatedparticles = None
 
+class BranchBuffer(object):
+  def __init__(self, batchsize=10000):
+    """The branch buffers of the output tree. Every branch is a view into one row per type,
+    so that a whole batch of events can be stored, edited column by column, and filled afterwards
+
+    Parameters
+    ----------
+    batchsize : int, optional
+        The number of events stored before they have to be filled, by default 10000
+    """
+    self.batchsize = batchsize
+    self.slots = collections.OrderedDict() #name -> (typecode, start, length)
+    self.leaflists = [] #(name, leaflist) in the order the branches are made
+    self.sizes = {"f": 0, "i": 0}
+    self.dtypes = {"f": np.float32, "i": np.int32}
+
+  def add(self, name, typecode="f", length=1):
+    """Declares a branch. Declaring the same name twice makes a second branch sharing the same buffer
+
+    Parameters
+    ----------
+    name : str
+        The name of the branch
+    typecode : str, optional
+        "f" for float branches and "i" for int branches, by default "f"
+    length : int, optional
+        The length of fixed-size array branches, by default 1
+    """
+    if name not in self.slots:
+      self.slots[name] = (typecode, self.sizes[typecode], length)
+      self.sizes[typecode] += length
+    self.leaflists.append((name, name + ("[{}]".format(length) if length > 1 else "") + "/" + typecode.upper()))
+
+  def build(self):
+    """Allocates the buffers. The branches themselves are made by the OutputWriter
+
+    Returns
+    -------
+    dict
+        A dictionary of every branch name to its buffer
+    """
+    self.rows = {typecode: np.zeros(size, dtype=self.dtypes[typecode]) for typecode, size in self.sizes.items()}
+    self.batch = {typecode: np.zeros((self.batchsize, size), dtype=self.dtypes[typecode]) for typecode, size in self.sizes.items()}
+    self.branches = {name: self.rows[typecode][start:start+length] for name, (typecode, start, length) in self.slots.items()}
+    self.nevents = 0
+    self.particles = []
+    return self.branches
+
+  def snapshot(self, *particles):
+    """Stores the current values of every branch as the next event of the batch
+
+    Parameters
+    ----------
+    *particles : list[lhe_tokenizer.LHEParticle]
+        The particle records of the event that the batch kinematics are computed from
+
+    Returns
+    -------
+    bool
+        Whether the batch is full
+    """
+    for typecode, row in self.rows.items():
+      self.batch[typecode][self.nevents] = row
+    self.particles.append(particles)
+    self.nevents += 1
+    return self.nevents == self.batchsize
+
+  def column(self, name):
+    """The values of a branch for every stored event in the batch"""
+    typecode, start, length = self.slots[name]
+    if length == 1:
+      return self.batch[typecode][:self.nevents, start]
+    return self.batch[typecode][:self.nevents, start:start+length]
+
+  def restore(self, i):
+    """Copies stored event i back into the branch buffers"""
+    for typecode, row in self.rows.items():
+      row[:] = self.batch[typecode][i]
+
+  def fill(self, writer, columns={}):
+    """Writes every stored event to the output and empties the batch
+
+    Parameters
+    ----------
+    writer : OutputWriter
+        The output the events are written to
+    columns : dict, optional
+        Branch values computed for the whole batch that replace the stored ones, by default {}
+    """
+    for name, values in columns.items():
+      self.column(name)[:] = values
+    writer.write(self)
+    self.nevents = 0
+    self.particles = []
+
+
+class OutputWriter(object, metaclass=abc.ABCMeta):
+  """Where the batches of a BranchBuffer are written to. Every writer produces a tree called "tree"
+  with the branches (names, types and array lengths) declared on the BranchBuffer
+  """
+  resumable = False #whether the output can be reopened and added to with --resume
+
+  def __init__(self, outputfile, branchbuffer, resume=False, rowgroupsize=100000):
+    """Opens the output file and makes the tree
+
+    Parameters
+    ----------
+    outputfile : str
+        The output file
+    branchbuffer : BranchBuffer
+        The built BranchBuffer whose branches are written
+    resume : bool, optional
+        If True, the existing tree in outputfile is added to, by default False
+    rowgroupsize : int, optional
+        The number of events per row group for the columnar formats, by default 100000
+    """
+    if resume and not self.resumable:
+      raise ValueError(type(self).__name__ + " can't resume an earlier conversion")
+    self.outputfile = outputfile
+
+  @property
+  @abc.abstractmethod
+  def entries(self):
+    """The number of events written so far"""
+
+  @abc.abstractmethod
+  def write(self, branchbuffer):
+    """Writes every event stored in the BranchBuffer"""
+
+  def checkpoint(self):
+    """Makes sure everything written so far is saved in the file"""
+
+  @abc.abstractmethod
+  def close(self):
+    """Finishes writing the output file"""
+
+  @classmethod
+  def merge(cls, partials, outputfile, rowgroupsize=100000):
+    """Merges output files written by this writer into one, keeping the order of the events
+
+    Parameters
+    ----------
+    partials : list[str]
+        The files to merge, in order
+    outputfile : str
+        The merged file
+    rowgroupsize : int, optional
+        The number of events per row group of the merged file for the columnar formats, by default 100000
+
+    Raises
+    ------
+    IOError
+        If the merge fails
+    """
+    merger = ROOT.TFileMerger(False)
+    merger.OutputFile(outputfile, "RECREATE")
+    for partial in partials: #TFileMerger keeps the order the files are added in
+      merger.AddFile(partial)
+    if not merger.Merge():
+      raise IOError("Merging the partial trees into " + outputfile + " failed")
+
+
+class RootTreeWriter(OutputWriter):
+  """Writes a ROOT TTree through PyROOT, binding the branches to the buffers and filling one event at a time"""
+  resumable = True
+
+  def __init__(self, outputfile, branchbuffer, resume=False, rowgroupsize=100000):
+    super(RootTreeWriter, self).__init__(outputfile, branchbuffer, resume, rowgroupsize)
+    if resume:
+      self.f = ROOT.TFile(outputfile, "UPDATE")
+      self.tree = self.f.Get("tree")
+      if not self.tree:
+        raise IOError(outputfile + " has no tree to resume")
+      for branch in self.tree.GetListOfBranches(): #names can be repeated, so every branch is set rather than the first one with each name
+        if branch.GetName() in branchbuffer.branches:
+          branch.SetAddress(branchbuffer.branches[branch.GetName()])
+    else:
+      self.f = ROOT.TFile(outputfile, "RECREATE")
+      self.tree = ROOT.TTree("tree", "tree")
+      for name, leaflist in branchbuffer.leaflists:
+        self.tree.Branch(name, branchbuffer.branches[name], leaflist)
+
+  @property
+  def entries(self):
+    return int(self.tree.GetEntries())
+
+  def write(self, branchbuffer):
+    for i in range(branchbuffer.nevents):
+      branchbuffer.restore(i)
+      self.tree.Fill()
+
+  def checkpoint(self):
+    self.tree.AutoSave("SaveSelf")
+
+  def close(self):
+    self.f.Write("", ROOT.TObject.kOverwrite)
+    self.f.Close()
+
+
+class UprootTreeWriter(OutputWriter):
+  """Writes a ROOT TTree with uproot, one basket per batch, without going through PyROOT for every event.
+  Branch names that were declared more than once are only written once
+  """
+
+  def __init__(self, outputfile, branchbuffer, resume=False, rowgroupsize=100000):
+    super(UprootTreeWriter, self).__init__(outputfile, branchbuffer, resume, rowgroupsize)
+    import uproot
+    types = {}
+    for name, (typecode, start, length) in branchbuffer.slots.items():
+      dtype = np.dtype(branchbuffer.dtypes[typecode])
+      types[name] = dtype if length == 1 else np.dtype((dtype, (length,)))
+    self.f = uproot.recreate(outputfile)
+    self.tree = self.f.mktree("tree", types, title="tree")
+    self.nentries = 0
+
+  @property
+  def entries(self):
+    return self.nentries
+
+  def write(self, branchbuffer):
+    if not branchbuffer.nevents:
+      return
+    self.tree.extend({name: np.ascontiguousarray(branchbuffer.column(name)) for name in branchbuffer.slots})
+    self.nentries += branchbuffer.nevents
+
+  def close(self):
+    self.f.close()
+
+
+class ArrowBatchWriter(OutputWriter):
+  """Base class for the pyarrow formats. Every branch becomes a column of the same name and type,
+  with fixed-size array branches (like LHEDaughterPt or weights) as fixed-size list columns.
+  Batches are collected until there are rowgroupsize events and then written in row groups of exactly rowgroupsize events
+  (only the last one can be shorter)
+  """
+
+  def __init__(self, outputfile, branchbuffer, resume=False, rowgroupsize=100000):
+    super(ArrowBatchWriter, self).__init__(outputfile, branchbuffer, resume, rowgroupsize)
+    import pyarrow
+    self.pa = pyarrow
+    fields = []
+    for name, (typecode, start, length) in branchbuffer.slots.items():
+      valuetype = pyarrow.from_numpy_dtype(branchbuffer.dtypes[typecode])
+      fields.append(pyarrow.field(name, valuetype if length == 1 else pyarrow.list_(valuetype, length)))
+    self.schema = pyarrow.schema(fields)
+    self.rowgroupsize = rowgroupsize
+    self.pending = []
+    self.npending = 0
+    self.nentries = 0
+    self.sink = self.open(outputfile)
+
+  @abc.abstractmethod
+  def open(self, outputfile):
+    """Opens the output file for writing tables with self.schema"""
+
+  @abc.abstractmethod
+  def writetable(self, table):
+    """Writes a table as a single row group"""
+
+  @property
+  def entries(self):
+    return self.nentries
+
+  def write(self, branchbuffer):
+    if not branchbuffer.nevents:
+      return
+    arrays = []
+    for name, (typecode, start, length) in branchbuffer.slots.items():
+      column = np.array(branchbuffer.column(name)) #a copy, since the BranchBuffer reuses its memory for the next batch
+      if length == 1:
+        arrays.append(self.pa.array(column))
+      else:
+        arrays.append(self.pa.FixedSizeListArray.from_arrays(self.pa.array(column.ravel()), length))
+    self.pending.append(self.pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+    self.npending += branchbuffer.nevents
+    self.nentries += branchbuffer.nevents
+    if self.npending >= self.rowgroupsize:
+      table = self.pa.Table.from_batches(self.pending, self.schema)
+      full = self.npending - self.npending % self.rowgroupsize
+      for start in range(0, full, self.rowgroupsize):
+        self.writetable(table.slice(start, self.rowgroupsize).combine_chunks())
+      self.pending = table.slice(full).to_batches() #the rest goes into the next row group
+      self.npending -= full
+
+  def flush(self):
+    """Writes the collected batches as one row group, whatever their size"""
+    if self.pending:
+      self.writetable(self.pa.Table.from_batches(self.pending, self.schema).combine_chunks())
+    self.pending = []
+    self.npending = 0
+
+  def close(self):
+    self.flush()
+    self.sink.close()
+
+  @staticmethod
+  def regroup(tables, rowgroupsize):
+    """Splits the rows of a sequence of tables into tables of rowgroupsize rows, keeping their order.
+    merge uses this so that the merged file has the same row groups as one written in a single process
+
+    Parameters
+    ----------
+    tables : Iterable[pyarrow.Table]
+        The tables, i.e. the row groups of every partial file
+    rowgroupsize : int
+        The number of rows of every table but the last
+
+    Yields
+    ------
+    pyarrow.Table
+        The rows in tables of rowgroupsize rows, with the rest in the last one
+    """
+    import pyarrow
+    pending = []
+    npending = 0
+    for table in tables:
+      pending.append(table)
+      npending += len(table)
+      while npending >= rowgroupsize:
+        table = pyarrow.concat_tables(pending)
+        yield table.slice(0, rowgroupsize).combine_chunks()
+        pending = [table.slice(rowgroupsize)]
+        npending = len(pending[0])
+    if npending:
+      yield pyarrow.concat_tables(pending).combine_chunks()
+
+
+class ParquetTableWriter(ArrowBatchWriter):
+  """Writes a Parquet file"""
+
+  def open(self, outputfile):
+    import pyarrow.parquet
+    return pyarrow.parquet.ParquetWriter(outputfile, self.schema)
+
+  def writetable(self, table):
+    self.sink.write_table(table, row_group_size=len(table))
+
+  @classmethod
+  def merge(cls, partials, outputfile, rowgroupsize=100000):
+    import pyarrow.parquet
+    partials = [pyarrow.parquet.ParquetFile(partial) for partial in partials]
+    if not partials:
+      return
+    tables = (partial.read_row_group(i) for partial in partials for i in range(partial.num_row_groups)) #read one row group at a time
+    with pyarrow.parquet.ParquetWriter(outputfile, partials[0].schema_arrow) as sink:
+      for table in cls.regroup(tables, rowgroupsize):
+        sink.write_table(table, row_group_size=len(table))
+
+
+class ArrowIPCWriter(ArrowBatchWriter):
+  """Writes an (uncompressed) Arrow IPC file, which can be memory-mapped when it is read"""
+
+  def open(self, outputfile):
+    return self.pa.ipc.new_file(outputfile, self.schema)
+
+  def writetable(self, table):
+    self.sink.write_table(table, max_chunksize=len(table))
+
+  @classmethod
+  def merge(cls, partials, outputfile, rowgroupsize=100000):
+    import pyarrow
+    def tables():
+      for partial in partials:
+        with pyarrow.memory_map(partial) as source:
+          partial = pyarrow.ipc.open_file(source)
+          for i in range(partial.num_record_batches):
+            yield pyarrow.Table.from_batches([partial.get_batch(i)])
+    if not partials:
+      return
+    with pyarrow.memory_map(partials[0]) as source:
+      schema = pyarrow.ipc.open_file(source).schema
+    with pyarrow.ipc.new_file(outputfile, schema) as sink:
+      for table in cls.regroup(tables(), rowgroupsize):
+        sink.write_table(table, max_chunksize=len(table))
+
+
+WRITERS = { #the --writer options for --format root
+  "root": RootTreeWriter,
+  "uproot": UprootTreeWriter,
+}
+
+FORMATS = { #the --format options other than root
+  "parquet": ParquetTableWriter,
+  "arrow": ArrowIPCWriter,
+}
+
+
+def writer_class(args):
+  """The OutputWriter chosen by --format and --writer
+
+  Parameters
+  ----------
+  args : argparse.Namespace
+      The parsed lhe2root arguments
+
+  Returns
+  -------
+  type
+      The OutputWriter subclass
+  """
+  if args.format == "root":
+    return WRITERS[args.writer]
+  return FORMATS[args.format]
+
+
+def kinematic_branches(args, daughters, associated):
+  """Computes the kinematic branches for a batch of events with NumPy.
+  The definitions are the same as the TLorentzVector ones they replace
+
+  Parameters
+  ----------
+  args : argparse.Namespace
+      The parsed lhe2root arguments
+  daughters : list[list[lhe_tokenizer.LHEParticle]]
+      The daughter records of every event in the batch
+  associated : list[list[lhe_tokenizer.LHEParticle]]
+      The associated particle records of every event in the batch
+
+  Returns
+  -------
+  dict
+      A dictionary of branch name to the values of the branch for every event
+
+  Raises
+  ------
+  IndexError
+      If an event has fewer daughters or associated particles than the branches need
+  """
+  dauids, daup4, daucounts = pad_particles(daughters)
+  _, assp4, asscounts = pad_particles(associated)
+  columns = {}
+
+  pH = daup4.sum(axis=1)
+
+  needsjets = args.vbf or args.vbf_withdecay or args.zh or args.wh or args.zh_lep_hawk
+  if needsjets:
+    if len(asscounts) and asscounts.min() < 2:
+      raise IndexError("Every event needs at least 2 associated particles, found {}".format(asscounts.min()))
+    pj1, pj2 = assp4[:, 0], assp4[:, 1]
+    for j, pj in (("1", pj1), ("2", pj2)):
+      columns["pxj" + j], columns["pyj" + j], columns["pzj" + j], columns["Ej" + j] = pj[:, PX], pj[:, PY], pj[:, PZ], pj[:, E]
+
+  if args.vbf or args.vbf_withdecay:
+    columns["HJJpz"] = pH[:, PZ] + assp4[:, :, PZ].sum(axis=1)
+  if args.vbf:
+    columns["Dphijj"] = np.where(pt(pj1) > pt(pj2), delta_phi(pj1, pj2), delta_phi(pj2, pj1))
+
+  if not args.ggH4l:
+    columns["ptH"] = pt(pH)
+    columns["pxH"], columns["pyH"], columns["pzH"], columns["EH"] = pH[:, PX], pH[:, PY], pH[:, PZ], pH[:, E]
+    columns["rapH"] = rapidity(pH)
+
+  if not args.vbf and not args.zh and not args.wh and not args.zh_lep and not args.wh_lep and not args.zh_lep_hawk:
+    if len(daucounts) and daucounts.min() < 4:
+      raise IndexError("Every event needs at least 4 daughters, found {}".format(daucounts.min()))
+    for n in range(4):
+      pdau = daup4[:, n]
+      dau = str(n + 1)
+      columns["ptdau" + dau] = pt(pdau)
+      columns["pxdau" + dau], columns["pydau" + dau], columns["pzdau" + dau], columns["Edau" + dau] = pdau[:, PX], pdau[:, PY], pdau[:, PZ], pdau[:, E]
+      columns["flavdau" + dau] = dauids[:, n]
+
+  if args.vbf or args.zh or args.wh or args.zh_lep_hawk:
+    columns["rapHJJ"] = rapidity(pH + pj1 + pj2)
+
+  if args.zh or args.wh or args.zh_lep_hawk:
+    columns["ptV"] = pt(pj1 + pj2)
+
+  return columns
+
+
 def main(raw_args=None):
   """This is the main method for lhe2root. It is formatted in this way so that this method
   is callable by functions in other files! (Namely lhe_reader!)
@@ -157,29 +626,221 @@ def main(raw_args=None):
   g.add_argument("--ggH4lMG", action="store_true") # for ggH4l Madgraph with weights
   parser.add_argument("--use-flavor", action="store_true")
   parser.add_argument("--merge_photon", action="store_true") # for ggH 4l JHUGen and prophecy
+  parser.add_argument("--photon-cone", type=float, default=None) #only merge FSR photons into leptons closer than this in Delta R, by default the closest lepton always gets the photon
   parser.add_argument("--calc_prodprob", action="store_true")
   parser.add_argument("--calc_decayprob", action="store_true")
   parser.add_argument("--CJLST", action="store_true")
   parser.add_argument("--MELAcalc", action="store_true")
   parser.add_argument("--reweight-to", choices="fa3-0.5")
+  parser.add_argument("--batchsize", type=int, default=10000) #the number of events whose kinematics are computed together
+  parser.add_argument("-j", "--jobs", type=int, default=1) #the number of worker processes to split the conversion across
+  parser.add_argument("--format", choices=["root"] + sorted(FORMATS), default="root") #the format of the output file
+  parser.add_argument("--writer", choices=sorted(WRITERS), default="root") #how the output tree is written for --format root
+  parser.add_argument("--row-group-size", type=int, default=100000) #the number of events per row group for --format parquet and arrow
+  parser.add_argument("--checkpoint-every", type=int, default=100000) #checkpoint the output every time this many more events are written, 0 turns it off
+  parser.add_argument("--resume", action="store_true") #continue a conversion that stopped from its checkpoint
+  parser.add_argument("--byte-range", type=int, nargs=2, default=None, help=argparse.SUPPRESS) #only convert the events in this byte range of the (single) input file
+  parser.add_argument("--profile", nargs="?", const="", default=None) #time every stage of the conversion, print a summary and write it as JSON to this file (by default <outputfile>.profile.json)
   parser.add_argument('-v', '--verbose', action="store_true") #if enabled it will be verbose
   args = parser.parse_args(raw_args) #This allows the parser to take in command line arguments if raw_args=None
 
   if not args.verbose:
     f = open(os.devnull, 'w')
     sys.stdout = f
-  if os.path.exists(args.outputfile): 
+  if args.resume and args.jobs > 1:
+    parser.error("--resume cannot be combined with --jobs")
+  if args.resume and not writer_class(args).resumable:
+    parser.error("--resume cannot be used with --format " + args.format + " --writer " + args.writer)
+  if os.path.exists(args.outputfile) and not (args.resume and os.path.exists(useful_funcs_and_constants.checkpoint_filename(args.outputfile))): 
     raise IOError(args.outputfile+" already exists")
   for _ in args.inputfile:
     if not os.path.exists(_) and not args.CJLST: 
       raise IOError(_+" doesn't exist")
-    
+
+  if args.jobs > 1:
+    profiler = convert_sharded(args)
+  else:
+    profiler = convert(args)
+  if args.profile is not None:
+    profiler.report(args.profile or args.outputfile + ".profile.json")
+
+
+def plan_shards(inputfiles, jobs):
+  """Splits the input files into (roughly) jobs pieces. Files get a number of pieces proportional to their size,
+  and files that get more than one piece are split into byte ranges of whole events (compressed files are always kept whole)
+
+  Parameters
+  ----------
+  inputfiles : list[str]
+      The LHE files being converted
+  jobs : int
+      The number of worker processes
+
+  Returns
+  -------
+  list[Tuple[str, Union[Tuple[int, int], None]]]
+      (input file, byte range) pairs in the original event order. A byte range of None means the whole file
+  """
+  sizes = [os.path.getsize(inputfile) for inputfile in inputfiles]
+  total = sum(sizes) or 1
+  shards = []
+  for inputfile, size in zip(inputfiles, sizes):
+    npieces = max(1, int(round(jobs*size/total)))
+    if npieces == 1 or lhe_compression.compression(inputfile): #compressed files can't be cheaply seeked into, so they are never split
+      shards.append((inputfile, None))
+      continue
+
+    with lhe_reader.lhe_reader(inputfile) as reader:
+      offsets = reader.event_offsets
+      for events in np.array_split(np.arange(len(offsets)), min(npieces, len(offsets))):
+        shards.append((inputfile, (int(offsets[events[0]][0]), int(offsets[events[-1]][1]))))
+  return shards
+
+
+def _convert_shard(args):
+  """Runs convert in a worker process. This has to be a module-level function so it can be pickled.
+  Returns the partial output file and the profile of the worker"""
+  if not args.verbose:
+    sys.stdout = open(os.devnull, 'w')
+  profiler = convert(args)
+  return args.outputfile, profiler.as_dict()
+
+
+def convert_sharded(args):
+  """Converts the input files with args.jobs worker processes, each of which has its own Mela,
+  and then merges the partial trees into args.outputfile in the original event order
+
+  Parameters
+  ----------
+  args : argparse.Namespace
+      The parsed lhe2root arguments
+
+  Returns
+  -------
+  stage_profiler.StageProfiler
+      The stages of every worker added together if args.profile is set, otherwise NULL_PROFILER
+  """
+  profiler = StageProfiler(processes=args.jobs) if args.profile is not None else NULL_PROFILER
+  shards = plan_shards(args.inputfile, args.jobs)
+  print("Splitting", len(args.inputfile), "input files into", len(shards), "pieces over", args.jobs, "processes")
+
+  outputdirectory = os.path.dirname(os.path.abspath(args.outputfile))
+  partialdirectory = tempfile.mkdtemp(prefix=".lhe2root_", dir=outputdirectory)
+  try:
+    shardargs = []
+    for n, (inputfile, byterange) in enumerate(shards):
+      shardarg = argparse.Namespace(**vars(args))
+      shardarg.outputfile = os.path.join(partialdirectory, "part{:05d}.root".format(n))
+      shardarg.inputfile = [inputfile]
+      shardarg.byte_range = byterange
+      shardarg.jobs = 1
+      shardarg.checkpoint_every = 0 #the partial files are thrown away if anything fails
+      shardargs.append(shardarg)
+
+    #spawn so that every worker starts from a clean ROOT/MELA state instead of a forked copy of this one.
+    #A worker that dies (i.e. a segfault in MELA) raises BrokenProcessPool, so the partial files are still cleaned up
+    with concurrent.futures.ProcessPoolExecutor(args.jobs, mp_context=multiprocessing.get_context("spawn")) as pool:
+      results = list(pool.map(_convert_shard, shardargs))
+
+    partials = [partial for partial, _ in results]
+    for _, profile in results:
+      profiler.merge(profile)
+    with profiler.stage("merge"):
+      writer_class(args).merge(partials, args.outputfile, args.row_group_size)
+  except:
+    try:
+      os.remove(args.outputfile)
+    except:
+      pass
+    raise
+  finally:
+    shutil.rmtree(partialdirectory, ignore_errors=True)
+  return profiler
+
+
+CHECKPOINT_IGNORED_SETTINGS = {"outputfile", "verbose", "jobs", "batchsize", "checkpoint_every", "resume", "profile"}
+
+def write_checkpoint(args, writer, inputindex, byteoffset):
+  """Saves the tree to the output file and records how far the conversion got, so that it can be continued with --resume
+
+  Parameters
+  ----------
+  args : argparse.Namespace
+      The parsed lhe2root arguments
+  writer : OutputWriter
+      The output, which should hold every event up to the one being recorded
+  inputindex : int
+      The index of the input file being converted in args.inputfile
+  byteoffset : int
+      The byte offset in that file just after the last event written (see LHEFileBase.byteoffset)
+  """
+  inputfile = args.inputfile[inputindex]
+  writer.checkpoint()
+  checkpoint = {
+    "inputfile_index": inputindex,
+    "inputfile": inputfile,
+    "byte_offset": byteoffset,
+    "entries": writer.entries,
+    "settings": {key: value for key, value in vars(args).items() if key not in CHECKPOINT_IGNORED_SETTINGS},
+  }
+
+  checkpointfile = useful_funcs_and_constants.checkpoint_filename(args.outputfile)
+  with open(checkpointfile + ".tmp", "w") as f:
+    json.dump(checkpoint, f)
+  os.replace(checkpointfile + ".tmp", checkpointfile) #a crash while writing never leaves a broken checkpoint
+
+
+def read_checkpoint(args):
+  """Reads the checkpoint of args.outputfile and checks that it was made with the same settings
+
+  Parameters
+  ----------
+  args : argparse.Namespace
+      The parsed lhe2root arguments
+
+  Returns
+  -------
+  dict
+      The checkpoint
+
+  Raises
+  ------
+  ValueError
+      If the conversion was started with different input files or options
+  """
+  with open(useful_funcs_and_constants.checkpoint_filename(args.outputfile)) as f:
+    checkpoint = json.load(f)
+
+  settings = json.loads(json.dumps({key: value for key, value in vars(args).items() if key not in CHECKPOINT_IGNORED_SETTINGS}))
+  if checkpoint["settings"] != settings:
+    raise ValueError("The checkpoint of " + args.outputfile + " was made with different inputs or options: " + str(checkpoint["settings"]))
+  return checkpoint
+
+
+def convert(args):
+  """Converts the LHE files in args.inputfile to a single ROOT file args.outputfile in this process
+
+  Parameters
+  ----------
+  args : argparse.Namespace
+      The parsed lhe2root arguments
+
+  Returns
+  -------
+  stage_profiler.StageProfiler
+      The time spent in each stage if args.profile is set, otherwise NULL_PROFILER
+  """
+  profiler = StageProfiler() if args.profile is not None else NULL_PROFILER
   bad = False
+  checkpointfile = useful_funcs_and_constants.checkpoint_filename(args.outputfile)
+  checkpoint = None
 
 
   try:
-    newf = ROOT.TFile(args.outputfile, "RECREATE")
-    t = ROOT.TTree("tree", "tree")
+    if args.resume and os.path.exists(checkpointfile):
+      checkpoint = read_checkpoint(args)
+    elif os.path.exists(checkpointfile): #left over from an output file that no longer exists
+      os.remove(checkpointfile)
 
     branchnames_float = "costheta1", "costheta2", "Phi1", "costhetastar", "Phi", "HJJpz","M4L","MZ1","MZ2","costheta1d","costheta2d","Phid","costhetastard","Phi1d"
     if args.calc_prodprob or args.calc_decayprob :
@@ -190,7 +851,8 @@ def main(raw_args=None):
       
     if args.ggH4lMG:
       branchnames_float_array=("weights",)
-      num_weights=30
+      weightlayout = WeightLayout.from_header(lhe_reader.read_head(args.inputfile[0]).decode()) #the weights are in the sorted order of their ids
+      num_weights=len(weightlayout)
     if args.vbf or args.vbf_withdecay:
       branchnames_float += ("q2V1", "q2V2","Dphijj")
     if args.MELAcalc:
@@ -198,10 +860,6 @@ def main(raw_args=None):
       branchnames_associated = "LHEAssociatedParticleId","LHEAssociatedParticlePt","LHEAssociatedParticleEta","LHEAssociatedParticlePhi","LHEAssociatedParticleMass"
       branchnames_mothers = "LHEMotherId","LHEMotherPz","LHEMotherE"
 
-      branches_daughters = {name: array("f", [0,0,0,0]) for name in branchnames_daughters}
-      branches_associated = {name: array("f", [0,0]) for name in branchnames_associated}
-      branches_mothers = {name: array("f", [0,0]) for name in branchnames_mothers}
-
     branchnames_float += (
       
       "ptH", "pxH",  "pyH",  "pzH",  "EH","rapH","rapHJJ","decayMode","qfl1","qfl2","qfl1mom","qfl2mom",
@@ -218,30 +876,39 @@ def main(raw_args=None):
 
     branchnames_int = ()
 
-    branches = {name: array("f", [0]) for name in branchnames_float}
-    branches_int = {name: array("i", [0]) for name in branchnames_int}
+    branchbuffer = BranchBuffer(args.batchsize)
     if args.ggH4lMG:
-      branches_float = {name: array("f",[0]*num_weights) for name in branchnames_float_array}
-      print(branches_float,branchnames_float_array,"here")
-      for name in branches_float:
-        t.Branch(name, branches_float[name], name+"[30]/F")
-      branches.update(branches_float)
+      for name in branchnames_float_array:
+        branchbuffer.add(name, "f", num_weights)
     for name in branchnames_float:
-      t.Branch(name, branches[name], name+"/F")
+      branchbuffer.add(name, "f")
     for name in branchnames_int:
-      t.Branch(name, branches_int[names], name+"/I")
+      branchbuffer.add(name, "i")
     if args.MELAcalc:
       for name in branchnames_daughters:
-        t.Branch(name, branches_daughters[name], name+"[4]/F")
+        branchbuffer.add(name, "f", 4)
       for name in branchnames_associated:
-        t.Branch(name, branches_associated[name], name+"[2]/F")
+        branchbuffer.add(name, "f", 2)
       for name in branchnames_mothers:
-        t.Branch(name, branches_mothers[name], name+"[2]/F")
-      branches.update(branches_daughters)
-      branches.update(branches_associated)
-      branches.update(branches_mothers)
+        branchbuffer.add(name, "f", 2)
+
+    branches = branchbuffer.build()
+    writer = writer_class(args)(args.outputfile, branchbuffer, resume=checkpoint is not None, rowgroupsize=args.row_group_size)
+    if checkpoint is not None:
+      if writer.entries != checkpoint["entries"]:
+        raise IOError(args.outputfile + " does not match its checkpoint and has to be converted again")
+      print("Resuming from event", checkpoint["entries"], "of", args.outputfile)
+    checkpointing = args.checkpoint_every > 0 and writer.resumable
+    lastcheckpoint = writer.entries
+    decayhypotheses = HypothesisEngine(DECAY_HYPOTHESES, TVar, profiler)
+    productionhypotheses = HypothesisEngine(PRODUCTION_HYPOTHESES, TVar, profiler)
+
+    def fillbatch():
+      with profiler.stage("kinematics"):
+        columns = kinematic_branches(args, *zip(*branchbuffer.particles)) if branchbuffer.nevents else {}
+      with profiler.stage("write"): #TTree.Fill, or the batch written by uproot or arrow
+        branchbuffer.fill(writer, columns)
 
-    branches.update(branches_int)
     g4 = 0
     if args.zh:
       g4 = 0.144057
@@ -251,20 +918,42 @@ def main(raw_args=None):
       g4 = 0.297979
     
     
-    for inputfile in args.inputfile:
+    for inputindex, inputfile in enumerate(args.inputfile):
+      byterange = args.byte_range
+      if byterange is None and checkpointing:
+        byterange = (0, sys.maxsize) #read in binary, so that the reader knows the byte offset of every event
+      if checkpoint is not None:
+        if inputindex < checkpoint["inputfile_index"]:
+          continue
+        if inputindex == checkpoint["inputfile_index"]:
+          byterange = (checkpoint["byte_offset"], args.byte_range[1] if args.byte_range else sys.maxsize) #offsets count decompressed bytes, so the size of a compressed file is not the end
       print(inputfile)
-      inputfclass = LHEFile_Hwithdecay(inputfile,isgen=args.use_flavor)
+      #pick the class first so that only one Mela gets made per input file
+      lhefileclass = LHEFile_Hwithdecay
       if args.ggH4l : 
-        inputfclass = LHEFile_HwithdecayOnly(inputfile,isgen=args.use_flavor)
+        lhefileclass = LHEFile_HwithdecayOnly
       if args.vbf or args.zh_lep or args.wh_lep  :
-        inputfclass = LHEFile_StableHiggs(inputfile,isgen=args.use_flavor)
+        lhefileclass = LHEFile_StableHiggs
       if args.zh or args.wh:
-        inputfclass = LHEFile_StableHiggsVH(inputfile,isgen=args.use_flavor)
+        lhefileclass = LHEFile_StableHiggsVH
       if args.zh_withdecay or args.wh_withdecay  :
-        inputfclass = LHEFile_VHHiggsdecay(inputfile,isgen=args.use_flavor)
+        lhefileclass = LHEFile_VHHiggsdecay
       if args.zh_lep_hawk :
         print ("Algorithm will automaticaly merge associated FSR photons to the leptons")
-        inputfclass = LHEFile_StableHiggsZHHAWK(inputfile,isgen=args.use_flavor)
+        lhefileclass = LHEFile_StableHiggsZHHAWK
+      lhefilekwargs = {"profiler": profiler}
+      # the EW emitted photons are merged to the closest lepton, a chunk of events at a time, before MELA sees the event.
+      # For Prophecy they go into the daughters and the photon is still stored in the associated collection for reference.
+      # For HAWK ZH they go into the associated leptons and the photon is deleted
+      if args.zh_lep_hawk:
+        lhefilekwargs["photonmerger"] = functools.partial(merge_photons_into_associated, cone=args.photon_cone)
+      if args.merge_photon and args.ggH4l:
+        lhefilekwargs["photonmerger"] = functools.partial(merge_photons_into_daughters, cone=args.photon_cone)
+      if args.ggH4lMG:
+        lhefilekwargs["weightlayout"] = WeightLayout.from_header(lhe_reader.read_head(inputfile).decode()) #this file's order of the same weights
+        if sorted(lhefilekwargs["weightlayout"].ids) != weightlayout.sortedids:
+          raise ValueError(inputfile + " has different weights than " + args.inputfile[0])
+      inputfclass = lhefileclass(inputfile,isgen=args.use_flavor,byterange=byterange,**lhefilekwargs)
 
       #inputfclass = LHEFile_Hwithdecay(inputfile,isgen=args.use_flavor)
       
@@ -317,239 +1006,19 @@ def main(raw_args=None):
           for d in event.daughters: 
             flav4l = flav4l*d.first
             #print "init :",d.first,d.second.Px(),d.second.Py(),d.second.Pz(),d.second.E()
-          # this section merges the EW emitted photon to the closest lepton and updates the daugthers collection for Prophecy
-          # and associated for HAWK ZH, before the calculation of angles and probabilities for decay by MELA. The photon is
-          #still stored in  the associated collection for references for Prophecy. For HAWK it is deleted.  
-
-
-          if (args.zh_lep_hawk)  :   
-
-            for ipho, p in enumerate(event.associated):
-
-              if not (  p.first == 22)  :
-                continue
-              k = p.second
-              mindr = 9999
-              newlep = ROOT.TLorentzVector()
-
-              photonvector = ROOT.TLorentzVector()
-              lepp = ROOT.TLorentzVector()
-              photonvector.SetPtEtaPhiM(k.Pt(), k.Eta(),k.Phi(), k.M())
-              #print "photon:",p.first,p.second.Px(),p.second.Py(),p.second.Pz(),p.second.E()
-              i_newlep = 0        
-              for ilep, d in enumerate(event.associated):
-                if not( d.first == 22 )  : 
-                  lep = d.second
-                  d_lor = ROOT.TLorentzVector()            
-                  d_lor.SetPtEtaPhiM(lep.Pt(), lep.Eta(),lep.Phi(), lep.M())
-                  dr =  k.DeltaR(d_lor)
-                  if dr < mindr :
-                    lepp.SetPtEtaPhiM(lep.Pt(), lep.Eta(),lep.Phi(), lep.M())
-                    mindr = dr
-                    i_newlep = ilep                  
-              newlep = lepp  + photonvector 
-              event.associated.pop_back()
-              event.associated[i_newlep].second = newlep
-              # re-initiate the event with the new associated particles  this only works for HAWK events!!!
-              eventt = event
-              event.mela.setInputEvent(eventt.daughters, eventt.associated, eventt.mothers)
-
-
-
-
-          if (args.merge_photon and args.ggH4l)  :   
-
-            for p in event.associated:
-
-              if not (  p.first == 22)  :
-                continue
-              k = p.second
-              mindr = 9999
-              newlep = ROOT.TLorentzVector()
-
-              photonvector = ROOT.TLorentzVector()
-              lepp = ROOT.TLorentzVector()
-              photonvector.SetPtEtaPhiM(k.Pt(), k.Eta(),k.Phi(), k.M())
-              #print "photon:",p.first,p.second.Px(),p.second.Py(),p.second.Pz(),p.second.E()
-              i_newlep = 0        
-              for ilep, d in enumerate(event.daughters): 
-                lep = d.second
-                d_lor = ROOT.TLorentzVector()            
-                d_lor.SetPtEtaPhiM(lep.Pt(), lep.Eta(),lep.Phi(), lep.M())
-                dr =  k.DeltaR(d_lor)
-                if dr < mindr :
-                  lepp.SetPtEtaPhiM(lep.Pt(), lep.Eta(),lep.Phi(), lep.M())
-                  mindr = dr
-                  i_newlep = ilep  
-
-              newlep = lepp  + photonvector 
-              event.daughters[i_newlep].second = newlep
-              # re-initiate the event with the new daughters this only works for Prophecy events!!!
-              eventt = event
-              event.mela.setInputEvent(eventt.daughters, eventt.associated, eventt.mothers)
-    
-                  
+          #the FSR photons were already merged for the whole chunk by the photonmerger given to the LHE file
+
           #Probabilities
           #event.setProcess(TVar. HSMHiggs,TVar.JHUGen,process)
           if args.calc_decayprob : 
             # decayP works only for the process below 
-            #everytime you call a compute Prob function all the couplings
-            #are reset and have to be redefined. 
-
             process = TVar.ZZINDEPENDENT
-            event.setProcess(TVar.SelfDefine_spin0,TVar.JHUGen,process)
-            event.ghz2 = 1
-            branches["pg2"][0] = event.computeP()
-                    
-            event.setProcess(TVar.HSMHiggs,TVar.JHUGen,process)
-            event.ghz1 = 2      
-            branches["pg1"][0] = event.computeP()
-          
-            event.setProcess(TVar.SelfDefine_spin0,TVar.JHUGen,process)
-            event.ghz4 = 1
-            branches["pg4"][0] = event.computeP()
-                              
-            event.setProcess(TVar.SelfDefine_spin0, TVar.JHUGen, process)
-            event.ghz1 = 1
-            event.ghz4 = 1
-            branches["pg1g4"][0] = event.computeP() - branches["pg1"][0] - branches["pg4"][0]
-          
-            event.setProcess(TVar.SelfDefine_spin0,TVar.JHUGen,process)
-            event.ghz1 = 1
-            event.ghz2 = 1        
-            branches["pg1g2"][0] = event.computeP() - branches["pg1"][0] - branches["pg2"][0]
-
-
-            
-
-            
-            c_0hplus = 1
-            c_0minus = 1 
-            if ( process ==  TVar.ZZINDEPENDENT  ) : 
-              c_0minus = 2.55497301342
-              c_0hplus = 1.66326995046
-
-
-              
-            branches["D0minus"][0] = branches["pg1"][0] / (branches["pg1"][0] + c_0minus*c_0minus*branches["pg4"][0])
-            branches["D0hplus"][0] = branches["pg1"][0] / (branches["pg1"][0] + c_0hplus*c_0hplus*branches["pg2"][0])
-            branches["DCP"][0] = branches["pg1g4"][0] / (2 * (branches["pg1"][0] * branches["pg4"][0]) ** 0.5)
-            branches["Dint"][0] = branches["pg1g2"][0] / (2 * (branches["pg1"][0] * branches["pg2"][0]) ** 0.5)
-            #branches["DCP_old"][0] = branches["pg1g4"][0] / (branches["pg1"][0] + branches["pg4"][0])
+            if not args.calc_prodprob or not decayhypotheses.branchnames <= productionhypotheses.branchnames:
+              decayhypotheses.fill(event, process, branches) #skipped when the production probabilities overwrite all of it
 
           if args.calc_prodprob :
-            
-            event.setProcess(TVar.SelfDefine_spin0,TVar.JHUGen,process)
-            event.ghz1 = 0
-            event.ghz2 = 1
-            branches["pg2"][0] = event.computeProdP()
-            #print "g2 :",event.ghz2,branches["pg2"][0]
-            
-            
-            event.setProcess(TVar. HSMHiggs,TVar.JHUGen,process)
-            event.ghz1 = 1
-            branches["pg1"][0] = event.computeProdP()
-            #print "g1 :",branches["pg1"][0]
-
-            event.setProcess(TVar.SelfDefine_spin0,TVar.JHUGen,process)
-            event.ghz4 = 1
-            branches["pg4"][0] = event.computeProdP()
-            #print "g4 :",branches["pg4"][0]
-
-                      
-            event.setProcess(TVar.SelfDefine_spin0, TVar.JHUGen, process)
-            event.ghz1 = 1
-            event.ghz4 = 1
-            branches["pg1g4"][0] = event.computeProdP() - branches["pg1"][0] - branches["pg4"][0]
-            #print "g1g4 :",branches["pg1g4"][0]
-
-            event.setProcess(TVar.SelfDefine_spin0,TVar.JHUGen,process)
-            event.ghz1 = 1
-            event.ghz2 = 1        
-            branches["pg1g2"][0] = event.computeProdP() - branches["pg1"][0] - branches["pg2"][0]
-            #print "g1g2 :",branches["pg1g2"][0]
-
-            #added zgamma discr Prod
-            
-            event.setProcess(TVar.SelfDefine_spin0,TVar.JHUGen,process)
-            event.ghz1 = 0
-            event.ghzgs2 = 1        
-            branches["pg2za"][0] = event.computeProdP()
-
-            event.setProcess(TVar.SelfDefine_spin0,TVar.JHUGen,process)
-            event.ghz1 = 0
-            event.ghzgs4 = 1        
-            branches["pg4za"][0] = event.computeProdP()
-            
-
-            
-            event.setProcess(TVar.SelfDefine_spin0,TVar.JHUGen,process)
-            event.ghz1 = 1
-            event.ghzgs2 = 1        
-            branches["pg1g2za"][0] = event.computeProdP() - branches["pg1"][0] - branches["pg2za"][0]
-            
-
-            event.setProcess(TVar.SelfDefine_spin0,TVar.JHUGen,process)
-            event.ghz1 = 1
-            event.ghzgs4 = 1        
-            branches["pg1g4za"][0] = event.computeProdP() - branches["pg1"][0] - branches["pg4za"][0]
-            
-            event.setProcess(TVar.SelfDefine_spin0,TVar.JHUGen,process)
-            event.ghz1 = 0
-            event.ghgsgs2 = 1
-            branches["pg2aa"][0] = event.computeProdP()
-
-            event.setProcess(TVar.SelfDefine_spin0,TVar.JHUGen,process)
-            event.ghz1 = 0
-            event.ghgsgs4 = 1
-            branches["pg4aa"][0] = event.computeProdP()
-
-
+            productionhypotheses.fill(event, process, branches)
 
-            event.setProcess(TVar.SelfDefine_spin0,TVar.JHUGen,process)
-            event.ghz1 = 1
-            event.ghgsgs2 = 1
-            branches["pg1g2aa"][0] = event.computeProdP() - branches["pg1"][0] - branches["pg2aa"][0]
-
-
-            event.setProcess(TVar.SelfDefine_spin0,TVar.JHUGen,process)
-            event.ghz1 = 1
-            event.ghgsgs4 = 1
-            branches["pg1g4aa"][0] = event.computeProdP() - branches["pg1"][0] - branches["pg4aa"][0]
-
-
-
-            c_0hplus = 1
-            c_0minus = 1 
-            if ( process == TVar.Had_ZH ) :
-              c_0hplus = 0.130395173298
-              c_0minus = 0.104503154335
-              c_0hplusza = 0.130395173298
-              c_0minusza = 0.104503154335
-            if ( process == TVar.JJVBF  ) :   
-              c_0minus = 0.297979440554
-              c_0hplus = 0.271880048944
-            if ( process ==  TVar.ZZGG  ) : 
-              c_0minus = 2.55497301342
-              c_0hplus = 1.66326995046
-
-
-              
-            branches["D0minus"][0] = branches["pg1"][0] / (branches["pg1"][0] + c_0minus*c_0minus*branches["pg4"][0])
-            branches["D0hplus"][0] = branches["pg1"][0] / (branches["pg1"][0] + c_0hplus*c_0hplus*branches["pg2"][0])
-            branches["DCP"][0] = branches["pg1g4"][0] / (2 * (branches["pg1"][0] * branches["pg4"][0]) ** 0.5)
-            branches["Dint"][0] = branches["pg1g2"][0] / (2 * (branches["pg1"][0] * branches["pg2"][0]) ** 0.5)
-
-            '''
-            branches["D0minus_za"][0] = branches["pg1"][0] / (branches["pg1"][0] + c_0minusza*c_0minusza*branches["pg4za"][0])
-            branches["D0hplus_za"][0] = branches["pg1"][0] / (branches["pg1"][0] + c_0hplusza*c_0hplusza*branches["pg2za"][0])
-            branches["DCP_za"][0] = branches["pg1g4za"][0] / (2 * (branches["pg1"][0] * branches["pg4za"][0]) ** 0.5)
-            branches["Dint_za"][0] = branches["pg1g2za"][0] / (2 * (branches["pg1"][0] * branches["pg2za"][0]) ** 0.5)
-            ''' 
-
-
-            #branches["DCP_old"][0] = branches["pg1g4"][0] / (branches["pg1"][0] + branches["pg4"][0])
-    
 
 
 
@@ -557,97 +1026,30 @@ def main(raw_args=None):
 
             
           if args.zh or args.wh or args.zh_lep or args.wh_lep or args.zh_lep_hawk:
-            branches["mV"][0], branches["mVstar"][0], branches["costheta1"][0], branches["costheta2"][0], branches["Phi"][0], branches["costhetastar"][0], branches["Phi1"][0]= event.computeVHAngles(process)
+            with profiler.stage("computeVHAngles"):
+              branches["mV"][0], branches["mVstar"][0], branches["costheta1"][0], branches["costheta2"][0], branches["Phi"][0], branches["costhetastar"][0], branches["Phi1"][0]= event.computeVHAngles(process)
           elif args.zh_withdecay or args.wh_withdecay :
-            branches["mV"][0], branches["mVstar"][0], branches["costheta1"][0], branches["costheta2"][0], branches["Phi"][0], branches["costhetastar"][0], branches["Phi1"][0]= event.computeVHAngles(process)
-            branches["M4L"][0], branches["MZ1"][0], branches["MZ2"][0], branches["costheta1d"][0],branches["costheta2d"][0], branches["Phid"][0], branches["costhetastard"][0], branches["Phi1d"][0]= event.computeDecayAngles()
+            with profiler.stage("computeVHAngles"):
+              branches["mV"][0], branches["mVstar"][0], branches["costheta1"][0], branches["costheta2"][0], branches["Phi"][0], branches["costhetastar"][0], branches["Phi1"][0]= event.computeVHAngles(process)
+            with profiler.stage("computeDecayAngles"):
+              branches["M4L"][0], branches["MZ1"][0], branches["MZ2"][0], branches["costheta1d"][0],branches["costheta2d"][0], branches["Phid"][0], branches["costhetastard"][0], branches["Phi1d"][0]= event.computeDecayAngles()
             #branches["mV"][0] = sum((particle.second for particle in event.associated), ROOT.TLorentzVector()).M()
             #branches["mVstar"][0] = sum((particle.second for particle in itertools.chain(event.daughters, event.associated)), ROOT.TLorentzVector()).M()
           elif args.vbf:
-            branches["q2V1"][0], branches["q2V2"][0], branches["costheta1"][0], branches["costheta2"][0], branches["Phi"][0], branches["costhetastar"][0], branches["Phi1"][0]= event.computeVBFAngles()
-            branches["HJJpz"][0] = sum((particle.second for particle in itertools.chain(event.daughters, event.associated)), ROOT.TLorentzVector()).Pz()
-
-            pj1 = event.associated[0].second
-            pj2 = event.associated[1].second
-            if pj1.Pt() > pj2.Pt() :
-              branches["Dphijj"][0] = pj1.DeltaPhi(pj2)
-            else:
-              branches["Dphijj"][0] = pj2.DeltaPhi(pj1)
+            with profiler.stage("computeVBFAngles"):
+              branches["q2V1"][0], branches["q2V2"][0], branches["costheta1"][0], branches["costheta2"][0], branches["Phi"][0], branches["costhetastar"][0], branches["Phi1"][0]= event.computeVBFAngles()
           elif args.vbf_withdecay:
-            branches["q2V1"][0], branches["q2V2"][0], branches["costheta1"][0], branches["costheta2"][0], branches["Phi"][0], branches["costhetastar"][0], branches["Phi1"][0]= event.computeVBFAngles()
-            branches["HJJpz"][0] = sum((particle.second for particle in itertools.chain(event.daughters, event.associated)), ROOT.TLorentzVector()).Pz()
-            branches["M4L"][0], branches["MZ1"][0], branches["MZ2"][0], branches["costheta1d"][0],branches["costheta2d"][0], branches["Phid"][0], branches["costhetastard"][0], branches["Phi1d"][0]= event.computeDecayAngles()
-            pj1 = event.associated[0].second
-            branches["pxj1"][0] = pj1.Px()
-            branches["pyj1"][0] = pj1.Py()
-            branches["pzj1"][0] = pj1.Pz()
-            branches["Ej1"][0] = pj1.E()
-            pj2 = event.associated[1].second
-            branches["pxj2"][0] = pj2.Px()
-            branches["pyj2"][0] = pj2.Py()
-            branches["pzj2"][0] = pj2.Pz()
-            branches["Ej2"][0] = pj2.E()
+            with profiler.stage("computeVBFAngles"):
+              branches["q2V1"][0], branches["q2V2"][0], branches["costheta1"][0], branches["costheta2"][0], branches["Phi"][0], branches["costhetastar"][0], branches["Phi1"][0]= event.computeVBFAngles()
+            with profiler.stage("computeDecayAngles"):
+              branches["M4L"][0], branches["MZ1"][0], branches["MZ2"][0], branches["costheta1d"][0],branches["costheta2d"][0], branches["Phid"][0], branches["costhetastard"][0], branches["Phi1d"][0]= event.computeDecayAngles()
 
 
 
           elif args.ggH4l or args.ggH4lMG:
-            branches["M4L"][0], branches["MZ1"][0], branches["MZ2"][0], branches["costheta1d"][0],branches["costheta2d"][0], branches["Phid"][0], branches["costhetastard"][0], branches["Phi1d"][0]= event.computeDecayAngles()
+            with profiler.stage("computeDecayAngles"):
+              branches["M4L"][0], branches["MZ1"][0], branches["MZ2"][0], branches["costheta1d"][0],branches["costheta2d"][0], branches["Phid"][0], branches["costhetastard"][0], branches["Phi1d"][0]= event.computeDecayAngles()
           #print i,branches["M4L"][0], branches["MZ1"][0], branches["MZ2"][0],len(event.associated)
-          pH = sum((particle.second for particle in event.daughters), ROOT.TLorentzVector())
-          if args.ggH4l:
-            if( len(event.associated) > 0):
-              ph1 = event.associated[0].second
-              pHph = pH + ph1 
-              branches["pxph1"][0] = pHph.Px()
-              branches["pyph1"][0] = pHph.Py()
-              branches["pzph1"][0] = pHph.Pz()
-              branches["Eph1"][0]  = pHph.E()
-
-          else:     
-            branches["ptH"][0] = pH.Pt()
-            branches["pxH"][0] = pH.Px()
-            branches["pyH"][0] = pH.Py()
-            branches["pzH"][0] = pH.Pz()
-            branches["EH"][0] = pH.E()
-            branches["rapH"][0] = pH.Rapidity()
-                  
-          if not args.vbf and not args.zh and not args.wh and not args.zh_lep and not args.wh_lep and not args.zh_lep_hawk: 
-            pdau1 = event.daughters[0].second
-            branches["ptdau1"][0] = pdau1.Pt()
-            branches["pxdau1"][0] = pdau1.Px()
-            branches["pydau1"][0] = pdau1.Py()
-            branches["pzdau1"][0] = pdau1.Pz()
-            branches["Edau1"][0] = pdau1.E()
-            branches["flavdau1"][0] = event.daughters[0].first
-            
-            
-            pdau2 = event.daughters[1].second
-            branches["ptdau2"][0] = pdau2.Pt()
-            branches["pxdau2"][0] = pdau2.Px()
-            branches["pydau2"][0] = pdau2.Py()
-            branches["pzdau2"][0] = pdau2.Pz()
-            branches["Edau2"][0] = pdau2.E()
-            branches["flavdau2"][0] = event.daughters[1].first
-            
-            pdau3 = event.daughters[2].second
-            branches["ptdau3"][0] = pdau3.Pt()
-            branches["pxdau3"][0] = pdau3.Px()
-            branches["pydau3"][0] = pdau3.Py()
-            branches["pzdau3"][0] = pdau3.Pz()
-            branches["Edau3"][0] = pdau3.E()
-            branches["flavdau3"][0] = event.daughters[2].first
-            
-            
-            pdau4 = event.daughters[3].second
-            branches["ptdau4"][0] = pdau4.Pt()
-            branches["pxdau4"][0] = pdau4.Px()
-            branches["pydau4"][0] = pdau4.Py()
-            branches["pzdau4"][0] = pdau4.Pz()
-            branches["Edau4"][0] = pdau4.E()
-            branches["flavdau4"][0] = event.daughters[3].first
-            
-          
-
           if args.ggH4l:
             #add FSR photon to the root file 
             if( len(event.associated) > 0):
@@ -657,19 +1059,7 @@ def main(raw_args=None):
               branches["pzph1"][0] = ph1.Pz()
               branches["Eph1"][0] = ph1.E()
 
-          if args.vbf or args.zh or args.wh  or args.zh_lep_hawk:     
-            pj1 = event.associated[0].second
-            branches["pxj1"][0] = pj1.Px()
-            branches["pyj1"][0] = pj1.Py()
-            branches["pzj1"][0] = pj1.Pz()
-            branches["Ej1"][0] = pj1.E()          
-            pj2 = event.associated[1].second
-            branches["pxj2"][0] = pj2.Px()
-            branches["pyj2"][0] = pj2.Py()
-            branches["pzj2"][0] = pj2.Pz()
-            branches["Ej2"][0] = pj2.E()
-            phjj = pH + pj1 + pj2
-            branches["rapHJJ"][0] = phjj.Rapidity()
+          #pH, the jets, rapHJJ, Dphijj, ptV and the daughter kinematics are computed for the whole batch in kinematic_branches
 
           if args.MELAcalc:
             if len(event.associated) > 0:
@@ -778,33 +1168,39 @@ def main(raw_args=None):
               branches["LHEMotherPz"][1] = 0
               branches["LHEMotherE"][1] = 0
 
-          if args.zh or args.wh or args.zh_lep_hawk:
-            branches["ptV"][0] = np.sqrt((pj1.Px()+pj2.Px())**2+(pj1.Py()+pj2.Py())**2)
-          
           if args.ggH4lMG:
-            key_sorted=sorted(event.weights)
-            list_weights=[]
-            for key in key_sorted:
-              list_weights.append(event.weights.get(key,None))
-            for j in range(len(list_weights)):
-              branches["weights"][j] = list_weights[j]
-            print(branches["weights"])
+            branches["weights"][:] = event.weights #NaN for weights this event does not have
           else:
             branches["weight"][0] = event.weight
                 # print "FIlling!"
-          t.Fill()
+          with profiler.stage("snapshot"):
+            full = branchbuffer.snapshot(event.lhedaughters, event.lheassociated)
+          if full:
+            fillbatch()
+            if checkpointing and writer.entries - lastcheckpoint >= args.checkpoint_every:
+              with profiler.stage("checkpoint"):
+                write_checkpoint(args, writer, inputindex, f.byteoffset)
+              lastcheckpoint = writer.entries
         # print("Processed", i+1, "events")
 
-    newf.Write()
+    fillbatch()
+    with profiler.stage("write"):
+      writer.close()
+    if os.path.exists(checkpointfile):
+      os.remove(checkpointfile)
   except:
     bad = True
     raise
   finally:
-    if bad:
+    if bad and os.path.exists(checkpointfile):
+      print("The output up to the last checkpoint is kept in", args.outputfile, "- rerun with --resume to continue")
+    elif bad:
       try:
         os.remove(args.outputfile)
       except:
         pass
+  profiler.stop()
+  return profiler
 
 
 if __name__ == "__main__":
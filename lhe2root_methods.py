@@ -1,11 +1,17 @@
 import os
-import re
+import multiprocessing
+import multiprocessing.connection
 import uproot
-import pandas as pd
 import numpy as np
 import mplhep as hep
 import useful_funcs_and_constants
 import lhe_reader
+import conversion_manifest
+import lhe_compression
+import lhe_slicer
+import cut_engine
+import histogram_cache
+import collections
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import warnings
@@ -40,8 +46,209 @@ def scale(scaleto, counts, bins=[]):
     return signs*counts*scaleto/np.sum(counts)
 
 
+def find_LHE_files(current_directory, exceptions=set()):
+    """Finds every LHE file in a directory and the subdirectories below it the same way recursively_convert does
+
+    Parameters
+    ----------
+    current_directory : str
+        The directory to start recursing downwards from
+    exceptions : set, optional
+        Any directory with one of these strings anywhere in its path will not be entered, by default set()
+
+    Returns
+    -------
+    list[str]
+        The paths of every LHE file found
+    """
+    lhe_files = []
+    for candidate in os.listdir(current_directory):
+        candidate = current_directory + '/' + os.fsdecode(candidate)
+        
+        if os.path.isdir(candidate):
+            if not any(exemption in candidate for exemption in exceptions):
+                lhe_files += find_LHE_files(candidate, exceptions)
+        elif lhe_compression.is_lhe_filename(candidate):
+            lhe_files.append(candidate)
+    
+    return lhe_files
+
+
+def prepare_LHE_file(candidate, cut_down_to=-1, verbose=False):
+    """Makes the reader for an LHE file that is about to be converted, cutting the file down first if asked to
+
+    Parameters
+    ----------
+    candidate : str
+        The LHE file
+    cut_down_to : int, optional
+        The number of events you want in the LHE file before converting. Negative numbers mean all events will be kept, by default -1
+    verbose : bool, optional
+        If true, the function will be verbose, by default False
+
+    Returns
+    -------
+    lhe_reader.lhe_reader
+        The reader for the file that should be converted
+    """
+    reader = lhe_reader.lhe_reader(candidate)
+    cut_down_filename = candidate.split('.')[0] + "_cut_down_to" + str(cut_down_to) + '.lhe'
+    if cut_down_to > 0 and not os.path.isfile(candidate.split('.')[0] + "_cut_down_to" + str(cut_down_to) + '.lhe'):
+        candidate = cut_down_filename
+        if verbose:
+            print("Cutting down file to", cut_down_to, "events in file", candidate)
+        
+        lhe_slicer.slice_lhe_file(reader.lhefile, candidate, cut_down_to)
+        
+        reader = lhe_reader.lhe_reader(candidate)#reset the reader and the candidate to the new cut down file
+    
+    return reader
+
+
+def manifest_check(reader, argument, other_args, output_directory, outfile_prefix='LHE', clean=False, manifest=None):
+    """Decides whether an LHE file needs to be converted given the conversion manifest
+
+    Parameters
+    ----------
+    reader : lhe_reader.lhe_reader
+        The reader for the LHE file
+    argument : str
+        the lhe2root conversion option to use
+    other_args : list[str]
+        The other lhe2root arguments
+    output_directory : str
+        The directory to output results to
+    outfile_prefix : str, optional
+        The prefix to attach to the generated ROOT files, by default "LHE"
+    clean : bool, optional
+        If True, the file is always re-converted, by default False
+    manifest : conversion_manifest.ConversionManifest, optional
+        The manifest of earlier conversions. If None, an existing output is only replaced when clean is set, by default None
+
+    Returns
+    -------
+    Tuple[bool, bool, dict]
+        Whether the file should be converted, whether an existing output should be replaced, 
+        and the fingerprint of the input to record once it is converted (None without a manifest)
+    """
+    if manifest is None:
+        return True, clean, None
+    
+    outfile = reader.output_path(output_directory, outfile_prefix)
+    checkpoint = useful_funcs_and_constants.checkpoint_filename(outfile)
+    if not clean and not os.path.isfile(checkpoint) and manifest.adopt(reader.lhefile, argument, other_args, outfile):
+        return False, False, None #outputs from before the manifest existed are kept, as they would be without it
+    
+    fingerprint = manifest.fingerprint(reader.lhefile)
+    if not clean and manifest.is_current(reader.lhefile, argument, other_args, outfile, fingerprint):
+        return False, False, fingerprint
+    
+    if not clean and os.path.isfile(checkpoint):
+        return True, False, fingerprint #an unfinished conversion is resumed rather than replaced
+    
+    return True, True, fingerprint #anything not in the manifest (or changed since) is stale
+
+
+def _convert_in_subprocess(lhefile, argument, env, other_args, output_directory, outfile_prefix, verbose, replace):
+    """Converts a single LHE file with to_ROOT. This is the target of every process started by parallel_convert"""
+    lhe_reader.lhe_reader(lhefile).to_ROOT(argument, env, other_args, output_directory, outfile_prefix, verbose, replace)
+
+
+def parallel_convert(env, readers, output_directory, argument, other_args=[], clean=False, verbose=False, 
+                     outfile_prefix='LHE', jobs=2, retries=1, manifest=None):
+    """Converts many LHE files at once, each in its own process, so that a crash (even a segfault in MELA)
+    only fails that one file. Files are started from largest to smallest so that the biggest ones don't finish last,
+    and failed files are retried
+
+    Parameters
+    ----------
+    env : dict
+        This contains the lhe2root environment variables by doing dict(os.environ) in a main method
+    readers : list[lhe_reader.lhe_reader]
+        The readers for the LHE files to convert
+    output_directory : str
+        The directory to output results to
+    argument : str
+        the lhe2root conversion option to use (see lhe_2_root_options in useful_funcs_and_constants)
+    other_args : list[str]
+        The other lhe2root arguments that can be used (see lhe_2_root_args in useful_funcs_and_constants), by default []
+    clean : bool, optional
+        If True, this function will wipe any old conversion and re-convert the files, by default False
+    verbose : bool, optional
+        If true, the function will be verbose, by default False
+    outfile_prefix : str, optional
+        The prefix to attach to the generated ROOT files, by default "LHE"
+    jobs : int, optional
+        The number of conversions to run at the same time, by default 2
+    retries : int, optional
+        The number of times a failed conversion is tried again, by default 1
+    manifest : conversion_manifest.ConversionManifest, optional
+        If given, files that are current in the manifest are skipped and every finished conversion is recorded in it, by default None
+
+    Returns
+    -------
+    dict
+        Returns a dictionary with the cross section/uncertainty pairs for every file that was converted
+    """
+    context = multiprocessing.get_context("spawn") #every conversion starts from a clean ROOT/MELA state
+    queue = []
+    fingerprints = {}
+    replacements = {}
+    cross_sections = {}
+    for reader in readers:
+        convert, replace, fingerprints[reader.lhefile] = manifest_check(reader, argument, other_args, output_directory, outfile_prefix, clean, manifest)
+        if convert:
+            queue.append(reader)
+            replacements[reader.lhefile] = replace
+        else:
+            cross_sections[reader.output_path(output_directory, outfile_prefix)] = reader.cross_section
+    
+    queue.sort(key=lambda reader: os.path.getsize(reader.lhefile), reverse=True)
+    attempts = {reader.lhefile: 0 for reader in queue}
+    running = {}
+    failed = []
+    
+    while queue or running:
+        while queue and len(running) < jobs:
+            reader = queue.pop(0)
+            process = context.Process(target=_convert_in_subprocess, 
+                                      args=(reader.lhefile, argument, env, other_args, output_directory, outfile_prefix, verbose, replacements[reader.lhefile]))
+            process.start()
+            running[process] = reader
+        
+        multiprocessing.connection.wait([process.sentinel for process in running])
+        
+        for process in [process for process in running if not process.is_alive()]:
+            reader = running.pop(process)
+            process.join()
+            outfile = reader.output_path(output_directory, outfile_prefix)
+            
+            if process.exitcode == 0:
+                cross_sections[outfile] = reader.cross_section
+                if manifest is not None:
+                    manifest.record(reader.lhefile, argument, other_args, outfile, fingerprints[reader.lhefile])
+                continue
+            
+            if os.path.isfile(useful_funcs_and_constants.checkpoint_filename(outfile)):
+                replacements[reader.lhefile] = False #the retry resumes from the last checkpoint
+            elif os.path.isfile(outfile): #a crashed conversion can leave a partial file behind, which would be mistaken for a finished one
+                os.remove(outfile)
+            
+            attempts[reader.lhefile] += 1
+            if attempts[reader.lhefile] <= retries:
+                print("Conversion of", reader.lhefile, "failed with exit code", process.exitcode, "- retrying")
+                queue.insert(0, reader)
+            else:
+                failed.append(reader.lhefile)
+    
+    if failed:
+        warnings.warn("\nThese files failed to convert:\n" + "\n".join(failed) + "\n", UserWarning)
+    
+    return cross_sections
+
+
 def recursively_convert(env, current_directory, output_directory, argument, other_args=[], clean=False, verbose=False, exceptions=set(), 
-                        outfile_prefix='LHE', cut_down_to=-1, write=""):
+                        outfile_prefix='LHE', cut_down_to=-1, write="", jobs=1, retries=1, manifest=".lhe2root_manifest.json"):
     """This function will recurse through every directory and subdirectory in the place you call it, 
     and attempt to convert those files to ROOT files using lhe2root
 
@@ -72,6 +279,16 @@ def recursively_convert(env, current_directory, output_directory, argument, othe
         The number of events you want in the LHE file before converting. Negative numbers mean all events will be kept, by default -1
     write : str, optional
         If a string, this will be the file that you will write the cross sections to. The file will be comma-separated, by default ""
+    jobs : int, optional
+        If > 1, every LHE file is found first and then converted in parallel by parallel_convert with this many processes, by default 1
+    retries : int, optional
+        The number of times a failed conversion is tried again when jobs > 1, by default 1
+    manifest : str or conversion_manifest.ConversionManifest, optional
+        The file in the output directory that records every conversion (see conversion_manifest).
+        Files whose input, lhe2root settings and output are unchanged since they were recorded are skipped,
+        and everything else is re-converted. An existing output that is not in the manifest yet is kept and recorded
+        with the settings of this run unless clean is set, so the first run on an already converted tree converts nothing.
+        If "" or None, existing outputs are only replaced when clean is set, by default ".lhe2root_manifest.json"
 
     Returns
     -------
@@ -89,47 +306,53 @@ def recursively_convert(env, current_directory, output_directory, argument, othe
     if not os.path.isdir(output_directory):
         raise FileNotFoundError(output_directory + " is not a directory!")
     
+    if isinstance(manifest, str):
+        manifest = conversion_manifest.ConversionManifest(output_directory + manifest) if manifest else None
+    
     cross_sections = {}
     
-    for candidate in os.listdir(current_directory):
-        # print(candidate)
-        candidate = os.fsdecode(candidate)
+    if jobs > 1:
+        readers = [prepare_LHE_file(candidate, cut_down_to, verbose) for candidate in find_LHE_files(current_directory, exceptions)]
+        cross_sections = parallel_convert(env, readers, output_directory, argument, other_args, clean, verbose, outfile_prefix, jobs, retries, manifest)
+    
+    else:
+        for candidate in os.listdir(current_directory):
+            # print(candidate)
+            candidate = os.fsdecode(candidate)
         
-        candidate = current_directory + '/' + candidate
-        # print(candidate)
+            candidate = current_directory + '/' + candidate
+            # print(candidate)
         
-        is_exempt = False
-        for exemption in exceptions: #check all the exempted folders
-            if exemption in candidate: #if the keyword is ANYWHERE in the file path, ignore it!
-                is_exempt = True
+            is_exempt = False
+            for exemption in exceptions: #check all the exempted folders
+                if exemption in candidate: #if the keyword is ANYWHERE in the file path, ignore it!
+                    is_exempt = True
         
         
-        if (os.path.isdir(candidate)) and (not is_exempt): #convert all the LHE files in every directory below you that are not exempt
-            one_folder_below = recursively_convert(env, candidate, output_directory, argument, other_args, clean, verbose, exceptions)
-            cross_sections.update(one_folder_below) #updates the dictionary
+            if (os.path.isdir(candidate)) and (not is_exempt): #convert all the LHE files in every directory below you that are not exempt
+                one_folder_below = recursively_convert(env, candidate, output_directory, argument, other_args, clean, verbose, exceptions,
+                                                       outfile_prefix, cut_down_to, manifest=manifest)
+                cross_sections.update(one_folder_below) #updates the dictionary
         
-        if candidate.split('.')[-1] != 'lhe':
-        #     if clean and candidate.split['.'][-1] == '.root':
-        #         useful_funcs_and_constants.print_msg_box("Removing " + candidate, title="Cleaning directory " + current_directory)
-        #         os.remove(candidate)
+            if not lhe_compression.is_lhe_filename(candidate):
+            #     if clean and candidate.split['.'][-1] == '.root':
+            #         useful_funcs_and_constants.print_msg_box("Removing " + candidate, title="Cleaning directory " + current_directory)
+            #         os.remove(candidate)
                 
-            continue
+                continue
         
-        else:            
-            reader = lhe_reader.lhe_reader(candidate)
-            cut_down_filename = candidate.split('.')[0] + "_cut_down_to" + str(cut_down_to) + '.lhe'
-            if cut_down_to > 0 and not os.path.isfile(candidate.split('.')[0] + "_cut_down_to" + str(cut_down_to) + '.lhe'):
-                candidate = cut_down_filename
-                if verbose:
-                    print("Cutting down file to", cut_down_to, "events in file", candidate)
-                
-                with open(candidate, 'w+') as f:
-                    f.write(reader.cut_down_to_size(cut_down_to))
-                
-                reader = lhe_reader.lhe_reader(candidate)#reset the reader and the candidate to the new cut down file
-                
-            outfile = reader.to_ROOT(argument, env, other_args, output_directory, outfile_prefix, verbose, clean)
-            cross_sections[outfile] = reader.cross_section
+            else:            
+                reader = prepare_LHE_file(candidate, cut_down_to, verbose)
+                convert, replace, fingerprint = manifest_check(reader, argument, other_args, output_directory, outfile_prefix, clean, manifest)
+                if convert:
+                    outfile = reader.to_ROOT(argument, env, other_args, output_directory, outfile_prefix, verbose, replace)
+                    if manifest is not None:
+                        manifest.record(reader.lhefile, argument, other_args, outfile, fingerprint)
+                else:
+                    outfile = reader.output_path(output_directory, outfile_prefix)
+                    if verbose:
+                        print(outfile, "is up to date")
+                cross_sections[outfile] = reader.cross_section
     
     if write:
         print("Dumping Cross Sections to", output_directory + write)
@@ -142,14 +365,267 @@ def recursively_convert(env, current_directory, output_directory, argument, othe
 
 
 
+def read_dataframe(filename, columns=None):
+    """Reads the tree of an lhe2root output file into a DataFrame. 
+    ROOT files are read with uproot, and Parquet (.parquet) and Arrow IPC (.arrow, .feather) files are memory-mapped with pyarrow
+
+    Parameters
+    ----------
+    filename : str
+        The output file
+    columns : list[str], optional
+        The branches to read. If None, every branch is read, by default None
+
+    Returns
+    -------
+    pandas.DataFrame
+        A DataFrame with one row per event
+    """
+    extension = filename.split('.')[-1]
+    if extension == 'parquet':
+        import pyarrow.parquet
+        return pyarrow.parquet.read_table(filename, columns=columns, memory_map=True).to_pandas()
+    
+    if extension in ('arrow', 'feather'):
+        import pyarrow
+        table = pyarrow.ipc.open_file(pyarrow.memory_map(filename)).read_all() #the table keeps the map open for as long as it needs it
+        if columns is not None:
+            table = table.select(columns)
+        return table.to_pandas()
+    
+    with uproot.open(filename) as f:
+        return f[f.keys()[0]].arrays(columns, library='pd')
+
+
+def list_columns(filename):
+    """The names of the branches in the tree of an lhe2root output file (ROOT, Parquet or Arrow, see read_dataframe)
+
+    Parameters
+    ----------
+    filename : str
+        The output file
+
+    Returns
+    -------
+    list[str]
+        The branch names
+    """
+    extension = filename.split('.')[-1]
+    if extension == 'parquet':
+        import pyarrow.parquet
+        return pyarrow.parquet.read_schema(filename).names
+    
+    if extension in ('arrow', 'feather'):
+        import pyarrow
+        return pyarrow.ipc.open_file(pyarrow.memory_map(filename)).schema.names
+    
+    with uproot.open(filename) as f:
+        return f[f.keys()[0]].keys()
+
+
+def iterate_columns(filename, columns, step_size=1000000):
+    """Reads some of the branches of an lhe2root output file (ROOT, Parquet or Arrow, see read_dataframe) in chunks of events,
+    so that memory use does not depend on the size of the file
+
+    Parameters
+    ----------
+    filename : str
+        The output file
+    columns : list[str]
+        The branches to read
+    step_size : int, optional
+        The (maximum) number of events in each chunk, by default 1000000
+
+    Yields
+    ------
+    dict
+        A dictionary of branch name to a NumPy array of its values for the events in the chunk
+    """
+    columns = list(columns)
+    extension = filename.split('.')[-1]
+    if extension == 'parquet':
+        import pyarrow.parquet
+        for batch in pyarrow.parquet.ParquetFile(filename, memory_map=True).iter_batches(batch_size=step_size, columns=columns):
+            yield {name: batch.column(name).to_numpy(zero_copy_only=False) for name in columns}
+    
+    elif extension in ('arrow', 'feather'):
+        import pyarrow
+        reader = pyarrow.ipc.open_file(pyarrow.memory_map(filename))
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            for start in range(0, batch.num_rows, step_size):
+                chunk = batch.slice(start, step_size)
+                yield {name: chunk.column(name).to_numpy(zero_copy_only=False) for name in columns}
+    
+    else:
+        with uproot.open(filename) as f:
+            for chunk in f[f.keys()[0]].iterate(columns, step_size=step_size, library='np'):
+                yield chunk
+
+
+HISTOGRAM_CACHE_DIRECTORY = os.environ.get("LHE2ROOT_HISTOGRAM_CACHE", histogram_cache.DEFAULT_DIRECTORY) #set LHE2ROOT_HISTOGRAM_CACHE="" to not keep histograms between runs
+HISTOGRAMS = histogram_cache.HistogramCache(
+    disk=histogram_cache.DiskHistogramCache(HISTOGRAM_CACHE_DIRECTORY) if HISTOGRAM_CACHE_DIRECTORY else None
+) #the histograms already made in this process and in previous runs
+
+InterferenceHistograms = collections.namedtuple("InterferenceHistograms", "interference mixed pure1 pure2 bins")
+InterferenceHistograms.__doc__ = """The cross section scaled histograms of an interference triplet, the interference (mixed - pure1 - pure2) and the shared bin edges"""
+
+
+def histogram_columns(filename, binnings, cuts={}, step_size=1000000):
+    """Histograms several branches of an lhe2root output file (ROOT, Parquet or Arrow, see read_dataframe) after cuts in one pass,
+    reading only the branches that are needed, step_size events at a time.
+    Histograms are kept in HISTOGRAMS (in memory and on disk), keyed by the path, size and mtime of the file, the branch, the binning and the cuts.
+    If every one of them is there the file is not opened at all
+
+    Parameters
+    ----------
+    filename : str
+        The output file
+    binnings : dict
+        A dictionary of branch name to the (range, nbins) it is histogrammed with. nbins can either be a number or a list of bin edges
+    cuts : Union[cut_engine.CutSet, dict, str, list[str]], optional
+        The cuts to apply (see cut_engine.compile_cuts), by default {}
+    step_size : int, optional
+        The number of events read at a time, by default 1000000
+
+    Returns
+    -------
+    dict
+        A dictionary of branch name to the NumPy style histogram tuple of counts and bins
+
+    Raises
+    ------
+    ValueError
+        If a branch that is histogrammed or used in the cuts is not in the file
+    """
+    cuts = cut_engine.compile_cuts(cuts)
+    
+    histograms = {}
+    keys = {}
+    for attribute, (xrange, nbins) in binnings.items():
+        keys[attribute] = histogram_cache.histogram_key(filename, attribute, xrange, nbins, cuts)
+        cached = HISTOGRAMS.get(keys[attribute])
+        if cached is not None:
+            histograms[attribute] = cached
+    
+    missing = [attribute for attribute in binnings if attribute not in histograms]
+    if not missing:
+        return histograms
+    
+    columns = missing + [branch for branch in cuts.branches if branch not in missing]
+    available = list_columns(filename)
+    if any(column not in available for column in columns):
+        raise ValueError("You can only choose from these attributes:\n" + str(available))
+    
+    for attribute in missing:
+        xrange, nbins = binnings[attribute]
+        histograms[attribute] = np.histogram(np.empty(0), range=xrange, bins=nbins)
+    
+    for chunk in iterate_columns(filename, columns, step_size):
+        mask = cuts.mask(chunk)
+        for attribute in missing:
+            xrange, nbins = binnings[attribute]
+            counts, bins = np.histogram(chunk[attribute][mask], range=xrange, bins=nbins) #the edges have the type of the branch
+            histograms[attribute] = (histograms[attribute][0] + counts, bins)
+    
+    for attribute in missing:
+        HISTOGRAMS.put(keys[attribute], *histograms[attribute])
+    
+    return histograms
+
+
+def histogram_file(filename, attribute, xrange, nbins=100, cuts={}, step_size=1000000):
+    """Histograms one branch of an lhe2root output file (ROOT, Parquet or Arrow, see read_dataframe) after cuts,
+    reading only the branches that are needed, step_size events at a time (see histogram_columns)
+
+    Parameters
+    ----------
+    filename : str
+        The output file
+    attribute : str
+        The branch to histogram
+    xrange : tuple[float, float]
+        The range of the histogram
+    nbins : int, optional
+        The number of bins. This can either be a number or a list, by default 100
+    cuts : Union[cut_engine.CutSet, dict, str, list[str]], optional
+        The cuts to apply (see cut_engine.compile_cuts), by default {}
+    step_size : int, optional
+        The number of events read at a time, by default 1000000
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray]
+        The NumPy style histogram tuple of counts and bins
+
+    Raises
+    ------
+    ValueError
+        If the attribute or a branch used in the cuts is not in the file
+    """
+    return histogram_columns(filename, {attribute: (xrange, nbins)}, cuts, step_size)[attribute]
+
+
+def interference_histograms(triplets, attributes, cross_sections, nbins=100, cuts={}, step_size=1000000):
+    """Makes the interference histograms of many triplets and attributes at once.
+    Each distinct file is read once, for only the attributes and cut branches it needs,
+    so pure samples shared between triplets are not read again
+
+    Parameters
+    ----------
+    triplets : list[tuple[str, str, str]]
+        The triplets of (mixed file, pure1 file, pure2 file), as in plot_interference
+    attributes : list[str]
+        The things you are plotting (i.e. M4L, phi, etc.). Each is histogrammed over useful_funcs_and_constants.ranges
+    cross_sections : dict
+        A dictionary containing the cross sections of each file in the following format: {filename: cross section}
+    nbins : int, optional
+        The number of bins for every histogram. This can either be an integer or a list of bins, by default 100
+    cuts : Union[cut_engine.CutSet, dict, str, list[str]], optional
+        The cuts applied to every sample (see cut_engine.compile_cuts), by default {}
+    step_size : int, optional
+        The number of events read at a time, by default 1000000
+
+    Returns
+    -------
+    dict
+        A dictionary of (mixed file, pure1 file, pure2 file, attribute) to its InterferenceHistograms
+
+    Raises
+    ------
+    ValueError
+        If there is a column listed that is not found
+    """
+    cuts = cut_engine.compile_cuts(cuts)
+    binnings = {attribute: (useful_funcs_and_constants.ranges[attribute], nbins) for attribute in attributes}
+    
+    histograms = {}
+    for filename in dict.fromkeys(os.path.abspath(f) for triplet in triplets for f in triplet): #keeps the order
+        histograms[filename] = histogram_columns(filename, binnings, cuts, step_size)
+    
+    results = {}
+    for triplet in triplets:
+        mixed_file, pure1, pure2 = (os.path.abspath(f) for f in triplet)
+        for attribute in attributes:
+            interf_hist, bins = histograms[mixed_file][attribute]
+            interf_hist = scale(cross_sections[mixed_file], interf_hist)
+            BW1_hist = scale(cross_sections[pure1], histograms[pure1][attribute][0])
+            BW2_hist = scale(cross_sections[pure2], histograms[pure2][attribute][0])
+            
+            results[tuple(triplet) + (attribute,)] = InterferenceHistograms(interf_hist - BW1_hist - BW2_hist, interf_hist, BW1_hist, BW2_hist, bins)
+    
+    return results
+
+
 def plot_one_quantity(filenames, attribute, xrange, nbins=100, labels=[], norm=False, title="", 
-                      cuts={}, perFile=False):
+                      cuts={}, perFile=False, step_size=1000000):
     """This function plots one quantity of your choice from ROOT files!
 
     Parameters
     ----------
     filenames : list[str]
-        The ROOT files you are plotting from
+        The ROOT (or Parquet/Arrow, see read_dataframe) files you are plotting from
     attribute : str
         The TBranch you are plotting (the files should have the same names for branches)
     xrange : tuple[float, float]
@@ -162,10 +638,13 @@ def plot_one_quantity(filenames, attribute, xrange, nbins=100, labels=[], norm=F
         Whether to normalize the plotting areas to 1 for easier comparison, by default False
     title : str, optional
         An extra "title" on the x label that is concatenated, by default ""
-    cuts : dict
-        A dictionary containing the upper and lower level cuts that you are making on each quantity, by default {}
+    cuts : Union[cut_engine.CutSet, dict, str, list[str]]
+        The cuts to make: a dictionary containing the lower and upper level cuts that you are making on each quantity,
+        boolean expressions over the branches, or a cut_engine.CutSet with both, by default {}
     perFile : bool
         Whether you want to have a single plot for each file, by default False
+    step_size : int, optional
+        The number of events read at a time. Only the attribute and the branches that are cut on are read, by default 1000000
         
     Returns
     -------
@@ -182,40 +661,28 @@ def plot_one_quantity(filenames, attribute, xrange, nbins=100, labels=[], norm=F
     if labels and len(labels) != len(filenames):
         raise ValueError("labels and files should be the same length!")
     
+    cuts = cut_engine.compile_cuts(cuts) #compiled once for every file
     histograms = {}
     
     for n, file in enumerate(filenames):
-        with uproot.open(file) as f:
-            keys = f.keys()
-            f = f[keys[0]].arrays(library='pd')
-            
-            try:
-                for quan, cut in cuts.items():
-                    # print(cut)
-                    # print(f.query(quan + ' > @cut[0]'))
-                    f = f.query(quan + ' > @cut[0] & ' + quan + ' < @cut[1]')
-                value = f[attribute]
-            except:
-                raise ValueError("You can only choose from these attributes:\n" + str(list(f.columns)))
-            
-            hist_counts, hist_bins = np.histogram(value, range=xrange, bins=nbins)
-            
-            histograms[file] = (hist_counts, hist_bins)
+        hist_counts, hist_bins = histogram_file(file, attribute, xrange, nbins, cuts, step_size)
+        
+        histograms[file] = (hist_counts, hist_bins)
+        
+        if norm:
+            hist_counts = scale(1, hist_counts)
             
-            if norm:
-                hist_counts = scale(1, hist_counts)
-                
-            if labels:
-                hep.histplot(hist_counts, hist_bins, lw=2, label=labels[n])
-            else:
-                hep.histplot(hist_counts, hist_bins, lw=2)
-                
-            plt.xlim(xrange)
+        if labels:
+            hep.histplot(hist_counts, hist_bins, lw=2, label=labels[n])
+        else:
+            hep.histplot(hist_counts, hist_bins, lw=2)
             
-            if attribute in useful_funcs_and_constants.beautified_title:
-                plt.xlabel(useful_funcs_and_constants.beautified_title[attribute] + title, horizontalalignment='center', fontsize=30)
-            else:
-                plt.xlabel(attribute + title, horizontalalignment='center', fontsize=30)
+        plt.xlim(xrange)
+        
+        if attribute in useful_funcs_and_constants.beautified_title:
+            plt.xlabel(useful_funcs_and_constants.beautified_title[attribute] + title, horizontalalignment='center', fontsize=30)
+        else:
+            plt.xlabel(attribute + title, horizontalalignment='center', fontsize=30)
         
         if perFile:
             if labels:
@@ -235,13 +702,13 @@ def plot_one_quantity(filenames, attribute, xrange, nbins=100, labels=[], norm=F
     return histograms
 
 
-def plot_interference(mixed_file, pure1, pure2, pure1Name, pure2Name, attribute, cross_sections, nbins=100, title=""):
+def plot_interference(mixed_file, pure1, pure2, pure1Name, pure2Name, attribute, cross_sections, nbins=100, title="", cuts={}):
     """Plots the interference between two samples given a file containing a mixture of the two, and two "pure" samples
 
     Parameters
     ----------
     mixed_file : str
-        The ROOT file containing a simulation of pure1 and pure2 together
+        The ROOT (or Parquet/Arrow, see read_dataframe) file containing a simulation of pure1 and pure2 together
     pure1 : str
         ROOT file for one of the two items (no mixing)
     pure2 : str
@@ -258,6 +725,8 @@ def plot_interference(mixed_file, pure1, pure2, pure1Name, pure2Name, attribute,
         The number of bins for your plot. This can either be an integer or a list of bins, by default 100
     title : str, optional
         An extra "title" on the x label that is concatenated, by default ""
+    cuts : Union[cut_engine.CutSet, dict, str, list[str]], optional
+        The cuts applied to all three samples (see cut_engine.compile_cuts), by default {}
 
     Returns
     -------
@@ -270,37 +739,9 @@ def plot_interference(mixed_file, pure1, pure2, pure1Name, pure2Name, attribute,
         If there is a column listed that is not found
     """
     
-    mixed_file = os.path.abspath(mixed_file)
-    pure1 = os.path.abspath(pure1)
-    pure2 = os.path.abspath(pure2)
-    
-    interf_sample = BW1_sample = BW2_sample = pd.DataFrame()
-    
-    with uproot.open(mixed_file) as interf: #Opening all of these in the same statement might cause memory issues. So here we are!
-        interf_sample = interf[interf.keys()[0]].arrays(library='pd')
-        
-    if attribute not in interf_sample.columns:
-        raise ValueError(attribute + " not in file!")
-        
-    with uproot.open(pure1) as rawBW1:
-        BW1_sample = rawBW1[rawBW1.keys()[0]].arrays(library='pd')
-        
-    with uproot.open(pure2) as rawBW2:
-        BW2_sample = rawBW2[rawBW2.keys()[0]].arrays(library='pd')
-        
-    
-    interf_hist, bins = np.histogram(interf_sample[attribute], range=useful_funcs_and_constants.ranges[attribute], bins=nbins) #edit these ranges to your heart's desire!
-    BW1_hist, _ = np.histogram(BW1_sample[attribute], range=useful_funcs_and_constants.ranges[attribute], bins=bins)
-    BW2_hist, _ = np.histogram(BW2_sample[attribute], range=useful_funcs_and_constants.ranges[attribute], bins=bins)
-    
-    # print('%E' % CrossSections[pure1][0], '%E' % CrossSections[pure2][0], '%E' % np.sqrt(CrossSections[pure1][0]*CrossSections[pure2][0])
-    #     , '%E' % CrossSections[mixed_file][0])
-    
-    interf_hist = scale(cross_sections[mixed_file], interf_hist)
-    BW1_hist = scale(cross_sections[pure1], BW1_hist)
-    BW2_hist = scale(cross_sections[pure2], BW2_hist)
-    
-    interf_actual = interf_hist - BW1_hist - BW2_hist
+    triplet = (mixed_file, pure1, pure2)
+    interf_actual, interf_hist, BW1_hist, BW2_hist, bins = interference_histograms([triplet], [attribute], cross_sections, nbins, cuts)[triplet + (attribute,)]
+    #edit useful_funcs_and_constants.ranges to change the ranges to your heart's desire!
     
     plt.figure()
     plt.gca().axhline(lw=3, linestyle='--', color='black', zorder=0)
@@ -337,11 +778,6 @@ def cut_ranges_to_dict(cut_ranges):
     """
     cut_dict = {}
     for key, lower, upper in cut_ranges:
-        if lower == '.':
-            lower = -np.inf
-        if upper == '.':
-            upper = np.inf
-        
-        cut_dict[key] = (lower, upper)
+        cut_dict[key] = (cut_engine.parse_bound(lower, -np.inf), cut_engine.parse_bound(upper, np.inf))
     
     return cut_dict
\ No newline at end of file
@@ -0,0 +1,121 @@
+import collections
+import numpy as np
+
+NONE, HIGGS, Z, W = 0, 1, 2, 3 #the resonance a particle comes from
+HIGGS_IDS = (25, 39) #the ids that count as the Higgs (39 is the spin 2 graviton)
+
+Ancestry = collections.namedtuple("Ancestry", "parent parentid grandparentid resonance")
+Ancestry.__doc__ = """The ancestry of every particle of one or more events, as flat NumPy arrays in the order of the particles.
+parent is the flat index of the particle's only mother (-1 if it has none, or two different mothers),
+parentid and grandparentid are the ids of the mother and of the mother's first mother (0 if there is none),
+and resonance is HIGGS if the particle descends from a Higgs through a chain of only mothers,
+otherwise Z or W if its only mother is a Z or W, otherwise NONE"""
+
+
+def resolve_ancestry(ids, mother1s, mother2s, offsets=None):
+    """Finds the resonance ancestor of every particle of a batch of events at once
+
+    Parameters
+    ----------
+    ids : numpy.ndarray
+        The flat array of PDG ids
+    mother1s : numpy.ndarray
+        The flat array of first mother indices, 1-based within each event as in the LHE file (0 meaning no mother)
+    mother2s : numpy.ndarray
+        The flat array of second mother indices, in the same form
+    offsets : numpy.ndarray, optional
+        The particles of event i are offsets[i]:offsets[i+1], as in lhe_batch_reader.LHEBatch, by default all of the particles are one event
+
+    Returns
+    -------
+    Ancestry
+        The flat ancestry arrays
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    mother1s = np.asarray(mother1s, dtype=np.int64)
+    mother2s = np.asarray(mother2s, dtype=np.int64)
+    if offsets is None:
+        offsets = np.array([0, len(ids)])
+    counts = np.diff(offsets)
+    start = np.repeat(offsets[:-1], counts) #the flat index of the first particle of each particle's event
+    count = np.repeat(counts, counts)
+
+    hasmother1 = (mother1s >= 1) & (mother1s <= count)
+    mother1 = np.where(hasmother1, start + mother1s - 1, -1)
+    parent = np.where(hasmother1 & (mother1s == mother2s), mother1, -1)
+
+    idswithnone = np.append(ids, 0) #index -1 is no particle, whose id is 0
+    parentid = idswithnone[parent]
+    grandparentid = idswithnone[np.append(mother1, -1)[parent]]
+
+    ishiggs = np.append(np.isin(ids, HIGGS_IDS), False)
+    parentwithnone = np.append(parent, -1)
+    higgs = np.zeros(len(ids), dtype=bool)
+    ancestor = parent
+    for _ in range(int(counts.max(initial=0))): #every step looks one generation further up all of the chains at once, and a chain can't be longer than its event
+        higgs |= ishiggs[ancestor]
+        ancestor = parentwithnone[ancestor]
+        if (ancestor == -1).all():
+            break
+
+    resonance = np.where(higgs, HIGGS, np.where(np.abs(parentid) == 23, Z, np.where(np.abs(parentid) == 24, W, NONE)))
+    return Ancestry(parent, parentid, grandparentid, resonance)
+
+
+def event_ancestry(particles):
+    """Finds the resonance ancestor of every particle of one event.
+    Events are small, so this is one pass in Python over the particles, using the ancestry of each particle's mother,
+    which is already known because mothers come before their daughters in LHE files.
+    Events where they don't are resolved with resolve_ancestry
+
+    Parameters
+    ----------
+    particles : list[lhe_tokenizer.LHEParticle]
+        The particle records of the event, with their original ids
+
+    Returns
+    -------
+    Ancestry
+        The ancestry of the particles as lists, in the order of the particles
+    """
+    ids = [particle[0] for particle in particles]
+    nparticles = len(ids)
+    parent, parentid, grandparentid, resonance = [], [], [], []
+    for i, particle in enumerate(particles):
+        mother1, mother2 = particle[2:4]
+        if mother1 > i: #the mother comes later, or does not exist
+            columns = np.array([particle[:4] for particle in particles], dtype=np.int64)
+            return Ancestry(*(array.tolist() for array in resolve_ancestry(columns[:, 0], columns[:, 2], columns[:, 3])))
+        if mother1 >= 1 and mother1 == mother2:
+            mother = mother1 - 1
+            motherid = ids[mother]
+            grandmother1 = particles[mother][2]
+            parent.append(mother)
+            parentid.append(motherid)
+            grandparentid.append(ids[grandmother1 - 1] if 1 <= grandmother1 <= nparticles else 0)
+            if motherid in HIGGS_IDS or resonance[mother] == HIGGS:
+                resonance.append(HIGGS)
+            else:
+                resonance.append(Z if abs(motherid) == 23 else W if abs(motherid) == 24 else NONE)
+        else:
+            parent.append(-1)
+            parentid.append(0)
+            grandparentid.append(0)
+            resonance.append(NONE)
+    return Ancestry(parent, parentid, grandparentid, resonance)
+
+
+def batch_ancestry(batch):
+    """Finds the resonance ancestor of every particle of a chunk of events from lhe_batch_reader.LHEBatchReader
+
+    Parameters
+    ----------
+    batch : lhe_batch_reader.LHEBatch
+        The events
+
+    Returns
+    -------
+    Ancestry
+        The flat ancestry arrays, indexed the same way as the batch's per-particle arrays
+    """
+    return resolve_ancestry(batch.id, batch.mother1, batch.mother2, batch.offsets)
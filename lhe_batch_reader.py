@@ -0,0 +1,122 @@
+import collections
+import numpy as np
+from lhe_tokenizer import tokenize_event, iter_event_blocks, WeightLayout
+from lhe_compression import open_lhe
+
+LHEBatch = collections.namedtuple("LHEBatch", "offsets id status mother1 mother2 px py pz e m weight weights weightids")
+LHEBatch.__doc__ = """A chunk of events stored as flat NumPy arrays.
+The particles of event i are the slice offsets[i]:offsets[i+1] of every per-particle array,
+mother indices are the 1-based indices within the event from the LHE file (0 meaning no mother),
+and weights is an (nevents, len(weightids)) matrix of the <wgt> weights (NaN where an event has no such weight)"""
+
+
+class LHEBatchReader(object):
+    def __init__(self, filename, batchsize=10000, weightids=None):
+        """A class to read an LHE file in chunks of events as NumPy arrays, without MELA
+        Example usage:
+        with LHEBatchReader("filename.lhe", batchsize=50000) as f:
+            for batch in f:
+                pt = np.hypot(batch.px, batch.py)
+                leptons = np.isin(np.abs(batch.id), (11, 13))
+
+        Parameters
+        ----------
+        filename : str
+            The LHE file to read, which can be compressed (see lhe_compression)
+        batchsize : int, optional
+            The (maximum) number of events in each chunk, by default 10000
+        weightids : list[str], optional
+            The ids of the <wgt> weights to put in the weight matrix in column order.
+            If None, the ids of the first event are used in the order they appear, by default None
+
+        Raises
+        ------
+        ValueError
+            batchsize must be > 0
+        """
+        if batchsize <= 0:
+            raise ValueError("Selecting <= 0 events per batch makes literally no sense")
+        self.filename = filename
+        self.batchsize = int(batchsize)
+        self.weightids = list(weightids) if weightids is not None else None
+        self.weightlayout = None
+        self.weightcolumns = None
+        self.f = open_lhe(self.filename)
+
+    def __enter__(self):
+        self.f.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        return self.f.__exit__(*args)
+
+    def _resolve_weights(self, event):
+        """Resolves the weight columns once, from the ids of the first event in the order they appear.
+        Every event is then parsed positionally by a lhe_tokenizer.WeightLayout,
+        and weightcolumns picks the columns of weightids out of its rows (the extra last column is NaN, for ids the file does not have)
+
+        Parameters
+        ----------
+        event : str
+            The first event of the file
+        """
+        self.weightlayout = WeightLayout(tokenize_event(event).weights)
+        if self.weightids is None:
+            self.weightids = list(self.weightlayout.ids)
+        self.weightcolumns = np.array([self.weightlayout.columns.get(weightid, -1) for weightid in self.weightids], dtype=np.intp)
+
+    def __iter__(self):
+        events = []
+        weights = None
+        for linenumber, event in iter_event_blocks(self.f):
+            if self.weightlayout is None:
+                self._resolve_weights(event)
+            if weights is None:
+                weights = np.full((self.batchsize, len(self.weightlayout) + 1), np.nan)
+            try:
+                events.append(tokenize_event(event, self.weightlayout))
+            except:
+                print("On line", linenumber)
+                raise
+            weights[len(events) - 1, :-1] = events[-1].weights
+            if len(events) == self.batchsize:
+                yield self._tobatch(events, weights)
+                events = []
+                weights = None
+        if events:
+            yield self._tobatch(events, weights[:len(events)])
+
+    def _tobatch(self, events, weights):
+        """Converts a list of tokenized events into a single LHEBatch
+
+        Parameters
+        ----------
+        events : list[lhe_tokenizer.TokenizedEvent]
+            The events in this chunk
+        weights : numpy.ndarray
+            The weight rows of the events from the WeightLayout, with an extra NaN column
+
+        Returns
+        -------
+        LHEBatch
+            The chunk as flat NumPy arrays
+        """
+
+        counts = np.fromiter((len(event.particles) for event in events), dtype=np.int64, count=len(events))
+        offsets = np.zeros(len(events) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        particles = [particle for event in events for particle in event.particles]
+        if particles:
+            ints = np.array([particle[:4] for particle in particles], dtype=np.int32).reshape(-1, 4)
+            floats = np.array([particle[4:9] for particle in particles], dtype=np.float64).reshape(-1, 5)
+        else:
+            ints = np.zeros((0, 4), dtype=np.int32)
+            floats = np.zeros((0, 5), dtype=np.float64)
+
+        weight = np.fromiter((event.weight for event in events), dtype=np.float64, count=len(events))
+        weights = weights[:, self.weightcolumns]
+
+        return LHEBatch(offsets, ints[:, 0], ints[:, 1], ints[:, 2], ints[:, 3],
+                        floats[:, 0], floats[:, 1], floats[:, 2], floats[:, 3], floats[:, 4],
+                        weight, weights, tuple(self.weightids))
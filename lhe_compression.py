@@ -0,0 +1,150 @@
+import io
+import gzip
+import lzma
+import queue
+import threading
+
+try:
+    import zstandard
+except ImportError: #zstd support is optional
+    zstandard = None
+
+
+def _open_zstd(filename):
+    """Opens a zstd-compressed file as a binary stream"""
+    if zstandard is None:
+        raise ImportError("Reading " + filename + " needs the zstandard package (pip install zstandard)")
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), closefd=True)) #the raw reader can't be iterated over
+
+
+DECOMPRESSORS = { #extension -> function that opens the file as a binary stream of the decompressed data
+    'gz': gzip.open,
+    'xz': lzma.open,
+    'zst': _open_zstd,
+}
+
+
+def compression(filename):
+    """The compression extension of a file
+
+    Parameters
+    ----------
+    filename : str
+        The file
+
+    Returns
+    -------
+    str
+        The extension (one of DECOMPRESSORS) or "" if the file is not compressed
+    """
+    extension = filename.split('.')[-1]
+    return extension if extension in DECOMPRESSORS else ""
+
+
+def is_lhe_filename(filename):
+    """Whether a file is an LHE file, either plain (.lhe) or compressed (.lhe.gz, .lhe.xz, .lhe.zst)"""
+    return strip_compression(filename).split('.')[-1] == 'lhe'
+
+
+def strip_compression(filename):
+    """The name of a file without its compression extension, i.e. sample.lhe for sample.lhe.gz"""
+    if compression(filename):
+        return filename[:filename.rfind('.')]
+    return filename
+
+
+class BackgroundReader(io.RawIOBase):
+    def __init__(self, f, chunksize=1 << 20, maxchunks=8):
+        """A read-only stream that reads another stream in a background thread.
+        Decompressing gzip, xz and zstd releases the GIL, so the inflation of the next chunks
+        overlaps with whatever the main thread is doing with the previous ones
+
+        Parameters
+        ----------
+        f : io.IOBase
+            The binary stream to read
+        chunksize : int, optional
+            The number of bytes read at a time, by default 1 MiB
+        maxchunks : int, optional
+            The number of chunks read ahead of the consumer, by default 8
+        """
+        super().__init__()
+        self.f = f
+        self.chunksize = chunksize
+        self.chunks = queue.Queue(maxchunks)
+        self.leftover = b""
+        self.finished = False
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._readahead, daemon=True)
+        self.thread.start()
+
+    def _readahead(self):
+        try:
+            while not self.stopping.is_set():
+                chunk = self.f.read(self.chunksize)
+                self.chunks.put(chunk)
+                if not chunk:
+                    return
+        except BaseException as e: #handed to the consumer so that errors are raised where the data is read
+            self.chunks.put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.leftover and not self.finished:
+            chunk = self.chunks.get()
+            if isinstance(chunk, BaseException):
+                self.finished = True
+                raise chunk
+            if not chunk:
+                self.finished = True
+            self.leftover = memoryview(chunk)
+        n = min(len(buffer), len(self.leftover))
+        buffer[:n] = self.leftover[:n]
+        self.leftover = self.leftover[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.stopping.set()
+            while self.thread.is_alive(): #unblock the thread if it is waiting to hand over a chunk
+                try:
+                    self.chunks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.f.close()
+        super().close()
+
+
+def open_lhe(filename, mode='r', background=True):
+    """Opens a plain or compressed LHE file for reading. gzip, xz and (if zstandard is installed) zstd are decompressed while streaming
+
+    Parameters
+    ----------
+    filename : str
+        The LHE file
+    mode : str, optional
+        'r' for text or 'rb' for bytes, by default 'r'
+    background : bool, optional
+        If True, compressed files are decompressed in a background thread.
+        The stream returned is then not seekable, by default True
+
+    Returns
+    -------
+    io.IOBase
+        The file object
+    """
+    if mode not in ('r', 'rb'):
+        raise ValueError("LHE files can only be opened for reading")
+
+    extension = compression(filename)
+    if not extension:
+        return open(filename, mode)
+
+    f = DECOMPRESSORS[extension](filename)
+    if background:
+        f = io.BufferedReader(BackgroundReader(f), buffer_size=1 << 20)
+    if mode == 'r':
+        f = io.TextIOWrapper(f)
+    return f
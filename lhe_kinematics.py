@@ -0,0 +1,178 @@
+import numpy as np
+
+PX, PY, PZ, E = range(4)
+
+
+def pad_particles(events):
+    """Packs the LHE particle records of a batch of events into zero-padded arrays
+
+    Parameters
+    ----------
+    events : list[list[lhe_tokenizer.LHEParticle]]
+        The particle records (i.e. the daughters or the associated particles) of every event in the batch
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+        The (nevents, k) PDG ids, the (nevents, k, 4) momenta as px, py, pz, E and the number of particles in each event,
+        where k is the largest number of particles in any event. Padded slots have an id of 0 and zero momentum
+    """
+    counts = np.fromiter((len(particles) for particles in events), dtype=np.int64, count=len(events))
+    width = int(counts.max()) if len(counts) else 0
+
+    ids = np.zeros((len(events), width), dtype=np.int64)
+    p4 = np.zeros((len(events), width, 4))
+    filled = np.arange(width) < counts[:, None]
+
+    flat = [particle for particles in events for particle in particles]
+    if flat:
+        ids[filled] = [particle.id for particle in flat]
+        p4[filled] = [particle[4:8] for particle in flat]
+
+    return ids, p4, counts
+
+
+def pt(p4):
+    """The transverse momentum of four-vectors stored as (..., 4) arrays of px, py, pz, E"""
+    return np.hypot(p4[..., PX], p4[..., PY])
+
+
+def phi(p4):
+    """The azimuthal angle of four-vectors stored as (..., 4) arrays of px, py, pz, E, defined as in TVector3::Phi"""
+    px, py = p4[..., PX], p4[..., PY]
+    return np.where((px == 0) & (py == 0), 0., np.arctan2(py, px))
+
+
+def rapidity(p4):
+    """The rapidity of four-vectors stored as (..., 4) arrays of px, py, pz, E, defined as in TLorentzVector::Rapidity"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 0.5*np.log((p4[..., E] + p4[..., PZ])/(p4[..., E] - p4[..., PZ]))
+
+
+def delta_phi(p4_1, p4_2):
+    """The difference in azimuthal angle of two sets of four-vectors mapped to [-pi, pi),
+    defined as in TLorentzVector::DeltaPhi
+
+    Parameters
+    ----------
+    p4_1 : numpy.ndarray
+        A (..., 4) array of px, py, pz, E
+    p4_2 : numpy.ndarray
+        A (..., 4) array of px, py, pz, E
+
+    Returns
+    -------
+    numpy.ndarray
+        phi(p4_1) - phi(p4_2) in [-pi, pi)
+    """
+    dphi = phi(p4_1) - phi(p4_2) #both angles are in [-pi, pi], so one shift by 2pi is always enough
+    return np.where(dphi >= np.pi, dphi - 2*np.pi, np.where(dphi < -np.pi, dphi + 2*np.pi, dphi))
+
+
+def eta(p4):
+    """The pseudorapidity of four-vectors stored as (..., 4) arrays of px, py, pz, E, defined as in TVector3::PseudoRapidity"""
+    pz = p4[..., PZ]
+    p = np.sqrt(p4[..., PX]**2 + p4[..., PY]**2 + pz**2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        costheta = np.where(p == 0, 1., pz/p)
+        result = -0.5*np.log((1 - costheta)/(1 + costheta))
+    return np.where(costheta**2 < 1, result, np.where(pz == 0, 0., np.where(pz > 0, 1e10, -1e10)))
+
+
+def delta_r(p4_1, p4_2):
+    """The distance in (pseudorapidity, azimuthal angle) between two sets of four-vectors, defined as in TLorentzVector::DeltaR
+
+    Parameters
+    ----------
+    p4_1 : numpy.ndarray
+        A (..., 4) array of px, py, pz, E
+    p4_2 : numpy.ndarray
+        A (..., 4) array of px, py, pz, E
+
+    Returns
+    -------
+    numpy.ndarray
+        sqrt(deta^2 + dphi^2)
+    """
+    return np.hypot(eta(p4_1) - eta(p4_2), delta_phi(p4_1, p4_2))
+
+
+def mass(p4):
+    """The mass of four-vectors stored as (..., 4) arrays of px, py, pz, E, defined as in TLorentzVector::M (negative for spacelike vectors)"""
+    m2 = p4[..., E]**2 - p4[..., PX]**2 - p4[..., PY]**2 - p4[..., PZ]**2
+    return np.sign(m2)*np.sqrt(np.abs(m2))
+
+
+def merge_closest(photonp4, photons, leptonp4, leptons, cone=None):
+    """Adds photons to their closest leptons in Delta R for a batch of events.
+    The photons of an event are merged one after another, so a photon is compared to leptons that already include the photons before it
+
+    Parameters
+    ----------
+    photonp4 : numpy.ndarray
+        The (nevents, nphotons, 4) photon momenta as px, py, pz, E
+    photons : numpy.ndarray
+        An (nevents, nphotons) boolean array of which photon slots are photons that should be merged
+    leptonp4 : numpy.ndarray
+        The (nevents, nleptons, 4) lepton momenta as px, py, pz, E
+    leptons : numpy.ndarray
+        An (nevents, nleptons) boolean array of which lepton slots can take a photon
+    cone : float, optional
+        If given, photons are only merged into leptons closer than this in Delta R, by default None
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray]
+        The merged (nevents, nleptons, 4) lepton momenta, and the (nevents, nphotons) index of the lepton each photon was merged into (-1 if it was not)
+    """
+    leptonp4 = leptonp4.copy()
+    target = np.full(photons.shape, -1, dtype=np.int64)
+    rows = np.arange(len(leptonp4))
+    for j in range(photonp4.shape[1]):
+        dr = delta_r(photonp4[:, j, None, :], leptonp4)
+        dr = np.where(leptons & ~np.isnan(dr), dr, np.inf)
+        closest = np.argmin(dr, axis=1) if dr.shape[1] else np.zeros(len(dr), dtype=np.int64) #the first one on a tie
+        mindr = dr[rows, closest] if dr.shape[1] else np.full(len(dr), np.inf)
+        merge = photons[:, j] & np.isfinite(mindr)
+        if cone is not None:
+            merge &= mindr < cone
+        leptonp4[rows[merge], closest[merge]] += photonp4[merge, j]
+        target[merge, j] = closest[merge]
+    return leptonp4, target
+
+
+def merge_fsr_photons(photons, leptons, cone=None):
+    """Merges every FSR photon (id 22) of a batch of events into the closest lepton in Delta R (see merge_closest)
+
+    Parameters
+    ----------
+    photons : list[list[lhe_tokenizer.LHEParticle]]
+        The particle records of every event that the photons are taken from. Records that are not photons are ignored
+    leptons : list[list[lhe_tokenizer.LHEParticle]]
+        The particle records of every event that the photons are merged into. Photon records are never merged into
+    cone : float, optional
+        If given, photons are only merged into leptons closer than this in Delta R, by default None
+
+    Returns
+    -------
+    list[list[lhe_tokenizer.LHEParticle]]
+        The lepton records of every event, with the momentum, mass and LHE line of every lepton that got a photon updated
+    """
+    photonids, photonp4, _ = pad_particles(photons)
+    leptonids, leptonp4, leptoncounts = pad_particles(leptons)
+    filled = np.arange(leptonids.shape[1]) < leptoncounts[:, None]
+
+    merged, target = merge_closest(photonp4, photonids == 22, leptonp4, filled & (leptonids != 22), cone)
+    masses = mass(merged)
+
+    result = []
+    for i, records in enumerate(leptons):
+        records = list(records)
+        for ilep in np.unique(target[i][target[i] >= 0]):
+            px, py, pz, e = (float(x) for x in merged[i, ilep])
+            m = float(masses[i, ilep])
+            fields = records[ilep].line.split()
+            fields[6:11] = (repr(px), repr(py), repr(pz), repr(e), repr(m)) #MELA reads the momenta from the line
+            records[ilep] = records[ilep]._replace(px=px, py=py, pz=pz, e=e, m=m, line=" ".join(fields))
+        result.append(records)
+    return result
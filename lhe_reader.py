@@ -1,77 +1,449 @@
 import re
+import io
 import os
+import mmap
+import shutil
+import tempfile
+import hashlib
 import functools
+import itertools
+import concurrent.futures
+import collections.abc
+from array import array
 import numpy as np
 import useful_funcs_and_constants
+import lhe_compression
+import lhe_slicer
 import warnings
 
+class lhe_event_list(collections.abc.Sequence):
+    def __init__(self, mapped, offsets) -> None:
+        """A read-only list of the events in an LHE file that is backed by a memory map.
+        Events are only decoded into strings when they are asked for, so the full text of the file is never held in memory
+
+        Parameters
+        ----------
+        mapped : mmap.mmap
+            The memory-mapped LHE file
+        offsets : numpy.ndarray
+            An (N, 2) array of the (start, end) byte offsets of every event
+        """
+        self.mapped = mapped
+        self.offsets = offsets
+    
+    def raw(self, i):
+        """Gets the bytes of a single event
+
+        Parameters
+        ----------
+        i : int
+            The index of the event
+
+        Returns
+        -------
+        bytes
+            Everything between (and including) the <event> and </event> tags of event i
+        """
+        start, end = self.offsets[i]
+        return self.mapped[start:end]
+    
+    def __len__(self):
+        return len(self.offsets)
+    
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self.raw(i).decode()
+    
+    def __eq__(self, __o: object) -> bool:
+        if isinstance(__o, lhe_event_list):
+            if len(self) != len(__o):
+                return False
+            if not np.array_equal(np.diff(self.offsets), np.diff(__o.offsets)): #events of different lengths can't be the same
+                return False
+            return all(self.raw(i) == __o.raw(i) for i in range(len(self)))
+        if isinstance(__o, collections.abc.Sequence):
+            return len(self) == len(__o) and all(a == b for a, b in zip(self, __o))
+        return NotImplemented
+
+
+def build_event_index(mapped):
+    """Scans a memory-mapped LHE file for the byte offsets of every event
+
+    Parameters
+    ----------
+    mapped : mmap.mmap
+        The memory-mapped LHE file
+
+    Returns
+    -------
+    numpy.ndarray
+        An (N, 2) int64 array of the (start, end) byte offsets of every event,
+        where start is the position of <event> and end is the position right after </event>
+    """
+    offsets = array('q')
+    start = mapped.find(b"<event>")
+    while start != -1:
+        end = mapped.find(b"</event>", start)
+        if end == -1: #the last event was cut off, so it is not counted
+            break
+        end += len(b"</event>")
+        offsets.append(start)
+        offsets.append(end)
+        start = mapped.find(b"<event>", end)
+    
+    return np.frombuffer(offsets, dtype=np.int64).reshape(-1, 2)
+
+
+HEADER_EVENT_COUNTS = ( #where generators write the number of events into the header
+    re.compile(rb'Number of Events\s*:\s*(\d+)'), #MadGraph's <MGGenerationInfo>
+    re.compile(rb'(?m)^\s*(\d+)\s*=\s*nevents\b'), #the MadGraph run card
+)
+
+
+def read_head(lhefile, blocksize=1 << 16):
+    """Reads everything in an LHE file before the first event, and nothing (more than a block) past it
+
+    Parameters
+    ----------
+    lhefile : str
+        The (possibly compressed) LHE file
+    blocksize : int, optional
+        The number of bytes read at a time, by default 64 KiB
+
+    Returns
+    -------
+    bytes
+        The file up to the first <event> tag (the whole file if there are no events)
+    """
+    head = b""
+    with lhe_compression.open_lhe(lhefile, 'rb', background=False) as f: #a background thread would read ahead for nothing
+        while True:
+            block = f.read(blocksize)
+            head += block
+            end = head.find(b"<event", max(0, len(head) - len(block) - len(b"<event")))
+            if end != -1:
+                return head[:end]
+            if not block:
+                return head
+
+
+def read_cross_section(lhefile):
+    """Reads the cross section and its uncertainty from the <init> block of an LHE file without reading any events.
+    Every process line of <init> is read. The cross sections of the processes are summed,
+    and their (independent) uncertainties are added in quadrature
+
+    Parameters
+    ----------
+    lhefile : str
+        The (possibly compressed) LHE file
+
+    Returns
+    -------
+    Tuple[float, float]
+        The total cross section and its uncertainty
+
+    Raises
+    ------
+    ValueError
+        If the file has no <init> block before its first event, or it has no process lines
+    """
+    head = read_head(lhefile)
+    start = head.find(b"<init")
+    end = head.find(b"</init>", start)
+    if start == -1 or end == -1:
+        raise ValueError("No <init> block found in " + lhefile)
+    
+    lines = []
+    for line in head[head.find(b">", start) + 1:end].decode().splitlines():
+        line = line.split("#")[0].strip()
+        if line and not line.startswith("<"): #skips comments and tags like <generator>
+            lines.append(line.replace("D", "E").replace("d", "e").split()) #Fortran style exponents
+    
+    if len(lines) < 2:
+        raise ValueError("No process lines found in the <init> block of " + lhefile)
+    
+    nprocesses = int(lines[0][9]) if len(lines[0]) > 9 else len(lines) - 1 #NPRUP is the last number of the beam line
+    cross_section = uncertainty = 0.
+    for process in lines[1:nprocesses + 1]:
+        cross_section += float(process[0])
+        uncertainty += float(process[1])**2
+    
+    return cross_section, uncertainty**0.5
+
+
+def header_event_count(lhefile):
+    """Looks for the number of events written in the header of an LHE file, reading nothing past the first event
+
+    Parameters
+    ----------
+    lhefile : str
+        The (possibly compressed) LHE file
+
+    Returns
+    -------
+    Union[int, None]
+        The number of events the header claims, or None if it does not say
+    """
+    head = read_head(lhefile)
+    for regex in HEADER_EVENT_COUNTS:
+        match = regex.search(head)
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def _count_tags(f, length=-1, blocksize=1 << 24):
+    """Counts the <event> and </event> tags in the next length bytes of a binary stream (or all of it if length is -1).
+    A tag is counted where it starts, so tags that start inside the range are counted even if they end after it"""
+    opened = closed = 0
+    tail = b""
+    remaining = length
+    while remaining:
+        block = f.read(blocksize if remaining < 0 else min(blocksize, remaining))
+        if not block:
+            break
+        if remaining > 0:
+            remaining -= len(block)
+        data = tail + block
+        opened += data.count(b"<event>")
+        closed += data.count(b"</event>")
+        tail = data[-(len(b"</event>") - 1):] #a tag split between two blocks is found in the next one
+        opened -= tail.count(b"<event>") #and is not counted twice
+        closed -= tail.count(b"</event>")
+
+    data = tail + f.read(len(b"</event>") - 1) if length >= 0 else tail #finishes the tags that start inside the range
+    for tag in (b"<event>", b"</event>"):
+        start = data.find(tag)
+        while -1 < start < len(tail):
+            if tag == b"<event>":
+                opened += 1
+            else:
+                closed += 1
+            start = data.find(tag, start + 1)
+    return opened, closed
+
+
+def count_events(lhefile, trust_header=False, threads=1, blocksize=1 << 24):
+    """Counts the events in an LHE file by scanning it in large binary blocks for event tags, without indexing or decoding any events.
+    An event that was cut off (an <event> without its </event>) is not counted, the same as in lhe_reader.num_events
+
+    Parameters
+    ----------
+    lhefile : str
+        The (possibly compressed) LHE file
+    trust_header : bool, optional
+        If True and the header says how many events there are (see HEADER_EVENT_COUNTS), that number is returned without scanning the events, by default False
+    threads : int, optional
+        The number of byte ranges of an uncompressed file that are scanned at once, by default 1
+    blocksize : int, optional
+        The number of bytes read at a time, by default 16 MiB
+
+    Returns
+    -------
+    int
+        The number of events
+
+    Raises
+    ------
+    FileNotFoundError
+        Filename should have the .lhe extension
+    """
+    if not lhe_compression.is_lhe_filename(lhefile):
+        raise FileNotFoundError("LHE File Extension Required for file " + lhefile + "!")
+    
+    if trust_header:
+        n = header_event_count(lhefile)
+        if n is not None:
+            return n
+
+    if lhe_compression.compression(lhefile) or threads <= 1:
+        with lhe_compression.open_lhe(lhefile, 'rb') as f:
+            return min(_count_tags(f, blocksize=blocksize))
+
+    size = os.path.getsize(lhefile)
+    bounds = np.linspace(0, size, threads + 1).astype(np.int64)
+
+    def count_range(start, end):
+        with open(lhefile, 'rb') as f:
+            f.seek(start)
+            return _count_tags(f, end - start, blocksize)
+
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool: #reading releases the GIL
+        counts = list(pool.map(count_range, bounds[:-1], bounds[1:]))
+    return min(sum(opened for opened, _ in counts), sum(closed for _, closed in counts))
+
+
+def count_events_in_files(lhefiles, trust_header=False, threads=8):
+    """Counts the events in many LHE files at once (see count_events)
+
+    Parameters
+    ----------
+    lhefiles : list[str]
+        The (possibly compressed) LHE files
+    trust_header : bool, optional
+        Whether to use the number of events in the header when there is one, by default False
+    threads : int, optional
+        The number of files counted at once, by default 8
+
+    Returns
+    -------
+    dict
+        A dictionary of file to its number of events, in the order the files were given
+    """
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+        counts = pool.map(functools.partial(count_events, trust_header=trust_header), lhefiles)
+        return dict(zip(lhefiles, counts))
+
+
+def iter_event_hashes(lhefile, normalize_whitespace=False):
+    """Hashes every event of an LHE file in order while streaming through it
+
+    Parameters
+    ----------
+    lhefile : str
+        The (possibly compressed) LHE file
+    normalize_whitespace : bool, optional
+        If True, every run of whitespace in an event is replaced by a single space before hashing, by default False
+
+    Yields
+    ------
+    bytes
+        The 16 byte BLAKE2b digest of each event from <event> to </event>
+    """
+    with lhe_compression.open_lhe(lhefile, 'rb') as f:
+        for _, event in lhe_slicer.iter_events(f):
+            if event is None: #the footer
+                return
+            if normalize_whitespace:
+                event = b" ".join(event.split())
+            yield hashlib.blake2b(event, digest_size=16).digest()
+
+
 class lhe_reader(object):
-    def __init__(self, lhefile) -> None:
+    def __init__(self, lhefile, sidecar=False) -> None:
         """A class to read LHE files and perform cursory operations like 
-        cutting down to size, checking equality, and ROOT conversion
+        cutting down to size, checking equality, and ROOT conversion.
+        The file is memory-mapped rather than read, and events are found through an index of byte offsets.
+        Compressed files (.lhe.gz, .lhe.xz and .lhe.zst) are streamed into a temporary file the first time they are needed, which is mapped instead
 
         Parameters
         ----------
         lhefile : str
-            the .lhe file you are using
+            the .lhe (or compressed .lhe) file you are using
+        sidecar : bool, optional
+            If True, the event index is saved next to the LHE file as <lhefile>.evtidx.npz 
+            and reused as long as the LHE file is unchanged, by default False
 
         Raises
         ------
         FileNotFoundError
             Filename should have the .lhe extension
         """
-        if lhefile.split('.')[-1] != 'lhe':
+        if not lhe_compression.is_lhe_filename(lhefile):
             raise FileNotFoundError("LHE File Extension Required for file " + lhefile + "!")
         
         self.lhefile = os.path.abspath(lhefile)
-        self.event_selection_regex = re.compile(r'(?s)(<event>(.*?)</event>)') #regular expression to find every event
-        
-        with open(self.lhefile) as f:
-            self.text = f.read()
-        
-    @functools.cached_property 
-    def cross_section(self):
-        """Gets the cross section and its uncertainty using regular expressions
+        self.compression = lhe_compression.compression(self.lhefile)
+        self.sidecar = sidecar
+    
+    @functools.cached_property
+    def mapped(self):
+        """The memory map of the (decompressed) LHE file as a cached property
         https://docs.python.org/dev/library/functools.html#functools.cached_property
+
         Returns
         -------
-        Tuple[str, str]
-            A tuple of strings containing the cross section and its uncertainty
+        Union[mmap.mmap, bytes]
+            The read-only memory map, or empty bytes for an empty file, which can't be mapped
         """
+        if not self.compression:
+            with open(self.lhefile, 'rb') as f:
+                if not os.fstat(f.fileno()).st_size:
+                    return b""
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        with tempfile.TemporaryFile() as decompressed: #the map keeps the (already deleted) file alive after it is closed
+            with lhe_compression.open_lhe(self.lhefile, 'rb') as f:
+                shutil.copyfileobj(f, decompressed, 1 << 20)
+            decompressed.flush()
+            if not decompressed.tell():
+                return b""
+            return mmap.mmap(decompressed.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    def close(self):
+        """Closes the memory map of the LHE file"""
+        if isinstance(self.__dict__.get('mapped'), mmap.mmap):
+            self.mapped.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    @property
+    def sidecar_filename(self):
+        """The name of the file the event index is saved to when sidecar=True"""
+        return self.lhefile + '.evtidx.npz'
+    
+    @functools.cached_property
+    def event_offsets(self):
+        """The (start, end) byte offsets of every event in the file as a cached property.
+        If sidecar is turned on, the index is read from (or written to) sidecar_filename
+        https://docs.python.org/dev/library/functools.html#functools.cached_property
+
+        Returns
+        -------
+        numpy.ndarray
+            An (N, 2) int64 array of byte offsets, one row per event
+        """
+        stat = os.stat(self.lhefile)
+        if self.sidecar and os.path.isfile(self.sidecar_filename):
+            with np.load(self.sidecar_filename) as saved:
+                if saved['size'] == stat.st_size and saved['mtime'] == stat.st_mtime_ns:
+                    return saved['offsets']
         
-        cross_section = uncertainty = ""
-        
-        # with open(self.lhefile) as getting_cross_section:
-        head = self.non_event_portions[0] #The part before the events contains the cross section
-        
-        #This regex was made by the very very helpful https://pythex.org/ (shoutout UVA professor Upsorn Praphamontripong)
-        cross_finder = re.compile(r'<init>\n.+\n.+(\d+\.\d+E(\+|-)\d{2})\s+(\d+\.\d+E(\+|-)\d{2})\s+(\d+\.\d+E(\+|-)\d{2})(\d|\s)+</init>')
-        cross_section_match = re.search(cross_finder,head)
+        offsets = build_event_index(self.mapped)
         
-        cross_section = cross_section_match.group(1)
+        if self.sidecar:
+            try:
+                with open(self.sidecar_filename, 'wb') as f:
+                    np.savez(f, offsets=offsets, size=stat.st_size, mtime=stat.st_mtime_ns)
+            except OSError:
+                warnings.warn("Could not write the event index to " + self.sidecar_filename, UserWarning)
         
-        uncertainty = cross_section_match.group(3)
+        return offsets
         
-        return float(cross_section), float(uncertainty) #returns the cross section and its uncertainty
+    @functools.cached_property 
+    def cross_section(self):
+        """Gets the cross section and its uncertainty from the header, without reading any events (see read_cross_section)
+        https://docs.python.org/dev/library/functools.html#functools.cached_property
+        Returns
+        -------
+        Tuple[float, float]
+            A tuple of the cross section and its uncertainty, summed over every process in the file
+        """
+        return read_cross_section(self.lhefile)
     
     @functools.cached_property 
     def all_events(self):
-        """This function opens and collects every LHE event and puts them in a list to return
+        """This function collects every LHE event into a list-like object to return.
+        Events are read from the memory map through the event index when accessed
         Attribute is stored as a cached property
         https://docs.python.org/dev/library/functools.html#functools.cached_property
         
         Returns
         -------
-        list[str]
+        lhe_event_list
             A list of every event sequence as strings from the file (everything between every <event> and </event>)
         """
-        all_matches = re.findall(self.event_selection_regex, self.text)
-        all_matches = [item[0] for item in all_matches]
-        return all_matches
+        return lhe_event_list(self.mapped, self.event_offsets)
     
     @functools.cached_property
     def num_events(self):
-        """Returns the number of events in the file as a cached property
+        """Returns the number of events in the file as a cached property.
+        Unless the event index was already built, the file is only scanned for event tags (see count_events)
         https://docs.python.org/dev/library/functools.html#functools.cached_property
         
         Returns
@@ -79,7 +451,9 @@ class lhe_reader(object):
         int
             The number of events in the LHE file
         """
-        return len(self.all_events)
+        if 'event_offsets' in self.__dict__:
+            return len(self.event_offsets)
+        return count_events(self.lhefile)
         
     @functools.cached_property
     def non_event_portions(self):
@@ -92,8 +466,11 @@ class lhe_reader(object):
         Tuple[str, str]
             Two strings of everything before the first <event> and everything after the last </event>
         """
-        f_start = self.text[:self.text.find("<event>")] #everything until the first event
-        f_end = self.text[self.text.rfind("</event>") + len("</event>"):] #everything after the last event
+        if not len(self.event_offsets):
+            return self.mapped[:].decode(), ""
+        
+        f_start = self.mapped[:self.event_offsets[0][0]].decode() #everything until the first event
+        f_end = self.mapped[self.event_offsets[-1][1]:].decode() #everything after the last event
         return f_start, f_end
 
     def __eq__(self, __o: object) -> bool:
@@ -110,10 +487,53 @@ class lhe_reader(object):
             Whether the events are the same
         """
         if isinstance(__o, lhe_reader):
-            if self.all_events == __o.all_events:
-                return True
+            return self.first_difference(__o) is None
         
         return False
+    
+    def first_difference(self, other, normalize_whitespace=False):
+        """Compares the events of two LHE files one at a time through their hashes (see iter_event_hashes),
+        stopping at the first event that differs. Neither file is held in memory
+
+        Parameters
+        ----------
+        other : Union[lhe_reader, str]
+            The other LHE file or its reader
+        normalize_whitespace : bool, optional
+            If True, events that only differ in whitespace (i.e. spacing or line endings) are the same, by default False
+
+        Returns
+        -------
+        Union[int, None]
+            The index of the first event that differs (the number of events in the shorter file if one file has more events),
+            or None if every event is the same
+        """
+        other = other.lhefile if isinstance(other, lhe_reader) else other
+        ours = iter_event_hashes(self.lhefile, normalize_whitespace)
+        theirs = iter_event_hashes(other, normalize_whitespace)
+        for i, (a, b) in enumerate(itertools.zip_longest(ours, theirs)):
+            if a != b:
+                return i
+        return None
+    
+    def content_hash(self, normalize_whitespace=False):
+        """A hash of every event in the file, in order. Files with the same events have the same content hash,
+        so it can be used to find duplicates among many files without comparing every pair
+
+        Parameters
+        ----------
+        normalize_whitespace : bool, optional
+            If True, whitespace differences in the events do not change the hash, by default False
+
+        Returns
+        -------
+        str
+            The hex digest of the BLAKE2b hash of the per-event hashes
+        """
+        hasher = hashlib.blake2b()
+        for digest in iter_event_hashes(self.lhefile, normalize_whitespace):
+            hasher.update(digest)
+        return hasher.hexdigest()
      
     def __str__(self) -> str:
         """Function toString that displays the number of events and the cross section of an LHE file
@@ -129,9 +549,10 @@ class lhe_reader(object):
         to_str += "\n\t\u03C3: " + "{:e}".format(self.cross_section[0]) + "\n" #\u03C3 is the unicode for sigma
         return to_str
 
-    def cut_down_to_size(self, n, verbose=False, shuffled=False, dump=""):
+    def cut_down_to_size(self, n, verbose=False, shuffled=False, dump="", seed=None):
         """Cuts the number of events in an LHE file down to n events while preserving other aspects of the file
-        Outputs a string that should be placed in a file of your choice
+        Outputs a string that should be placed in a file of your choice.
+        The file is streamed through lhe_slicer.slice_lhe_file, which should be used directly to write large slices to a file
 
         Parameters
         ----------
@@ -140,9 +561,11 @@ class lhe_reader(object):
         verbose : bool, optional
             Whether you want the function to be verbose, by default False
         shuffled : bool, optional
-            Whether you want the lhe files to be shuffled before sampling them, by default False
+            Whether you want a random sample of n different events (kept in the order of the file) instead of the first n, by default False
         dump : str, optional
             Place a filename here WITHOUT the .lhe extension if you want to dump the sliced file with the filename of dump, by default ""
+        seed : int, optional
+            The seed for the random sample when shuffled, by default None
 
         Returns
         -------
@@ -156,30 +579,13 @@ class lhe_reader(object):
         ValueError
             n must be > 0
         """
-        start_of_file, end_of_file = self.non_event_portions
-        
-        orig_num = len(self.all_events) #this is a sneaky way to also enforce that all the events are precomputed here
-        
-        try:
-            n = int(n)
-        except:
-            raise TypeError("n should be integer-like!")
-        
-        if n == orig_num:
-            return start_of_file + ("\n".join(self.all_events)) + end_of_file
-        elif n > orig_num:
-            warnings.warn("The number of events selected is > the number of events in the file")
-            return start_of_file + ("\n".join(self.all_events)) + end_of_file #just return the whole file
-        elif n <= 0:
-            raise ValueError("Selecting <= 0 events makes literally no sense")
-        
         if verbose:
-            print("{:.3e}".format(orig_num), "events ->", "{:.3e}".format(n), "events")
+            print("{:.3e}".format(self.num_events), "events ->", "{:.3e}".format(int(n)), "events")
             print("Shuffling is turned", "on" if shuffled else "off")
-            
-        cut_down = np.random.choice(self.all_events, n) if shuffled else self.all_events[:n]
         
-        written_file = start_of_file + ("\n".join(cut_down)) + end_of_file
+        sliced = io.BytesIO()
+        lhe_slicer.slice_lhe_file(self.lhefile, sliced, n, shuffled, seed)
+        written_file = sliced.getvalue().decode()
         
         if dump and not os.path.isfile(dump + '.lhe'):
             with open(dump+'.lhe', 'w+') as f:
@@ -190,6 +596,29 @@ class lhe_reader(object):
         return written_file #this would be placed directly into a file
     
     
+    def output_path(self, output_directory='./', output_prefix='LHE'):
+        """The path of the ROOT file that to_ROOT makes for this LHE file
+
+        Parameters
+        ----------
+        output_directory : str, optional
+            The directory to output the ROOT file to, by default './'
+        output_prefix : str, optional
+            The prefix attached to the ROOT file, by default 'LHE'
+
+        Returns
+        -------
+        str
+            The absolute path of the ROOT file
+        """
+        output_directory = os.path.abspath(output_directory)
+        
+        if output_directory[-1] != '/':
+            output_directory += '/'
+        
+        input_filename = lhe_compression.strip_compression(self.lhefile).split('/')[-1]
+        return output_directory + output_prefix + '_' + input_filename[:input_filename.rfind('.')] + '.root'
+    
     def to_ROOT(self, argument, env, other_args=[], output_directory='./', output_prefix='LHE', verbose=False, replace=False,):
         """Converts a single LHE file to ROOT using the lhe2root tool
         This works best for Higgs->4l of some kind, as that is what lhe2root is made for
@@ -209,7 +638,8 @@ class lhe_reader(object):
         verbose : bool, optional
             If false, all output is suppressed, by default False
         replace : bool, optional
-            If true, when an identical ROOT file is found it will overwrite the file, by default False
+            If true, when an identical ROOT file is found it will overwrite the file, by default False.
+            If false and the ROOT file has an lhe2root checkpoint (i.e. the conversion stopped partway), the conversion is resumed
 
         Raises
         ------
@@ -242,20 +672,22 @@ class lhe_reader(object):
         if not isinstance(env, dict):
             raise TypeError("Environment should be a dictionary i.e. dict(os.environ)")
         
-        output_directory = os.path.abspath(output_directory)
-        
-        if output_directory[-1] != '/':
-            output_directory += '/'
+        outfile = self.output_path(output_directory, output_prefix)
+        output_directory, output_filename = os.path.split(outfile)
+        output_directory += '/'
         
-        input_filename = self.lhefile.split('/')[-1]
-        output_filename = output_prefix + '_' + input_filename[:input_filename.rfind('.')] + '.root'
-        
-        outfile = output_directory + output_filename
+        checkpoint = useful_funcs_and_constants.checkpoint_filename(outfile)
+        resume = False
         if os.path.isfile(outfile):
             print(outfile, "already exists!")
             if replace:
                 print("replacing", outfile)
                 useful_funcs_and_constants.safely_run_process("rm " + output_directory + output_filename, env)
+                if os.path.isfile(checkpoint):
+                    os.remove(checkpoint)
+            elif os.path.isfile(checkpoint):
+                print("resuming", outfile, "from its checkpoint")
+                resume = True
             else:
                 return outfile
         
@@ -277,6 +709,9 @@ class lhe_reader(object):
         if not verbose:
             argList += ['--verbose']
         
+        if resume:
+            argList += ['--resume']
+        
         print(argList)
         lhe2root.main(argList)
         # running_str = "python3 lhe2root.py --" + argument + " " + output_directory + output_filename + ' '
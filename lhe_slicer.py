@@ -0,0 +1,163 @@
+import os
+import random
+import tempfile
+import warnings
+import lhe_compression
+
+
+def iter_events(f, blocksize=1 << 24):
+    """Splits a binary LHE stream into events while holding at most a block (and the event being read) in memory
+
+    Parameters
+    ----------
+    f : io.IOBase
+        The LHE file opened in binary mode
+    blocksize : int, optional
+        The number of bytes read at a time, by default 16 MiB
+
+    Yields
+    ------
+    tuple[bytes, Union[bytes, None]]
+        The text since the end of the previous event (the header for the first event) and the event from <event> to </event>.
+        The last pair is everything after the last complete event (the footer) and None
+    """
+    buffer = b""
+    finished = False
+    while not finished:
+        block = f.read(blocksize)
+        finished = not block
+        buffer += block
+
+        position = 0
+        while True:
+            start = buffer.find(b"<event>", position)
+            if start == -1:
+                break
+            end = buffer.find(b"</event>", start)
+            if end == -1:
+                break
+            end += len(b"</event>")
+            yield buffer[position:start], buffer[start:end]
+            position = end
+        buffer = buffer[position:] #only what is left of the block is copied
+
+    yield buffer, None
+
+
+def _footer(f, blocksize=1 << 20):
+    """Finds everything after the last </event> by reading the end of a seekable stream. Returns None if it is not in the last block"""
+    size = f.seek(0, os.SEEK_END)
+    f.seek(max(0, size - blocksize))
+    tail = f.read()
+    end = tail.rfind(b"</event>")
+    if end == -1:
+        return None
+    return tail[end + len(b"</event>"):]
+
+
+def slice_lhe_file(lhefile, outfile, n, shuffled=False, seed=None, blocksize=1 << 24):
+    """Writes the header, n of the events and the footer of an LHE file to another file, streaming through the input.
+    Either the first n events are kept, or (if shuffled) a uniform sample of n events without replacement chosen with reservoir sampling.
+    Only the sampled events are kept in memory, and they are written in the order they appear in the input.
+    The events are separated by newlines, the same as in lhe_reader.cut_down_to_size
+
+    Parameters
+    ----------
+    lhefile : str
+        The (possibly compressed) LHE file to slice
+    outfile : Union[str, io.IOBase]
+        The file to write to. A filename is written to a temporary file first and then renamed, so it never holds a partial slice.
+        A file object should be open in binary mode
+    n : int
+        The number of events you want to keep
+    shuffled : bool, optional
+        Whether to sample the events at random instead of keeping the first n, by default False
+    seed : int, optional
+        The seed for the random sample, by default None
+    blocksize : int, optional
+        The number of bytes read at a time, by default 16 MiB
+
+    Returns
+    -------
+    int
+        The number of events written
+
+    Raises
+    ------
+    TypeError
+        n should have the ability to become an integer
+    ValueError
+        n must be > 0
+    """
+    try:
+        n = int(n)
+    except:
+        raise TypeError("n should be integer-like!")
+
+    if n <= 0:
+        raise ValueError("Selecting <= 0 events makes literally no sense")
+
+    if isinstance(outfile, str):
+        directory = os.path.dirname(os.path.abspath(outfile))
+        with tempfile.NamedTemporaryFile(dir=directory, suffix='.tmp', delete=False) as f:
+            try:
+                written = slice_lhe_file(lhefile, f, n, shuffled, seed, blocksize)
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, outfile)
+        return written
+
+    with lhe_compression.open_lhe(lhefile, 'rb') as f:
+        header = footer = None
+        kept = [] #the reservoir, as (index, event)
+        rng = random.Random(seed)
+        written = total = 0
+        for gap, event in iter_events(f, blocksize):
+            if event is None:
+                footer = gap
+                break
+
+            if header is None:
+                header = gap
+                outfile.write(header)
+
+            if not shuffled:
+                if written < n:
+                    if written:
+                        outfile.write(b"\n")
+                    outfile.write(event)
+                    written += 1
+                    if written == n and f.seekable():
+                        position = f.tell()
+                        footer = _footer(f) #saves reading the rest of the events
+                        if footer is not None:
+                            break
+                        f.seek(position) #the footer starts further back, so the rest of the events are read through
+                continue
+
+            if total < n:
+                kept.append((total, event))
+            else:
+                i = rng.randrange(total + 1)
+                if i < n:
+                    kept[i] = (total, event)
+            total += 1
+
+        if header is None: #there are no events, so the whole file is the header
+            outfile.write(footer)
+            warnings.warn("The number of events selected is > the number of events in the file")
+            return 0
+
+        if shuffled:
+            if total < n:
+                warnings.warn("The number of events selected is > the number of events in the file")
+            kept.sort()
+            outfile.write(b"\n".join(event for _, event in kept))
+            written = len(kept)
+        elif written < n:
+            warnings.warn("The number of events selected is > the number of events in the file")
+
+        outfile.write(footer)
+        return written
@@ -0,0 +1,221 @@
+import re
+import collections
+import numpy as np
+
+LHEParticle = collections.namedtuple("LHEParticle", "id status mother1 mother2 px py pz e m line")
+TokenizedEvent = collections.namedtuple("TokenizedEvent", "weight weights particles")
+
+
+class WeightLayout(object):
+    def __init__(self, ids):
+        """Where each reweighting weight of a file goes in a row of weights, resolved once for the whole file.
+        The columns are the weight ids in sorted order, and the weights of an event are expected to come in the order of ids,
+        so each <wgt> line is matched to its column by its position and only looked up by id if it is out of place
+
+        Parameters
+        ----------
+        ids : list[str]
+            The weight ids in the order they appear in the header (and in every event)
+        """
+        self.ids = list(ids)
+        self.columns = {weightid: column for column, weightid in enumerate(sorted(self.ids))}
+        self.prefixes = ["<wgt id='" + weightid + "'" for weightid in self.ids]
+        self.order = np.array([self.columns[weightid] for weightid in self.ids], dtype=np.intp)
+        self.row = np.full(len(self.ids), np.nan)
+
+    @classmethod
+    def from_header(cls, header):
+        """Reads the weight ids from the <initrwgt> block of an LHE header
+
+        Parameters
+        ----------
+        header : str
+            Everything before the first event (see lhe_reader.read_head)
+
+        Returns
+        -------
+        WeightLayout
+            The layout of the weights declared in the header
+
+        Raises
+        ------
+        ValueError
+            If the header does not declare any weights
+        """
+        start = header.find("<initrwgt>")
+        end = header.find("</initrwgt>", start)
+        if start == -1 or end == -1:
+            raise ValueError("The header has no <initrwgt> block declaring the weights")
+        ids = re.findall(r"""<weight\s+id\s*=\s*['"]([^'"]+)['"]""", header[start:end])
+        if not ids:
+            raise ValueError("The <initrwgt> block of the header does not declare any weights")
+        return cls(ids)
+
+    def parse(self, event):
+        """Parses the <wgt> weights of an event into row
+
+        Parameters
+        ----------
+        event : str
+            The string consisting of a single event between <event> and </event>
+
+        Returns
+        -------
+        numpy.ndarray
+            row, with the weights in the columns of their ids and NaN for weights the event does not have
+        """
+        self.row.fill(np.nan)
+        start = event.find("<wgt id='")
+        if start == -1:
+            return self.row
+        end = event.rfind("</wgt>")
+        weights = [weight.strip() for weight in event[start:end].split("</wgt>")]
+        
+        if len(weights) == len(self.prefixes) and all(map(str.startswith, weights, self.prefixes)): #every weight is where the header says it is
+            try:
+                self.row[self.order] = [float(weight[weight.find(">") + 1:]) for weight in weights]
+                return self.row
+            except ValueError:
+                self.row.fill(np.nan)
+        
+        for weight in weights:
+            idend = weight.find("'", 9)
+            column = self.columns.get(weight[9:idend])
+            if column is None:
+                continue
+            try:
+                self.row[column] = float(weight[weight.find(">", idend) + 1:])
+            except ValueError:
+                pass
+        return self.row
+
+    @property
+    def sortedids(self):
+        """The weight id of each column"""
+        return sorted(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def tokenize_event(event, weightlayout=None):
+    """Reads a single LHE event block in one pass and returns its weights and particle records
+
+    Parameters
+    ----------
+    event : str
+        The string consisting of a single event between <event> and </event>
+    weightlayout : WeightLayout, optional
+        If given, the <wgt> weights are parsed into weightlayout.row (NaN for weights the event does not have)
+        instead of a dictionary, by default None
+
+    Returns
+    -------
+    TokenizedEvent
+        A namedtuple of the event weight, the <wgt> weights (a dictionary keyed by their id, or weightlayout.row),
+        and a list of LHEParticle records in the order they appear in the event
+
+    Raises
+    ------
+    ValueError
+        Raises when the number of particles is wrong in the event
+    """
+    weights = {}
+    if weightlayout is not None:
+        weights = weightlayout.parse(event)
+    particles = []
+    info = None
+    for line in event.split("\n"):
+        if "<" in line or ">" in line:
+            if weightlayout is None and line.startswith("<wgt id='"):
+                idend = line.find("'", 9)
+                valuestart = line.find(">", idend) + 1
+                valueend = line.find("</wgt>", valuestart)
+                if idend != -1 and valueend != -1:
+                    try:
+                        weights[line[9:idend]] = float(line[valuestart:valueend])
+                    except ValueError:
+                        pass
+            continue
+
+        if "#" in line:
+            line = line.split("#")[0]
+        fields = line.split()
+        if not fields:
+            continue
+
+        if info is None:
+            info = fields
+            continue
+
+        particles.append(LHEParticle(int(fields[0]), int(fields[1]), int(fields[2]), int(fields[3]),
+                                     float(fields[6]), float(fields[7]), float(fields[8]), float(fields[9]), float(fields[10]),
+                                     line))
+
+    nparticles, _, weight, _, _, _ = info
+    nparticles = int(nparticles)
+    if nparticles != len(particles):
+        raise ValueError("Wrong number of particles! Should be {}, have {}".format(nparticles, len(particles)))
+
+    return TokenizedEvent(float(weight), weights, particles)
+
+
+def iter_event_blocks(f):
+    """Splits an open LHE file into event blocks without building each event one line at a time
+
+    Parameters
+    ----------
+    f : Iterable[str]
+        An open LHE file (or anything else that yields its lines)
+
+    Yields
+    ------
+    tuple[int, str]
+        The line number of the </event> tag and the text from <event> to </event>
+    """
+    lines = None
+    for linenumber, line in enumerate(f, start=1):
+        if lines is None:
+            if "<event>" not in line:
+                continue
+            lines = []
+        lines.append(line)
+        if "</event>" in line:
+            yield linenumber, "".join(lines)
+            lines = None
+
+
+def iter_byte_range(f, start, end, positions=False):
+    """Yields the decoded lines of a file opened in binary mode that start within a range of byte offsets
+
+    Parameters
+    ----------
+    f : io.BufferedReader
+        An LHE file opened in binary mode. Streams that can't seek have to be at the start of the file
+    start : int
+        The byte offset to start reading from, which should be the start of a line (i.e. of an <event> tag)
+    end : int
+        The byte offset to stop at. The line that starts before end and contains it is still read
+    positions : bool, optional
+        If True, every line comes with the byte offset just after it, by default False
+
+    Yields
+    ------
+    Union[str, tuple[int, str]]
+        Every line between start and end, or (the offset after the line, the line) if positions is True
+    """
+    if f.seekable():
+        f.seek(start)
+    else: #i.e. a stream being decompressed, which can only be read forwards from the start
+        remaining = start
+        while remaining > 0:
+            skipped = len(f.read(min(remaining, 1 << 20)))
+            if not skipped:
+                break
+            remaining -= skipped
+    position = start
+    for line in f:
+        if position >= end:
+            break
+        position += len(line)
+        yield (position, line.decode()) if positions else line.decode()
@@ -1,10 +1,11 @@
 import abc
+import itertools
 import collections
-import re
 
 if __name__ == "__main__":
-  import argparse, itertools, sys, unittest
-  from .mela import TVar
+  import argparse, itertools, os, sys, unittest
+  import numpy as np
+  from mela import TVar
   parser = argparse.ArgumentParser()
   parser.add_argument('--lhefile-hwithdecay')
   parser.add_argument('--lhefile-hwithdecayonly')  
@@ -16,63 +17,50 @@ if __name__ == "__main__":
 import ROOT
 
 from mela import Mela, SimpleParticle_t, SimpleParticleCollection_t
+from lhe_tokenizer import tokenize_event, iter_event_blocks, iter_byte_range
+from lhe_compression import open_lhe
+from lhe_kinematics import merge_fsr_photons
+from lhe_ancestry import event_ancestry, HIGGS
+from stage_profiler import NULL_PROFILER
 
 InputEvent = collections.namedtuple("InputEvent", "daughters associated mothers isgen")
 
 class LHEEvent(object, metaclass=abc.ABCMeta):
-  def __init__(self, event, isgen):
-    lines = event.split("\n")
+  def __init__(self, event, isgen, weightlayout=None, build=True):
+    self.weight, self.weights, particles = tokenize_event(event, weightlayout)
 
-    self.weights = {}
-    for line in lines:
-      if "<wgt" not in line: continue
-      match = re.match("<wgt id='(.*)'>([0-9+Ee.-]*)</wgt>", line)
-      if match: self.weights[match.group(1)] = float(match.group(2))
+    self.lhedaughters, self.lheassociated, self.lhemothers = self.extracteventparticles(particles, isgen)
+    self.isgen = isgen
+    if build: self.build()
 
-    lines = [line for line in lines if not ("<" in line or ">" in line or not line.split("#")[0].strip())]
-    nparticles, _, weight, _, _, _ = lines[0].split()
-
-    nparticles = int(nparticles)
-    self.weight = float(weight)
-    if nparticles != len(lines)-1:
-      raise ValueError("Wrong number of particles! Should be {}, have {}".format(nparticles, len(lines)-1))
-
-    daughters, associated, mothers = (SimpleParticleCollection_t(_) for _ in self.extracteventparticles(lines[1:], isgen))
+  def build(self):
+    "makes the MELA particle collections from the particle records, which can be edited (i.e. by a photon merger) before this is called"
+    daughters, associated, mothers = (SimpleParticleCollection_t(_ if _ is None else [particle.line for particle in _]) for _ in (self.lhedaughters, self.lheassociated, self.lhemothers))
     if not list(mothers): mothers = None
-    self.daughters, self.associated, self.mothers, self.isgen = self.inputevent = InputEvent(daughters, associated, mothers, isgen)
+    self.daughters, self.associated, self.mothers, self.isgen = self.inputevent = InputEvent(daughters, associated, mothers, self.isgen)
 
   @abc.abstractmethod
-  def extracteventparticles(cls, lines, isgen): "has to be a classmethod that returns daughters, associated, mothers"
+  def extracteventparticles(cls, particles, isgen): "has to be a classmethod that takes LHEParticle records and returns the records of the daughters, associated, mothers"
 
   def __iter__(self):
     return iter(self.inputevent)
 
 class LHEEvent_Hwithdecay(LHEEvent):
   @classmethod
-  def extracteventparticles(cls, lines, isgen):
+  def extracteventparticles(cls, particles, isgen):
     daughters, mothers, associated = [], [], []
-    ids = [None]
-    mother1s = [None]
-    mother2s = [None]
-    for line in lines:
-      id, status, mother1, mother2 = (int(_) for _ in line.split()[0:4])
-      ids.append(id)
+    ancestry = event_ancestry(particles)
+    for particle, resonance in zip(particles, ancestry.resonance):
+      id, status = particle[:2]
       if (1 <= abs(id) <= 6 or abs(id) == 21) and not isgen:
-        line = line.replace(str(id), "0", 1)  #replace the first instance of the jet id with 0, which means unknown jet
-      mother1s.append(mother1)
-      mother2s.append(mother2)
+        particle = particle._replace(id=0, line=particle.line.replace(str(id), "0", 1))  #replace the first instance of the jet id with 0, which means unknown jet
       if status == -1:
-        mothers.append(line)
+        mothers.append(particle)
       elif status == 1 and (1 <= abs(id) <= 6 or 11 <= abs(id) <= 16 or abs(id) in (21, 22)):
-        while True:
-          if mother1 != mother2 or mother1 is None:
-            associated.append(line)
-            break
-          if ids[mother1] in (25, 39):
-            daughters.append(line)
-            break
-          mother2 = mother2s[mother1]
-          mother1 = mother1s[mother1]
+        if resonance == HIGGS: #through a chain of only mothers
+          daughters.append(particle)
+        else:
+          associated.append(particle)
 
     if not isgen: mothers = None
     return daughters, associated, mothers
@@ -80,33 +68,24 @@ class LHEEvent_Hwithdecay(LHEEvent):
 
 class LHEEvent_VHHiggsdecay(LHEEvent):
   @classmethod
-  def extracteventparticles(cls, lines, isgen):
+  def extracteventparticles(cls, particles, isgen):
     daughters, mothers, associated = [], [], []
-    ids = [None]
-    mother1s = [None]
-    mother2s = [None]
-    for line in lines:
-      id, status, mother1, mother2 = (int(_) for _ in line.split()[0:4])
-      ids.append(id)
+    ancestry = event_ancestry(particles)
+    for particle, parentid, grandparentid in zip(particles, ancestry.parentid, ancestry.grandparentid):
+      id, status = particle[:2]
       
       #if (1 <= abs(id) <= 6 or abs(id) == 21) and not isgen:
       #  line = line.replace(str(id), "0", 1)  #replace the first instance of the jet id with 0, which means unknown jet
-      mother1s.append(mother1)
-      mother2s.append(mother2)
       if status == -1:
-        mothers.append(line)
+        mothers.append(particle)
       elif status == 1 and (1 <= abs(id) <= 6 or 11 <= abs(id) <= 16 or abs(id) in (21, 22)):
-        
-          if mother1 is None or ids is None or mother1s[mother1] is None :
-            #associated.append(line)
-            continue
-          
-          if mother1 == mother2 and abs(ids[mother1]) in (23,24) and  not ids[mother1s[mother1]] == 25 :
-            associated.append(line)
+          #parentid is 0 unless the particle has a single mother
+          if abs(parentid) in (23,24) and not grandparentid == 25 :
+            associated.append(particle)
             
           
-          if mother1 == mother2 and abs(ids[mother1]) == 23 and  ids[mother1s[mother1]] == 25:
-            daughters.append(line)
+          if abs(parentid) == 23 and grandparentid == 25:
+            daughters.append(particle)
             
     if not isgen: mothers = None
     return daughters, associated, mothers
@@ -115,23 +94,23 @@ class LHEEvent_VHHiggsdecay(LHEEvent):
   
 class LHEEvent_HwithdecayOnly(LHEEvent):
   @classmethod
-  def extracteventparticles(cls, lines, isgen):
+  def extracteventparticles(cls, particles, isgen):
     daughters, mothers, associated = [], [], []
     ids = [None]
     mother1s = [None]
     mother2s = [None]
-    for line in lines:
-      id, status, mother1, mother2 = (int(_) for _ in line.split()[0:4])
+    for particle in particles:
+      id, status, mother1, mother2 = particle[:4]
       ids.append(id)
       if (1 <= abs(id) <= 6 or abs(id) == 21) and not isgen:
-        line = line.replace(str(id), "0", 1)  #replace the first instance of the jet id with 0, which means unknown jet
+        particle = particle._replace(id=0, line=particle.line.replace(str(id), "0", 1))  #replace the first instance of the jet id with 0, which means unknown jet
       mother1s.append(mother1)
       mother2s.append(mother2)
       if(abs(id) == 22 ):
-        associated.append(line)
+        associated.append(particle)
       #1 <= abs(id) <= 6 or
       if ( 11 <= abs(id) <= 16 ):
-          daughters.append(line)
+          daughters.append(particle)
           #if args.merge_photon:
           #  print line
 
@@ -144,27 +123,27 @@ class LHEEvent_HwithdecayOnly(LHEEvent):
   
 class LHEEvent_StableHiggs(LHEEvent):
   @classmethod
-  def extracteventparticles(cls, lines, isgen):
+  def extracteventparticles(cls, particles, isgen):
     daughters, mothers, associated = [], [], []
-    for line in lines:
-      id, status, mother1, mother2 = (int(_) for _ in line.split()[0:4])
+    for particle in particles:
+      id, status, mother1, mother2 = particle[:4]
       if (1 <= abs(id) <= 6 or abs(id) == 21) and not isgen:
-        line = line.replace(str(id), "0", 1)  #replace the first instance of the jet id with 0, which means unknown jet
+        particle = particle._replace(id=0, line=particle.line.replace(str(id), "0", 1))  #replace the first instance of the jet id with 0, which means unknown jet
       if status == -1:
-        mothers.append(line)
+        mothers.append(particle)
       if id == 25:
         if status != 1:
-          raise ValueError("Higgs has status {}, expected it to be 1\n\n".format(status) + "\n".join(lines))
-        daughters.append(line)
+          raise ValueError("Higgs has status {}, expected it to be 1\n\n".format(status) + "\n".join(p.line for p in particles))
+        daughters.append(particle)
       if abs(id) in (0, 1, 2, 3, 4, 5, 11, 12, 13, 14, 15, 16, 21) and status == 1:
-        associated.append(line)
+        associated.append(particle)
 
     if len(daughters) != 1:
-      raise ValueError("More than one H in the event??\n\n"+"\n".join(lines))
+      raise ValueError("More than one H in the event??\n\n"+"\n".join(p.line for p in particles))
     if cls.nassociatedparticles is not None and len(associated) != cls.nassociatedparticles:
-      raise ValueError("Wrong number of associated particles (expected {}, found {})\n\n".format(cls.nassociatedparticles, len(associated))+"\n".join(lines))
+      raise ValueError("Wrong number of associated particles (expected {}, found {})\n\n".format(cls.nassociatedparticles, len(associated))+"\n".join(p.line for p in particles))
     if len(mothers) != 2:
-      raise ValueError("{} mothers in the event??\n\n".format(len(mothers))+"\n".join(lines))
+      raise ValueError("{} mothers in the event??\n\n".format(len(mothers))+"\n".join(p.line for p in particles))
 
     if not isgen: mothers = None
     return daughters, associated, mothers
@@ -173,31 +152,23 @@ class LHEEvent_StableHiggs(LHEEvent):
 
 class LHEEvent_StableHiggsVH(LHEEvent):
   @classmethod
-  def extracteventparticles(cls, lines, isgen):
+  def extracteventparticles(cls, particles, isgen):
     daughters, mothers, associated = [], [], []
-    ids = [None]
-    mother1s = [None]
-    mother2s = [None]
-    for line in lines:
-      id, status, mother1, mother2 = (int(_) for _ in line.split()[0:4])
-      ids.append(id)
+    ancestry = event_ancestry(particles)
+    for particle, parentid, grandparentid in zip(particles, ancestry.parentid, ancestry.grandparentid):
+      id, status = particle[:2]
 
       #if (1 <= abs(id) <= 6 or abs(id) == 21) and not isgen:
       #  line = line.replace(str(id), "0", 1)  #replace the first instance of the jet id with 0, which means unknown jet
-      mother1s.append(mother1)
-      mother2s.append(mother2)
       if status == -1:
-        mothers.append(line)
+        mothers.append(particle)
       elif id == 25:
-        daughters.append(line)
+        daughters.append(particle)
       elif status == 1 and (1 <= abs(id) <= 6 or 11 <= abs(id) <= 16 or abs(id) in (21, 22)):
 
-          if mother1 is None or ids is None or mother1s[mother1] is None :
-            #associated.append(line)
-            continue
-
-          if mother1 == mother2 and abs(ids[mother1]) in (23,24) and not ids[mother1s[mother1]] == 25 :
-            associated.append(line)
+          #parentid is 0 unless the particle has a single mother
+          if abs(parentid) in (23,24) and not grandparentid == 25 :
+            associated.append(particle)
  
           #elif mother1!= mother2:
             #associated.append(line)
@@ -208,27 +179,27 @@ class LHEEvent_StableHiggsVH(LHEEvent):
 
 class LHEEvent_StableHiggsZHHAWK(LHEEvent):
   @classmethod
-  def extracteventparticles(cls, lines, isgen):
+  def extracteventparticles(cls, particles, isgen):
     daughters, mothers, associated = [], [], []
-    for line in lines:
-      id, status, mother1, mother2 = (int(_) for _ in line.split()[0:4])
+    for particle in particles:
+      id, status, mother1, mother2 = particle[:4]
       if (1 <= abs(id) <= 6 or abs(id) == 21) and not isgen:
-        line = line.replace(str(id), "0", 1)  #replace the first instance of the jet id with 0, which means unknown jet
+        particle = particle._replace(id=0, line=particle.line.replace(str(id), "0", 1))  #replace the first instance of the jet id with 0, which means unknown jet
       if status == -1:
-        mothers.append(line)
+        mothers.append(particle)
       if id == 25:
         if status != 1:
-          raise ValueError("Higgs has status {}, expected it to be 1\n\n".format(status) + "\n".join(lines))
-        daughters.append(line)
+          raise ValueError("Higgs has status {}, expected it to be 1\n\n".format(status) + "\n".join(p.line for p in particles))
+        daughters.append(particle)
       if abs(id) in (0, 1, 2, 3, 4, 5, 11, 12, 13, 14, 15, 16, 21,22) and status == 1:
-        associated.append(line)
+        associated.append(particle)
 
     if len(daughters) != 1:
-      raise ValueError("More than one H in the event??\n\n"+"\n".join(lines))
+      raise ValueError("More than one H in the event??\n\n"+"\n".join(p.line for p in particles))
     if cls.nassociatedparticles is not None and len(associated) != cls.nassociatedparticles:
-      raise ValueError("Wrong number of associated particles (expected {}, found {})\n\n".format(cls.nassociatedparticles, len(associated))+"\n".join(lines))
+      raise ValueError("Wrong number of associated particles (expected {}, found {})\n\n".format(cls.nassociatedparticles, len(associated))+"\n".join(p.line for p in particles))
     if len(mothers) != 2:
-      raise ValueError("{} mothers in the event??\n\n".format(len(mothers))+"\n".join(lines))
+      raise ValueError("{} mothers in the event??\n\n".format(len(mothers))+"\n".join(p.line for p in particles))
 
     if not isgen: mothers = None
     return daughters, associated, mothers
@@ -245,31 +216,43 @@ class LHEEvent_JHUGenttH(LHEEvent_StableHiggs):
 
 class LHEEvent_Offshell4l(LHEEvent):
   @classmethod
-  def extracteventparticles(cls, lines, isgen):
+  def extracteventparticles(cls, particles, isgen):
     daughters, mothers, associated = [], [], []
-    for line in lines:
-      id, status, mother1, mother2 = (int(_) for _ in line.split()[0:4])
+    for particle in particles:
+      id, status, mother1, mother2 = particle[:4]
       if (1 <= abs(id) <= 6 or abs(id) == 21) and not isgen:
-        line = line.replace(str(id), "0", 1)  #replace the first instance of the jet id with 0, which means unknown jet
+        particle = particle._replace(id=0, line=particle.line.replace(str(id), "0", 1))  #replace the first instance of the jet id with 0, which means unknown jet
       if status == -1:
-        mothers.append(line)
+        mothers.append(particle)
       if abs(id) in (11, 12, 13, 14, 15, 16) and status == 1:
-        daughters.append(line)
+        daughters.append(particle)
       if abs(id) in (0, 1, 2, 3, 4, 5, 21) and status == 1:
-        associated.append(line)
+        associated.append(particle)
 
     if len(daughters) != 4:
-      raise ValueError("Wrong number of daughters (expected {}, found {})\n\n".format(4, len(daughters))+"\n".join(lines))
+      raise ValueError("Wrong number of daughters (expected {}, found {})\n\n".format(4, len(daughters))+"\n".join(p.line for p in particles))
     if cls.nassociatedparticles is not None and len(associated) != cls.nassociatedparticles:
-      raise ValueError("Wrong number of associated particles (expected {}, found {})\n\n".format(cls.nassociatedparticles, len(associated))+"\n".join(lines))
+      raise ValueError("Wrong number of associated particles (expected {}, found {})\n\n".format(cls.nassociatedparticles, len(associated))+"\n".join(p.line for p in particles))
     if len(mothers) != 2:
-      raise ValueError("{} mothers in the event??\n\n".format(len(mothers))+"\n".join(lines))
+      raise ValueError("{} mothers in the event??\n\n".format(len(mothers))+"\n".join(p.line for p in particles))
 
     if not isgen: mothers = None
     return daughters, associated, mothers
 
   nassociatedparticles = None
 
+def merge_photons_into_daughters(lheevents, cone=None):
+  "for Prophecy: merges every FSR photon in the associated particles into the closest daughter. The photon is kept in the associated particles for reference"
+  merged = merge_fsr_photons([lheevent.lheassociated for lheevent in lheevents], [lheevent.lhedaughters for lheevent in lheevents], cone)
+  for lheevent, daughters in zip(lheevents, merged):
+    lheevent.lhedaughters = daughters
+
+def merge_photons_into_associated(lheevents, cone=None):
+  "for HAWK ZH: merges every FSR photon in the associated particles into the closest other associated particle and removes the photon"
+  merged = merge_fsr_photons([lheevent.lheassociated for lheevent in lheevents], [lheevent.lheassociated for lheevent in lheevents], cone)
+  for lheevent, associated in zip(lheevents, merged):
+    lheevent.lheassociated = [particle for particle in associated if particle.id != 22]
+
 class LHEFileBase(object, metaclass=abc.ABCMeta):
   """
   Simple class to iterate through an LHE file and calculate probabilities for each event
@@ -291,7 +274,12 @@ class LHEFileBase(object, metaclass=abc.ABCMeta):
   def __init__(self, filename, *melaargs, **kwargs):
     self.isgen = kwargs.pop("isgen", True)
     reusemela = kwargs.pop("reusemela", False)
-    gzip = kwargs.pop("gzip", False)
+    kwargs.pop("gzip", None) #kept for compatibility, compressed files are recognized by their extension
+    self.byterange = kwargs.pop("byterange", None)
+    self.weightlayout = kwargs.pop("weightlayout", None) #a lhe_tokenizer.WeightLayout to parse the <wgt> weights into a row instead of a dict
+    self.profiler = kwargs.pop("profiler", NULL_PROFILER) #a stage_profiler.StageProfiler that times reading, parsing and setInputEvent
+    self.photonmerger = kwargs.pop("photonmerger", None) #a function that edits the particle records of a chunk of LHEEvents before MELA sees them, i.e. merge_photons_into_daughters
+    self.byteoffset = None #with a byterange, the byte offset just after the current event, where reading would continue from
     if kwargs: raise ValueError("Unknown kwargs: " + ", ".join(kwargs))
     self.filename = filename
     if reusemela and melaargs in self.__melas:
@@ -299,49 +287,86 @@ class LHEFileBase(object, metaclass=abc.ABCMeta):
     else:
       self.__melas[melaargs] = self.mela = Mela(*melaargs)
 
-    openfunction = open
-    if gzip: from gzip import GzipFile as openfunction
-    self.f = openfunction(self.filename)
+    if self.byterange is None:
+      self.f = open_lhe(self.filename)
+    else:
+      self.f = open_lhe(self.filename, "rb")
   def __enter__(self, *args, **kwargs):
     self.f.__enter__(*args, **kwargs)
     return self
   def __exit__(self, *args, **kwargs):
     return self.f.__exit__(*args, **kwargs)
 
+  photonmergechunk = 1000 #the number of events the photon merger gets at once
+
   def __iter__(self):
-    event = ""
-    for linenumber, line in enumerate(self.f, start=1):
-      if "<event>" not in line and not event:
-        continue
-      event += line
-      if "</event>" in line:
+    if self.byterange is None:
+      blocks = ((linenumber, event, None) for linenumber, event in iter_event_blocks(self.f))
+    else:
+      blocks = ((linenumber, event, self.readoffset) for linenumber, event in iter_event_blocks(self._byterangelines()))
+    blocks = self.profiler.iterate("read", blocks)
+    if self.photonmerger is not None:
+      blocks = self._mergedevents(blocks)
+    for linenumber, event, self.byteoffset in blocks:
+      try:
+        self._setInputEvent(event)
+        yield self
+      except GeneratorExit:
+        raise
+      except:
+        print("On line", linenumber)
+        raise
+      finally:
         try:
-          self._setInputEvent(event)
-          yield self
-          event = ""
-        except GeneratorExit:
-          raise
+          self.mela.resetInputEvent()
+        except:
+          pass
+
+  def _byterangelines(self):
+    "the lines of the byte range, keeping readoffset at the byte offset just after the last line read"
+    for self.readoffset, line in iter_byte_range(self.f, *self.byterange, positions=True):
+      yield line
+
+  def _mergedevents(self, blocks):
+    "reads the events a chunk at a time and runs the photon merger on each chunk"
+    while True:
+      linenumbers, lheevents, offsets = [], [], []
+      for linenumber, event, offset in itertools.islice(blocks, self.photonmergechunk):
+        try:
+          with self.profiler.stage("parse"):
+            lheevent = self.lheeventclass(event, self.isgen, self.weightlayout, build=False)
         except:
           print("On line", linenumber)
           raise
-        finally:
-          try:
-            self.mela.resetInputEvent()
-          except:
-            pass
-
-  def _setInputEvent(self, event):
-    lheevent = self.lheeventclass(event, self.isgen)
+        if self.weightlayout is not None: lheevent.weights = lheevent.weights.copy() #the layout reuses its row for every event
+        linenumbers.append(linenumber)
+        lheevents.append(lheevent)
+        offsets.append(offset)
+      if not lheevents: return
+      with self.profiler.stage("photonmerge"):
+        self.photonmerger(lheevents)
+      for linenumber, lheevent, offset in zip(linenumbers, lheevents, offsets):
+        with self.profiler.stage("build"):
+          lheevent.build()
+        yield linenumber, lheevent, offset
+
+  def _setInputEvent(self, lheevent):
+    if not isinstance(lheevent, LHEEvent): #the text of the event
+      with self.profiler.stage("parse"):
+        lheevent = self.lheeventclass(lheevent, self.isgen, self.weightlayout)
     self.daughters = lheevent.daughters
     self.associated = lheevent.associated
     self.mothers = lheevent.mothers
     self.weight = lheevent.weight
     self.weights = lheevent.weights
-    self.setInputEvent(*lheevent)
+    self.lhedaughters = lheevent.lhedaughters
+    self.lheassociated = lheevent.lheassociated
+    with self.profiler.stage("setInputEvent"):
+      self.setInputEvent(*lheevent)
 
   @classmethod
   def _LHEclassattributes(cls):
-    return "filename", "f", "mela", "isgen", "daughters", "mothers", "associated", "weight", "weights"
+    return "filename", "f", "byterange", "readoffset", "byteoffset", "mela", "isgen", "daughters", "mothers", "associated", "weight", "weights", "weightlayout", "profiler", "photonmerger", "lhedaughters", "lheassociated"
 
   def __getattr__(self, attr):
     if attr == "mela": raise RuntimeError("Something is wrong, trying to access mela before it's created")
@@ -373,6 +398,16 @@ class LHEFile_VHHiggsdecay(LHEFileBase):
   
 if __name__ == '__main__':
   class TestLHEFiles(unittest.TestCase):
+    @staticmethod
+    def runlhe2root(arguments):
+      "runs lhe2root.main, which sends stdout to /dev/null"
+      import lhe2root
+      stdout = sys.stdout
+      try:
+        lhe2root.main(arguments)
+      finally:
+        sys.stdout = stdout
+
     @unittest.skipUnless(args.lhefile_hwithdecay, "needs --lhefile-hwithdecay argument")
     def testHwithDecay(self):
       with LHEFile_Hwithdecay(args.lhefile_hwithdecay) as f:
@@ -408,4 +443,229 @@ if __name__ == '__main__':
         for event, i in zip(f, list(range(10))):
           pass
 
+    def testKinematicBranches(self):
+      "lhe2root.kinematic_branches gives the same branches for a batch as the per-event TLorentzVector code it replaced"
+      import argparse, shutil, tempfile
+      import lhe2root
+      from benchmarks.synthetic_lhe import generate_lhe_file
+      def oldkinematics(args, event):
+        branches = {}
+        pH = sum((particle.second for particle in event.daughters), ROOT.TLorentzVector())
+        if args.vbf:
+          branches["HJJpz"] = sum((particle.second for particle in itertools.chain(event.daughters, event.associated)), ROOT.TLorentzVector()).Pz()
+          pj1 = event.associated[0].second
+          pj2 = event.associated[1].second
+          if pj1.Pt() > pj2.Pt():
+            branches["Dphijj"] = pj1.DeltaPhi(pj2)
+          else:
+            branches["Dphijj"] = pj2.DeltaPhi(pj1)
+        if not args.ggH4l:
+          branches["ptH"], branches["pxH"], branches["pyH"], branches["pzH"], branches["EH"], branches["rapH"] = pH.Pt(), pH.Px(), pH.Py(), pH.Pz(), pH.E(), pH.Rapidity()
+        if not args.vbf and not args.zh and not args.wh and not args.zh_lep and not args.wh_lep and not args.zh_lep_hawk:
+          for n, daughter in enumerate(event.daughters[:4]):
+            pdau = daughter.second
+            dau = str(n + 1)
+            branches["ptdau" + dau], branches["pxdau" + dau], branches["pydau" + dau], branches["pzdau" + dau], branches["Edau" + dau] = pdau.Pt(), pdau.Px(), pdau.Py(), pdau.Pz(), pdau.E()
+            branches["flavdau" + dau] = daughter.first
+        if args.vbf or args.zh or args.wh or args.zh_lep_hawk:
+          pj1 = event.associated[0].second
+          pj2 = event.associated[1].second
+          branches["pxj1"], branches["pyj1"], branches["pzj1"], branches["Ej1"] = pj1.Px(), pj1.Py(), pj1.Pz(), pj1.E()
+          branches["pxj2"], branches["pyj2"], branches["pzj2"], branches["Ej2"] = pj2.Px(), pj2.Py(), pj2.Pz(), pj2.E()
+          branches["rapHJJ"] = (pH + pj1 + pj2).Rapidity()
+        if args.zh or args.wh or args.zh_lep_hawk:
+          branches["ptV"] = np.sqrt((pj1.Px()+pj2.Px())**2+(pj1.Py()+pj2.Py())**2)
+        return branches
+
+      modes = ("vbf", "vbf_withdecay", "zh", "wh", "zh_withdecay", "wh_withdecay", "zh_lep", "wh_lep", "zh_lep_hawk", "ggH4l")
+      directory = tempfile.mkdtemp()
+      try:
+        for mode, topology, lhefileclass in (
+          ("ggH4l", "Prophecy", LHEFile_HwithdecayOnly),
+          ("vbf", "VBF", LHEFile_StableHiggs),
+          ("zh", "VH", LHEFile_StableHiggsVH),
+          ("zh_lep_hawk", "HAWK", LHEFile_StableHiggsZHHAWK),
+        ):
+          args = argparse.Namespace(**{name: name == mode for name in modes})
+          lhefile = generate_lhe_file(os.path.join(directory, topology + ".lhe"), topology, 200)
+          daughters, associated, expected = [], [], []
+          with lhefileclass(lhefile, reusemela=True) as f:
+            for event in f:
+              daughters.append(event.lhedaughters)
+              associated.append(event.lheassociated)
+              expected.append(oldkinematics(args, event))
+          columns = lhe2root.kinematic_branches(args, daughters, associated)
+          self.assertEqual(set(columns), set(expected[0]), mode)
+          for name, column in columns.items():
+            np.testing.assert_allclose(column, [branches[name] for branches in expected], rtol=1e-9, atol=1e-9, err_msg=mode + " " + name)
+      finally:
+        shutil.rmtree(directory)
+
+    def testHypothesisTable(self):
+      "HypothesisEngine fills the same probabilities and discriminants as the explicit MELA blocks lhe2root had before mela_hypotheses"
+      import shutil, tempfile
+      from mela_hypotheses import HypothesisEngine, DECAY_HYPOTHESES, PRODUCTION_HYPOTHESES
+      from benchmarks.synthetic_lhe import generate_lhe_file
+      def probability(event, compute, hypothesis, process, **couplings):
+        event.setProcess(hypothesis, TVar.JHUGen, process)
+        for coupling, value in couplings.items():
+          setattr(event, coupling, value)
+        return getattr(event, compute)()
+
+      def olddecay(event, process):
+        b = {}
+        b["pg2"] = probability(event, "computeP", TVar.SelfDefine_spin0, process, ghz2=1)
+        b["pg1"] = probability(event, "computeP", TVar.HSMHiggs, process, ghz1=2)
+        b["pg4"] = probability(event, "computeP", TVar.SelfDefine_spin0, process, ghz4=1)
+        b["pg1g4"] = probability(event, "computeP", TVar.SelfDefine_spin0, process, ghz1=1, ghz4=1) - b["pg1"] - b["pg4"]
+        b["pg1g2"] = probability(event, "computeP", TVar.SelfDefine_spin0, process, ghz1=1, ghz2=1) - b["pg1"] - b["pg2"]
+        c_0hplus = 1
+        c_0minus = 1
+        if process == TVar.ZZINDEPENDENT:
+          c_0minus = 2.55497301342
+          c_0hplus = 1.66326995046
+        b["D0minus"] = b["pg1"] / (b["pg1"] + c_0minus*c_0minus*b["pg4"])
+        b["D0hplus"] = b["pg1"] / (b["pg1"] + c_0hplus*c_0hplus*b["pg2"])
+        b["DCP"] = b["pg1g4"] / (2 * (b["pg1"] * b["pg4"]) ** 0.5)
+        b["Dint"] = b["pg1g2"] / (2 * (b["pg1"] * b["pg2"]) ** 0.5)
+        return b
+
+      def oldproduction(event, process):
+        b = {}
+        b["pg2"] = probability(event, "computeProdP", TVar.SelfDefine_spin0, process, ghz1=0, ghz2=1)
+        b["pg1"] = probability(event, "computeProdP", TVar.HSMHiggs, process, ghz1=1)
+        b["pg4"] = probability(event, "computeProdP", TVar.SelfDefine_spin0, process, ghz4=1)
+        b["pg1g4"] = probability(event, "computeProdP", TVar.SelfDefine_spin0, process, ghz1=1, ghz4=1) - b["pg1"] - b["pg4"]
+        b["pg1g2"] = probability(event, "computeProdP", TVar.SelfDefine_spin0, process, ghz1=1, ghz2=1) - b["pg1"] - b["pg2"]
+        b["pg2za"] = probability(event, "computeProdP", TVar.SelfDefine_spin0, process, ghz1=0, ghzgs2=1)
+        b["pg4za"] = probability(event, "computeProdP", TVar.SelfDefine_spin0, process, ghz1=0, ghzgs4=1)
+        b["pg1g2za"] = probability(event, "computeProdP", TVar.SelfDefine_spin0, process, ghz1=1, ghzgs2=1) - b["pg1"] - b["pg2za"]
+        b["pg1g4za"] = probability(event, "computeProdP", TVar.SelfDefine_spin0, process, ghz1=1, ghzgs4=1) - b["pg1"] - b["pg4za"]
+        b["pg2aa"] = probability(event, "computeProdP", TVar.SelfDefine_spin0, process, ghz1=0, ghgsgs2=1)
+        b["pg4aa"] = probability(event, "computeProdP", TVar.SelfDefine_spin0, process, ghz1=0, ghgsgs4=1)
+        b["pg1g2aa"] = probability(event, "computeProdP", TVar.SelfDefine_spin0, process, ghz1=1, ghgsgs2=1) - b["pg1"] - b["pg2aa"]
+        b["pg1g4aa"] = probability(event, "computeProdP", TVar.SelfDefine_spin0, process, ghz1=1, ghgsgs4=1) - b["pg1"] - b["pg4aa"]
+        c_0hplus = 1
+        c_0minus = 1
+        if process == TVar.Had_ZH:
+          c_0hplus = 0.130395173298
+          c_0minus = 0.104503154335
+        if process == TVar.JJVBF:
+          c_0minus = 0.297979440554
+          c_0hplus = 0.271880048944
+        if process == TVar.ZZGG:
+          c_0minus = 2.55497301342
+          c_0hplus = 1.66326995046
+        b["D0minus"] = b["pg1"] / (b["pg1"] + c_0minus*c_0minus*b["pg4"])
+        b["D0hplus"] = b["pg1"] / (b["pg1"] + c_0hplus*c_0hplus*b["pg2"])
+        b["DCP"] = b["pg1g4"] / (2 * (b["pg1"] * b["pg4"]) ** 0.5)
+        b["Dint"] = b["pg1g2"] / (2 * (b["pg1"] * b["pg2"]) ** 0.5)
+        return b
+
+      directory = tempfile.mkdtemp()
+      try:
+        for topology, lhefileclass, table, old, process in (
+          ("Hwithdecay", LHEFile_Hwithdecay, DECAY_HYPOTHESES, olddecay, TVar.ZZINDEPENDENT),
+          ("VBF", LHEFile_StableHiggs, PRODUCTION_HYPOTHESES, oldproduction, TVar.JJVBF),
+          ("VH", LHEFile_StableHiggsVH, PRODUCTION_HYPOTHESES, oldproduction, TVar.Had_ZH),
+        ):
+          engine = HypothesisEngine(table, TVar)
+          lhefile = generate_lhe_file(os.path.join(directory, topology + ".lhe"), topology, 20)
+          with lhefileclass(lhefile, reusemela=True) as f:
+            for event in f:
+              expected = old(event, process)
+              branches = {name: np.zeros(1) for name in engine.branchnames}
+              engine.fill(event, process, branches)
+              self.assertEqual(set(branches), set(expected), topology)
+              for name in expected:
+                np.testing.assert_array_equal(branches[name][0], expected[name], err_msg=topology + " " + name)
+      finally:
+        shutil.rmtree(directory)
+
+    def testPhotonMerging(self):
+      "the FSR photons of synthetic Prophecy and HAWK events are merged the same way as the per-pair TLorentzVector Delta R loop lhe2root had before merge_fsr_photons"
+      import functools, shutil, tempfile
+      from benchmarks.synthetic_lhe import generate_lhe_file
+      def oldmerge(photons, leptons):
+        leptons = [ROOT.TLorentzVector(lepton.px, lepton.py, lepton.pz, lepton.e) for lepton in leptons]
+        for photon in photons:
+          k = ROOT.TLorentzVector(photon.px, photon.py, photon.pz, photon.e)
+          mindr = 9999
+          i_newlep = 0
+          for ilep, lep in enumerate(leptons):
+            dr = k.DeltaR(lep)
+            if dr < mindr:
+              mindr = dr
+              i_newlep = ilep
+          leptons[i_newlep] = leptons[i_newlep] + k
+        return leptons
+
+      directory = tempfile.mkdtemp()
+      try:
+        for topology, lhefileclass, merger, collection in (
+          ("Prophecy", LHEFile_HwithdecayOnly, merge_photons_into_daughters, "lhedaughters"),
+          ("HAWK", LHEFile_StableHiggsZHHAWK, merge_photons_into_associated, "lheassociated"),
+        ):
+          lhefile = generate_lhe_file(os.path.join(directory, topology + ".lhe"), topology, 300)
+          with lhefileclass(lhefile) as f:
+            expected = []
+            for event in f:
+              photons = [particle for particle in event.lheassociated if particle.id == 22]
+              self.assertTrue(photons)
+              leptons = [particle for particle in getattr(event, collection) if particle.id != 22]
+              expected.append(oldmerge(photons, leptons))
+          with lhefileclass(lhefile, photonmerger=functools.partial(merger, cone=None), reusemela=True) as f:
+            nevents = 0
+            for event, leptons in zip(f, expected):
+              merged = getattr(event, collection)
+              melaparticles = event.daughters if collection == "lhedaughters" else event.associated
+              self.assertEqual(len(merged), len(leptons))
+              for particle, melaparticle, lepton in zip(merged, melaparticles, leptons):
+                expectedp4 = [lepton.Px(), lepton.Py(), lepton.Pz(), lepton.E()]
+                np.testing.assert_allclose([particle.px, particle.py, particle.pz, particle.e], expectedp4, rtol=1e-9, atol=1e-9)
+                second = melaparticle.second #what MELA sees, read from the updated LHE line
+                np.testing.assert_allclose([second.Px(), second.Py(), second.Pz(), second.E()], expectedp4, rtol=1e-9, atol=1e-9)
+              nevents += 1
+            self.assertEqual(nevents, len(expected))
+      finally:
+        shutil.rmtree(directory)
+
+    def testResumeCompressed(self):
+      "a conversion of a gzipped file that crashes after a checkpoint continues from it with --resume and gives the same tree"
+      import gzip, shutil, tempfile
+      from unittest import mock
+      import uproot
+      import lhe2root
+      import useful_funcs_and_constants
+      from benchmarks.synthetic_lhe import generate_lhe_file
+      directory = tempfile.mkdtemp()
+      try:
+        lhefile = generate_lhe_file(os.path.join(directory, "events.lhe"), "Prophecy", 300)
+        with open(lhefile, "rb") as f, gzip.open(lhefile + ".gz", "wb") as g:
+          shutil.copyfileobj(f, g)
+        expected = os.path.join(directory, "expected.root")
+        resumed = os.path.join(directory, "resumed.root")
+        self.runlhe2root([expected, lhefile + ".gz", "--ggH4l"])
+
+        arguments = [resumed, lhefile + ".gz", "--ggH4l", "--batchsize", "50", "--checkpoint-every", "100"]
+        snapshot = lhe2root.BranchBuffer.snapshot
+        calls = itertools.count(1)
+        def crashafter150(branchbuffer, *particles):
+          if next(calls) > 150:
+            raise RuntimeError("simulated crash")
+          return snapshot(branchbuffer, *particles)
+        with mock.patch.object(lhe2root.BranchBuffer, "snapshot", crashafter150):
+          self.assertRaises(RuntimeError, self.runlhe2root, arguments)
+        self.assertTrue(os.path.exists(useful_funcs_and_constants.checkpoint_filename(resumed)))
+
+        self.runlhe2root(arguments + ["--resume"])
+        self.assertFalse(os.path.exists(useful_funcs_and_constants.checkpoint_filename(resumed)))
+        expectedtree = uproot.open(expected)["tree"].arrays(library="np")
+        resumedtree = uproot.open(resumed)["tree"].arrays(library="np")
+        self.assertEqual(len(resumedtree["M4L"]), 300)
+        for name in expectedtree:
+          np.testing.assert_array_equal(resumedtree[name], expectedtree[name], err_msg=name)
+      finally:
+        shutil.rmtree(directory)
+
   unittest.main(argv=[sys.argv[0]]+args.unittest_args)
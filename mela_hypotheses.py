@@ -0,0 +1,151 @@
+import collections
+from stage_profiler import NULL_PROFILER
+
+Hypothesis = collections.namedtuple("Hypothesis", "name hypothesis couplings")
+Hypothesis.__doc__ = """A pure MELA probability: the branch it fills, the name of the TVar hypothesis passed to setProcess,
+and the couplings set on the event before computing it as (coupling name, value) pairs"""
+
+Interference = collections.namedtuple("Interference", "name hypothesis couplings pure1 pure2")
+Interference.__doc__ = """An interference term: the probability of the mixed hypothesis minus the two pure probabilities pure1 and pure2"""
+
+Fraction = collections.namedtuple("Fraction", "name signal alternative constant")
+Fraction.__doc__ = """A discriminant signal / (signal + c^2 alternative), where c is the named constant for the current process"""
+
+InterferenceFraction = collections.namedtuple("InterferenceFraction", "name interference pure1 pure2")
+InterferenceFraction.__doc__ = """A discriminant interference / (2 sqrt(pure1 pure2))"""
+
+HypothesisTable = collections.namedtuple("HypothesisTable", "compute pure interference discriminants constants")
+HypothesisTable.__doc__ = """Everything needed to fill a set of probability branches: the name of the Mela method used to compute probabilities,
+the pure hypotheses, the interference terms, the discriminants, and the discriminant constants keyed by the name of the TVar process.
+Processes that are not in constants use 1 for every constant"""
+
+
+DECAY_HYPOTHESES = HypothesisTable(
+    compute="computeP",
+    pure=(
+        Hypothesis("pg2", "SelfDefine_spin0", (("ghz2", 1),)),
+        Hypothesis("pg1", "HSMHiggs", (("ghz1", 2),)),
+        Hypothesis("pg4", "SelfDefine_spin0", (("ghz4", 1),)),
+    ),
+    interference=(
+        Interference("pg1g4", "SelfDefine_spin0", (("ghz1", 1), ("ghz4", 1)), "pg1", "pg4"),
+        Interference("pg1g2", "SelfDefine_spin0", (("ghz1", 1), ("ghz2", 1)), "pg1", "pg2"),
+    ),
+    discriminants=(
+        Fraction("D0minus", "pg1", "pg4", "c_0minus"),
+        Fraction("D0hplus", "pg1", "pg2", "c_0hplus"),
+        InterferenceFraction("DCP", "pg1g4", "pg1", "pg4"),
+        InterferenceFraction("Dint", "pg1g2", "pg1", "pg2"),
+    ),
+    constants={
+        "ZZINDEPENDENT":{"c_0minus":2.55497301342, "c_0hplus":1.66326995046},
+    },
+)
+
+PRODUCTION_HYPOTHESES = HypothesisTable(
+    compute="computeProdP",
+    pure=(
+        Hypothesis("pg2", "SelfDefine_spin0", (("ghz1", 0), ("ghz2", 1))),
+        Hypothesis("pg1", "HSMHiggs", (("ghz1", 1),)),
+        Hypothesis("pg4", "SelfDefine_spin0", (("ghz4", 1),)),
+        Hypothesis("pg2za", "SelfDefine_spin0", (("ghz1", 0), ("ghzgs2", 1))),
+        Hypothesis("pg4za", "SelfDefine_spin0", (("ghz1", 0), ("ghzgs4", 1))),
+        Hypothesis("pg2aa", "SelfDefine_spin0", (("ghz1", 0), ("ghgsgs2", 1))),
+        Hypothesis("pg4aa", "SelfDefine_spin0", (("ghz1", 0), ("ghgsgs4", 1))),
+    ),
+    interference=(
+        Interference("pg1g4", "SelfDefine_spin0", (("ghz1", 1), ("ghz4", 1)), "pg1", "pg4"),
+        Interference("pg1g2", "SelfDefine_spin0", (("ghz1", 1), ("ghz2", 1)), "pg1", "pg2"),
+        Interference("pg1g2za", "SelfDefine_spin0", (("ghz1", 1), ("ghzgs2", 1)), "pg1", "pg2za"),
+        Interference("pg1g4za", "SelfDefine_spin0", (("ghz1", 1), ("ghzgs4", 1)), "pg1", "pg4za"),
+        Interference("pg1g2aa", "SelfDefine_spin0", (("ghz1", 1), ("ghgsgs2", 1)), "pg1", "pg2aa"),
+        Interference("pg1g4aa", "SelfDefine_spin0", (("ghz1", 1), ("ghgsgs4", 1)), "pg1", "pg4aa"),
+    ),
+    discriminants=(
+        Fraction("D0minus", "pg1", "pg4", "c_0minus"),
+        Fraction("D0hplus", "pg1", "pg2", "c_0hplus"),
+        InterferenceFraction("DCP", "pg1g4", "pg1", "pg4"),
+        InterferenceFraction("Dint", "pg1g2", "pg1", "pg2"),
+        #the Z gamma discriminants (D0minus_za etc.) are booked but not filled
+    ),
+    constants={
+        "Had_ZH":{"c_0minus":0.104503154335, "c_0hplus":0.130395173298},
+        "JJVBF":{"c_0minus":0.297979440554, "c_0hplus":0.271880048944},
+        "ZZGG":{"c_0minus":2.55497301342, "c_0hplus":1.66326995046},
+    },
+)
+
+
+class HypothesisEngine(object):
+    def __init__(self, table, TVar, profiler=NULL_PROFILER):
+        """Evaluates a HypothesisTable on MELA events.
+        Every distinct (hypothesis, couplings) configuration is computed once per event,
+        and the pure probabilities are computed before the interference terms that reuse them
+
+        Parameters
+        ----------
+        table : HypothesisTable
+            The hypotheses to compute and the branches to fill
+        TVar : module or class
+            The TVar namespace from mela, used to look up the hypotheses and processes by name
+        profiler : stage_profiler.StageProfiler, optional
+            Times fill as the stage named after the compute method, and each MELA call as "<compute method>/<branch name>", by default NULL_PROFILER
+        """
+        self.table = table
+        self.profiler = profiler
+        self.JHUGen = TVar.JHUGen
+        self.hypotheses = {name: getattr(TVar, name) for name in {row.hypothesis for row in table.pure + table.interference}}
+        self.constants = {getattr(TVar, process): constants for process, constants in table.constants.items() if hasattr(TVar, process)}
+
+        configurations = [(row.hypothesis, tuple(sorted(row.couplings))) for row in table.pure + table.interference]
+        self.ncalls = len(set(configurations)) #the number of MELA calls needed per event
+
+    @property
+    def branchnames(self):
+        """The names of every branch that fill writes to"""
+        return {row.name for row in self.table.pure + self.table.interference + self.table.discriminants}
+
+    def fill(self, event, process, branches):
+        """Computes every probability and discriminant in the table for one event and writes them to the branches
+
+        Parameters
+        ----------
+        event : mela.Mela
+            The event with its input event already set
+        process : TVar
+            The production process passed to setProcess
+        branches : dict
+            The branch buffers keyed by name, each of which is written at index 0
+        """
+        with self.profiler.stage(self.table.compute):
+            self._fill(event, process, branches)
+
+    def _fill(self, event, process, branches):
+        computed = {}
+        compute = getattr(event, self.table.compute)
+
+        def probability(name, hypothesis, couplings):
+            key = (hypothesis, tuple(sorted(couplings)))
+            if key not in computed:
+                with self.profiler.stage(self.table.compute + "/" + name):
+                    event.setProcess(self.hypotheses[hypothesis], self.JHUGen, process) #this resets every coupling
+                    for coupling, value in couplings:
+                        setattr(event, coupling, value)
+                    computed[key] = compute()
+            return computed[key]
+
+        for name, hypothesis, couplings in self.table.pure:
+            branches[name][0] = probability(name, hypothesis, couplings)
+
+        for name, hypothesis, couplings, pure1, pure2 in self.table.interference:
+            branches[name][0] = probability(name, hypothesis, couplings) - branches[pure1][0] - branches[pure2][0]
+
+        constants = self.constants.get(process, {})
+        for discriminant in self.table.discriminants:
+            if isinstance(discriminant, Fraction):
+                name, signal, alternative, constant = discriminant
+                c = constants.get(constant, 1)
+                branches[name][0] = branches[signal][0] / (branches[signal][0] + c*c*branches[alternative][0])
+            else:
+                name, interference, pure1, pure2 = discriminant
+                branches[name][0] = branches[interference][0] / (2 * (branches[pure1][0] * branches[pure2][0]) ** 0.5)
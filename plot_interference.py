@@ -1,5 +1,6 @@
 import argparse
 import lhe2root_methods
+import cut_engine
 import mplhep as hep
 import matplotlib.pyplot as plt
 import useful_funcs_and_constants
@@ -51,8 +52,21 @@ if __name__ == "__main__":
     parser.add_argument('-t', '--titles', default=[""], nargs="+",
                         help="Optional Figure Title")
 
+    parser.add_argument('-c', '--cut', nargs=3, action='append', default=[],
+                        help="The cuts applied to every sample. In form <name> <lower bound> <upper bound>. Replace a bound with a '.' if you do not want to place a bound there")
+
+    parser.add_argument('-e', '--expression', action='append', default=[],
+                        help="""A boolean cut expression over the branches applied to every sample, i.e. "abs(Phi) < 1.5". Can be given more than once""")
+
+    parser.add_argument('--no-cache', action="store_true",
+                        help="Reread the files instead of using histograms cached by previous runs")
+
     args = parser.parse_args()
     
+    if args.no_cache:
+        lhe2root_methods.HISTOGRAMS.disk = None
+    
+    cuts = cut_engine.CutSet(lhe2root_methods.cut_ranges_to_dict(args.cut), args.expression)
     interf_plots = {}
     
     CrossSections = {}
@@ -65,9 +79,11 @@ if __name__ == "__main__":
                 continue #skips any possible headers in the .csv file
     
     print(CrossSections)
+    #reads every distinct file once; plot_interference then gets its histograms from lhe2root_methods.HISTOGRAMS
+    lhe2root_methods.interference_histograms(args.filenames, [args.value], CrossSections, nbins=args.nbins, cuts=cuts)
     for (interefence_triplet, title) in zip(args.filenames, args.titles):
         interf_plots[title] = lhe2root_methods.plot_interference(*interefence_triplet, *args.labels, args.value, CrossSections,
-                                                                nbins=args.nbins, title=title)
+                                                                nbins=args.nbins, title=title, cuts=cuts)
     
     for sample in interf_plots:
         scaled = lhe2root_methods.scale(interf_plots[sample][0], 1) if args.norm else interf_plots[sample][0]
@@ -1,5 +1,6 @@
 import argparse
 import lhe2root_methods
+import cut_engine
 
 def ran(s):
     """A function to define the range format for this program
@@ -47,11 +48,21 @@ if __name__ == "__main__":
                         default=[['M4L', '.', '.']],
                         help="The cuts for your quantity. In form <name> <lower bound> <upper bound>. Replace a bound with a '.' if you do not want to place a bound there")
     
+    parser.add_argument('-e', '--expression', action='append', default=[],
+                        help="""A boolean cut expression over the branches, i.e. "abs(Phi) < 1.5 and not (0.9 < costheta1 < 1)". Can be given more than once""")
+    
     parser.add_argument('-p', '--perFile', action="store_true",
                         help="Activate if you want a plot for each file")
+    
+    parser.add_argument('--no-cache', action="store_true",
+                        help="Reread the files instead of using histograms cached by previous runs")
+    
     args = parser.parse_args()
     
-    cuts = lhe2root_methods.cut_ranges_to_dict(args.cut)
+    if args.no_cache:
+        lhe2root_methods.HISTOGRAMS.disk = None
+    
+    cuts = cut_engine.CutSet(lhe2root_methods.cut_ranges_to_dict(args.cut), args.expression)
     
     lhe2root_methods.plot_one_quantity(args.filenames, args.value, args.range, args.nbins, 
                                        args.labels, args.norm, args.title, cuts=cuts, perFile=args.perFile)
\ No newline at end of file
@@ -1,27 +1,33 @@
 import argparse
-import lhe_reader
+import lhe_slicer
+import lhe_compression
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
 
     parser.add_argument('filenames', type=str, nargs= "+",
-                        help="The files you are slicing")
+                        help="The files you are slicing (.lhe, .lhe.gz, .lhe.xz or .lhe.zst)")
 
     parser.add_argument('-n', '--num', type=int, required=True,
                         help="The number of events you would like")
 
+    parser.add_argument('-s', '--shuffled', action="store_true",
+                        help="Keep a random sample of events instead of the first ones")
+
+    parser.add_argument('--seed', type=int, default=None,
+                        help="The seed for the random sample")
+
     args = parser.parse_args()
     for file in args.filenames:
-        reader = lhe_reader.lhe_reader(file)
-        to_write = reader.cut_down_to_size(args.num)
+        if not lhe_compression.is_lhe_filename(file):
+            raise FileNotFoundError("LHE File Extension Required for file " + file + "!")
         
-        filename = file.split('/')[-1]
+        filename = lhe_compression.strip_compression(file).split('/')[-1] #the sliced file is written uncompressed
         filepath = "/".join(file.split('/')[:-1])
         # print(filepath, filename)
         
         outfile = filepath + '/' + str(args.num) + "_SLICED" + filename
-        with open(outfile, 'w+') as f:
-            f.write(to_write)
+        lhe_slicer.slice_lhe_file(file, outfile, args.num, args.shuffled, args.seed)
             
         print("Dumped to", outfile)
\ No newline at end of file
@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import time
+import collections
+
+
+class _Stage(object):
+    """Times one stage every time it is entered. Stages are reused, so timing a stage costs two clock reads and no allocations"""
+    __slots__ = ("totals", "start")
+
+    def __init__(self, totals):
+        self.totals = totals #[seconds, calls]
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.totals[0] += time.perf_counter() - self.start
+        self.totals[1] += 1
+        return False
+
+
+class _NullStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class StageProfiler(object):
+    enabled = True
+
+    def __init__(self, processes=1):
+        """Records the cumulative time and number of calls of each stage of a conversion.
+        Example usage:
+        profiler = StageProfiler()
+        with profiler.stage("computeP"):
+            event.computeP()
+        profiler.write("profile.json")
+
+        Stages named "stage/substage" are parts of "stage" (i.e. the MELA hypotheses of computeP)
+        and are not counted again in the time that is not in any stage
+
+        Parameters
+        ----------
+        processes : int, optional
+            The number of processes whose stages are added up in this profiler, by default 1
+        """
+        self.processes = processes
+        self.totals = collections.OrderedDict() #name -> [seconds, calls]
+        self.stages = {}
+        self.start = time.perf_counter()
+        self.wall = None
+
+    def stage(self, name):
+        """The context manager that times a stage
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage
+
+        Returns
+        -------
+        _Stage
+            The timer, which adds the time spent inside each with block to the stage
+        """
+        try:
+            return self.stages[name]
+        except KeyError:
+            self.stages[name] = _Stage(self.totals.setdefault(name, [0., 0]))
+            return self.stages[name]
+
+    def add(self, name, seconds, calls=1):
+        """Adds time to a stage that was measured elsewhere"""
+        totals = self.totals.setdefault(name, [0., 0])
+        totals[0] += seconds
+        totals[1] += calls
+
+    def iterate(self, name, iterable):
+        """Times every step of an iterator (i.e. reading the next event from a file) as a stage"""
+        stage = self.stage(name)
+        iterator = iter(iterable)
+        while True:
+            with stage:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def stop(self):
+        """Stops the wall clock of the profile"""
+        if self.wall is None:
+            self.wall = time.perf_counter() - self.start
+
+    def merge(self, profile):
+        """Adds the stages of another profile (i.e. from a worker process) to this one
+
+        Parameters
+        ----------
+        profile : dict
+            The profile as returned by as_dict
+        """
+        for name, stage in profile["stages"].items():
+            self.add(name, stage["seconds"], stage["calls"])
+
+    def as_dict(self):
+        """The profile as a JSON-serializable dict of the wall time, the number of processes and the seconds and calls of every stage"""
+        wall = self.wall if self.wall is not None else time.perf_counter() - self.start
+        return {
+            "wall_seconds": wall,
+            "processes": self.processes,
+            "stages": collections.OrderedDict((name, {"seconds": seconds, "calls": calls}) for name, (seconds, calls) in self.totals.items()),
+        }
+
+    def summary(self):
+        """A table of every stage, with the time that is not in any stage as "other"
+
+        Returns
+        -------
+        str
+            The table, with one line per stage
+        """
+        profile = self.as_dict()
+        total = profile["wall_seconds"] * profile["processes"]
+        rows = [(name, stage["calls"], stage["seconds"]) for name, stage in profile["stages"].items()]
+        timed = sum(seconds for name, _, seconds in rows if "/" not in name)
+        rows.append(("other", None, max(total - timed, 0.)))
+
+        width = max([len("stage")] + [len(name) for name, _, _ in rows])
+        lines = ["{:<{}}  {:>10}  {:>12}  {:>12}  {:>6}".format("stage", width, "calls", "total [s]", "mean [us]", "%")]
+        for name, calls, seconds in rows:
+            lines.append("{:<{}}  {:>10}  {:>12.3f}  {:>12}  {:>6.1f}".format(
+                name, width,
+                "" if calls is None else calls,
+                seconds,
+                "" if not calls else "{:.1f}".format(1e6 * seconds / calls),
+                100 * seconds / total if total else 0.,
+            ))
+        lines.append("wall time {:.3f} s{}".format(profile["wall_seconds"], " over {} processes".format(profile["processes"]) if profile["processes"] > 1 else ""))
+        return "\n".join(lines)
+
+    def write(self, filename):
+        """Writes the profile to a JSON file
+
+        Parameters
+        ----------
+        filename : str
+            The file to write
+        """
+        with open(filename + ".tmp", "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+        os.replace(filename + ".tmp", filename)
+
+    def report(self, filename, stream=None):
+        """Stops the profile, prints the summary table and writes the profile to a JSON file
+
+        Parameters
+        ----------
+        filename : str
+            The JSON file to write
+        stream : io.TextIOBase, optional
+            Where the table is printed, by default sys.stderr (lhe2root sends stdout to /dev/null unless it is verbose)
+        """
+        self.stop()
+        print(self.summary(), file=stream if stream is not None else sys.stderr)
+        self.write(filename)
+
+
+class NullProfiler(StageProfiler):
+    enabled = False
+
+    def __init__(self):
+        """A profiler that records nothing, used when profiling is turned off"""
+        super(NullProfiler, self).__init__()
+        self.nullstage = _NullStage()
+
+    def stage(self, name):
+        return self.nullstage
+
+    def add(self, name, seconds, calls=1):
+        pass
+
+    def iterate(self, name, iterable):
+        return iterable
+
+
+NULL_PROFILER = NullProfiler()
@@ -129,4 +129,18 @@ def check_for_MELA(env):
             print("Run './install.sh' in the directory above HexUtils to set these up!")
         else:
             print("Run './setup.sh' in the MELA directory to set these up!")
-        return False
\ No newline at end of file
+        return False
+def checkpoint_filename(outputfile):
+    """The name of the checkpoint file that lhe2root keeps next to an output ROOT file while converting
+
+    Parameters
+    ----------
+    outputfile : str
+        The output ROOT file
+
+    Returns
+    -------
+    str
+        The name of the checkpoint file
+    """
+    return outputfile + '.checkpoint.json'